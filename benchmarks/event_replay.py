@@ -0,0 +1,386 @@
+"""Event replay: on_message and slash command throughput.
+
+Replays synthetic messages and /rank, /daily, /gamble and /leaderboard interactions
+across many simulated guilds and users through the bot's real handlers, with the XP
+and automod flush loops running as they do in production. Reports events per second,
+p50/p99 handler latency per event type, DB statements and commits per message and
+event-loop lag. Nothing talks to Discord; storage is a fresh throwaway database (or
+the in-memory engine).
+
+    python benchmarks/event_replay.py --guilds 50 --users 200 --events 20000
+    python benchmarks/event_replay.py --rate 2000 --json base.json
+    python benchmarks/event_replay.py --storage memory --compare base.json
+    python benchmarks/event_replay.py --mix message=90,rank=4,daily=2,gamble=2,leaderboard=2
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import types
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+DEFAULT_MIX = 'message=95,rank=2,daily=1,gamble=1,leaderboard=1'
+LAG_INTERVAL = 0.01  # seconds between event-loop lag probes
+
+WORDS = ('hello', 'anyone', 'playing', 'tonight', 'the', 'new', 'update', 'looks', 'great', 'lol',
+         'what', 'time', 'is', 'raid', 'gg', 'nice', 'build', 'server', 'music', 'later', 'thanks')
+LINKS = ('https://youtube.com/watch?v=dQw4w9WgXcQ', 'https://github.com/Rapptz/discord.py',
+         'https://en.wikipedia.org/wiki/Discord')
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        kind, _, weight = part.partition('=')
+        mix[kind.strip()] = float(weight)
+    unknown = set(mix) - {'message', 'rank', 'daily', 'gamble', 'leaderboard'}
+    if unknown:
+        raise SystemExit(f"unknown event types in --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+# Just enough of discord.py's models for the handlers under test
+async def _noop(*args, **kwargs):
+    return None
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.name = f'Guild {guild_id}'
+        self.members = {}
+        self.member_count = 0
+
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+class FakeChannel:
+    def __init__(self, channel_id, guild):
+        self.id = channel_id
+        self.guild = guild
+        self.mention = f'<#{channel_id}>'
+        self.send = _noop
+        self.delete_messages = _noop
+
+class FakeMember:
+    def __init__(self, user_id, guild):
+        self.id = user_id
+        self.guild = guild
+        self.bot = False
+        self.mention = f'<@{user_id}>'
+        self.name = self.display_name = f'user{user_id}'
+        self.display_avatar = types.SimpleNamespace(url='https://cdn.discordapp.com/embed/avatars/0.png')
+        self.created_at = self.joined_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        self.timeout = _noop
+        self.send = _noop
+
+    @property
+    def color(self):
+        import discord
+        return discord.Color.default()
+
+class FakeMessage:
+    _next_id = 0
+
+    def __init__(self, content, author, channel, state):
+        FakeMessage._next_id += 1
+        self.id = FakeMessage._next_id
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.attachments = []
+        self.mentions = []
+        self.created_at = datetime.now(timezone.utc)
+        self.delete = _noop
+        # process_commands builds a real Context from the message
+        self._state = state
+
+class FakeResponse:
+    def __init__(self):
+        self._done = False
+
+    async def send_message(self, *args, **kwargs):
+        self._done = True
+
+    async def defer(self, *args, **kwargs):
+        self._done = True
+
+    def is_done(self):
+        return self._done
+
+class FakeInteraction:
+    def __init__(self, user, channel):
+        self.user = user
+        self.guild = channel.guild
+        self.channel = channel
+        self.response = FakeResponse()
+        self.followup = types.SimpleNamespace(send=_noop)
+        self.edit_original_response = _noop
+
+class StatementCounter:
+    """Counts SQL statements (and COMMITs) run on any connection the Database opens"""
+
+    def __init__(self):
+        self.statements = 0
+        self.commits = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, sql):
+        with self._lock:
+            self.statements += 1
+            if sql.lstrip().upper().startswith('COMMIT'):
+                self.commits += 1
+
+    def install(self, database_cls):
+        connect = database_cls._connect
+
+        def traced(db, readonly=False):
+            conn = connect(db, readonly)
+            conn.set_trace_callback(self)
+            return conn
+        database_cls._connect = traced
+
+    def reset(self):
+        with self._lock:
+            self.statements = self.commits = 0
+
+class Replay:
+    def __init__(self, main, args):
+        self.main = main
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.mix = parse_mix(args.mix)
+        self.latencies = {kind: [] for kind in self.mix}
+        self.lag = []
+        self.errors = 0
+        self.first_error = None
+
+        self.channels = []
+        for g in range(args.guilds):
+            guild = FakeGuild(1_000_000 + g)
+            for u in range(args.users):
+                member = FakeMember(10_000_000 + g * args.users + u, guild)
+                guild.members[member.id] = member
+            guild.member_count = len(guild.members)
+            self.channels += [FakeChannel(guild.id * 10 + c, guild) for c in range(args.channels)]
+
+    def content(self):
+        roll = self.rng.random()
+        words = ' '.join(self.rng.choice(WORDS) for _ in range(self.rng.randint(2, 14)))
+        if roll < self.args.bad_word_rate:
+            return f'{words} free nitro'
+        if roll < self.args.bad_word_rate + self.args.link_rate:
+            return f'{words} {self.rng.choice(LINKS)}'
+        return words
+
+    def event(self):
+        kind = self.rng.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        channel = self.rng.choice(self.channels)
+        member = self.rng.choice(list(channel.guild.members.values()))
+        main = self.main
+        if kind == 'message':
+            message = FakeMessage(self.content(), member, channel, main.bot._connection)
+            return kind, main.on_message(message)
+
+        interaction = FakeInteraction(member, channel)
+        if kind == 'rank':
+            return kind, main.rank.callback(interaction)
+        if kind == 'daily':
+            return kind, main.daily.callback(interaction)
+        if kind == 'gamble':
+            return kind, main.gamble.callback(interaction, self.rng.randint(10, 60))
+        return kind, main.leaderboard.callback(interaction, self.rng.randint(1, 3))
+
+    async def timed(self, kind, coro):
+        start = time.perf_counter()
+        try:
+            await coro
+        except Exception as e:
+            self.errors += 1
+            if self.first_error is None:
+                self.first_error = f'{kind}: {type(e).__name__}: {e}'
+        self.latencies[kind].append(time.perf_counter() - start)
+
+    async def probe_lag(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(LAG_INTERVAL)
+            self.lag.append(time.perf_counter() - start - LAG_INTERVAL)
+
+    async def replay(self, events, rate):
+        # Like the gateway: each event is its own task, started on schedule
+        slots = asyncio.Semaphore(self.args.concurrency)
+        tasks = []
+
+        async def run(kind, coro):
+            try:
+                await self.timed(kind, coro)
+            finally:
+                slots.release()
+
+        start = time.perf_counter()
+        for i in range(events):
+            if rate:
+                delay = start + i / rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await slots.acquire()
+            tasks.append(asyncio.create_task(run(*self.event())))
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - start
+
+async def run(args):
+    import main
+
+    counter = StatementCounter()
+    counter.install(main.Database)
+    await main.storage.init()
+    await main.load_guild_configs()
+    # Normally set at login; process_commands checks messages against it
+    main.bot._connection.user = types.SimpleNamespace(id=1)
+
+    replay = Replay(main, args)
+    if args.warmup:
+        await replay.replay(args.warmup, 0)
+        await main.xp_buffer.flush()
+        replay.latencies = {kind: [] for kind in replay.mix}
+        replay.errors = 0
+
+    main.flush_xp.start()
+    main.flush_enforcement.start()
+    main.flush_ledger.start()
+    counter.reset()
+    lag_probe = asyncio.create_task(replay.probe_lag())
+
+    duration = await replay.replay(args.events, args.rate)
+
+    lag_probe.cancel()
+    main.flush_xp.cancel()
+    main.flush_enforcement.cancel()
+    main.flush_ledger.cancel()
+    # Whatever is still buffered is part of the cost of the run
+    await main.xp_buffer.flush()
+    await main.economy.flush()
+    await main.enforcer.flush(notices=False)
+    await main.storage.close()
+
+    messages = len(replay.latencies.get('message', []))
+    per_message = lambda n: n / messages if messages and main.storage.name == 'sqlite' else None
+    return {
+        'storage': main.storage.name,
+        'config': {name: getattr(args, name) for name in
+                   ('guilds', 'users', 'channels', 'events', 'rate', 'concurrency', 'mix', 'seed')},
+        'events': args.events,
+        'errors': replay.errors,
+        'first_error': replay.first_error,
+        'duration_s': duration,
+        'events_per_s': args.events / duration,
+        'messages_per_s': messages / duration,
+        'latency_ms': {
+            kind: {
+                'count': len(values),
+                'p50': percentile(values, 50) * 1000 if values else None,
+                'p99': percentile(values, 99) * 1000 if values else None,
+            } for kind, values in replay.latencies.items()
+        },
+        'db': {
+            'statements': counter.statements,
+            'commits': counter.commits,
+            'statements_per_message': per_message(counter.statements),
+            'commits_per_message': per_message(counter.commits),
+        },
+        'loop_lag_ms': {
+            'p50': percentile(replay.lag, 50) * 1000 if replay.lag else None,
+            'p99': percentile(replay.lag, 99) * 1000 if replay.lag else None,
+            'max': max(replay.lag) * 1000 if replay.lag else None,
+        },
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    }
+
+def fmt(value, spec='.2f'):
+    return '—' if value is None else format(value, spec)
+
+def report(result):
+    print(f"{result['events']:,} events on {result['storage']} in {result['duration_s']:.2f}s "
+          f"({result['errors']} errors)")
+    if result['first_error']:
+        print(f"  first error  {result['first_error']}")
+    print(f"  throughput   {result['events_per_s']:,.0f} events/s, {result['messages_per_s']:,.0f} messages/s")
+    for kind, stats in result['latency_ms'].items():
+        print(f"  {kind:<12} n={stats['count']:<7,} p50 {fmt(stats['p50'], '.3f')} ms   "
+              f"p99 {fmt(stats['p99'], '.3f')} ms")
+    db = result['db']
+    print(f"  db           {db['statements']:,} statements, {db['commits']:,} commits   "
+          f"({fmt(db['statements_per_message'], '.3f')} / {fmt(db['commits_per_message'], '.4f')} per message)")
+    lag = result['loop_lag_ms']
+    print(f"  loop lag     p50 {fmt(lag['p50'], '.3f')} ms   p99 {fmt(lag['p99'], '.3f')} ms   "
+          f"max {fmt(lag['max'], '.3f')} ms")
+
+def compare(result, baseline):
+    """Print how the headline numbers moved against an earlier run"""
+    rows = [('messages/s', result['messages_per_s'], baseline['messages_per_s'], True)]
+    for kind, stats in result['latency_ms'].items():
+        before = baseline['latency_ms'].get(kind, {})
+        rows.append((f'{kind} p99 ms', stats['p99'], before.get('p99'), False))
+    rows += [
+        ('statements/message', result['db']['statements_per_message'], baseline['db']['statements_per_message'], False),
+        ('commits/message', result['db']['commits_per_message'], baseline['db']['commits_per_message'], False),
+        ('loop lag p99 ms', result['loop_lag_ms']['p99'], baseline['loop_lag_ms']['p99'], False),
+    ]
+    print(f"vs {baseline['storage']} baseline from {baseline['timestamp']}:")
+    for name, now, before, higher_is_better in rows:
+        if now is None or not before:
+            print(f"  {name:<20} {fmt(now):>10}   (no baseline)")
+            continue
+        change = (now - before) / before
+        better = change > 0 if higher_is_better else change < 0
+        print(f"  {name:<20} {fmt(now):>10}   was {fmt(before):>10}   {change:+.1%} "
+              f"{'better' if better else 'worse' if change else ''}")
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--guilds', type=int, default=20)
+    parser.add_argument('--users', type=int, default=100, help='members per guild')
+    parser.add_argument('--channels', type=int, default=3, help='text channels per guild')
+    parser.add_argument('--events', type=int, default=10000)
+    parser.add_argument('--warmup', type=int, default=1000, help='events replayed before measuring')
+    parser.add_argument('--rate', type=float, default=0, help='events per second (default: as fast as possible)')
+    parser.add_argument('--concurrency', type=int, default=256, help='most events in flight at once')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'relative event weights (default: {DEFAULT_MIX})')
+    parser.add_argument('--bad-word-rate', type=float, default=0.01, help='share of messages automod deletes')
+    parser.add_argument('--link-rate', type=float, default=0.03, help='share of messages with a link')
+    parser.add_argument('--storage', choices=('sqlite', 'memory'), default='sqlite')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--compare', help='results file from an earlier run to compare against')
+    args = parser.parse_args()
+
+    # Configure main before it is imported: storage engine and a throwaway database
+    workdir = tempfile.mkdtemp(prefix='aether-replay-')
+    os.environ['AETHER_STORAGE'] = args.storage
+    os.environ['AETHER_DB_PATH'] = os.path.join(workdir, 'aether.db')
+    os.environ['AETHER_BACKUP_DIR'] = workdir
+
+    result = asyncio.run(run(args))
+    report(result)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(result, json.load(f))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,143 @@
+"""Member cache memory: full mode vs lean mode.
+
+Builds guilds from synthetic GUILD_CREATE payloads through discord.py's own
+ConnectionState, configured with whatever main.build_client_options() picks for
+each mode, and reports the resident memory that costs per 10k members. Each mode
+runs in its own process so the numbers don't bleed into each other.
+
+    python benchmarks/member_memory.py --members 50000 --guilds 4
+    python benchmarks/member_memory.py --presence   # lean mode with presence counts on
+"""
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+STATUSES = ('online', 'idle', 'dnd', 'offline')
+
+def rss_bytes():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+def guild_payload(guild_id, members, presences):
+    first_user = guild_id * 10_000_000
+    payload = {
+        'id': str(guild_id),
+        'name': f'Guild {guild_id}',
+        'member_count': members,
+        'roles': [{
+            'id': str(guild_id), 'name': '@everyone', 'permissions': '0', 'position': 0,
+            'color': 0, 'hoist': False, 'managed': False, 'mentionable': False,
+        }],
+        'channels': [],
+        'emojis': [],
+        'stickers': [],
+        'features': [],
+        'members': [{
+            'user': {
+                'id': str(first_user + i), 'username': f'user{i}', 'discriminator': '0',
+                'global_name': f'User {i}', 'avatar': None,
+            },
+            'roles': [],
+            'joined_at': '2024-01-01T00:00:00+00:00',
+            'deaf': False,
+            'mute': False,
+            'flags': 0,
+        } for i in range(members)],
+    }
+    if presences:
+        # Discord only sends presences with the presences intent
+        payload['presences'] = [{
+            'user': {'id': str(first_user + i)},
+            'status': STATUSES[i % 4],
+            'activities': [],
+            'client_status': {'desktop': STATUSES[i % 4]},
+        } for i in range(members)]
+    return payload
+
+def measure(mode, members, guilds, usage):
+    import discord
+    from discord.state import ConnectionState
+    import main
+
+    options = main.build_client_options(lean=mode == 'lean', usage=usage)
+    state = ConnectionState(dispatch=lambda *args, **kwargs: None, handlers={}, hooks={}, http=None, **options)
+
+    payloads = [guild_payload(1000 + g, members, options['intents'].presences) for g in range(guilds)]
+    gc.collect()
+    before = rss_bytes()
+
+    cached = []
+    for payload in payloads:
+        guild = discord.Guild(data=payload, state=state)
+        state._add_guild(guild)
+        cached.append(len(guild.members))
+
+    # Payloads stay alive until after the measurement; they belong to the gateway, not the cache
+    gc.collect()
+    after = rss_bytes()
+    del payloads
+
+    total = members * guilds
+    intents = options['intents']
+    return {
+        'mode': mode,
+        'members': total,
+        'cached_members': sum(cached),
+        'cached_users': len(state._users),
+        'intents': {name: getattr(intents, name) for name in ('members', 'presences', 'message_content')},
+        'rss_delta_bytes': after - before,
+        'bytes_per_10k_members': (after - before) * 10_000 / total,
+    }
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--members', type=int, default=20000, help='members per guild')
+    parser.add_argument('--guilds', type=int, default=5)
+    parser.add_argument('--welcome', action='store_true', help='lean mode: a guild uses welcome messages')
+    parser.add_argument('--presence', action='store_true', help='lean mode: a guild uses presence counts')
+    parser.add_argument('--no-automod', action='store_true', help='lean mode: no guild uses automod')
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--child', choices=('full', 'lean'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    usage = {
+        'welcome_enabled': args.welcome,
+        'automod_enabled': not args.no_automod,
+        'xp_enabled': True,
+        'presence_enabled': args.presence,
+    }
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.members, args.guilds, usage)))
+        return
+
+    results = []
+    for mode in ('full', 'lean'):
+        cmd = [sys.executable, __file__, '--child', mode, '--members', str(args.members), '--guilds', str(args.guilds)]
+        cmd += [flag for flag, on in (('--welcome', args.welcome), ('--presence', args.presence),
+                                       ('--no-automod', args.no_automod)) if on]
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+
+    print(f"{'mode':<6} {'members':>9} {'cached':>9} {'users':>9} {'RSS delta':>12} {'per 10k':>11}  intents")
+    for r in results:
+        enabled = ', '.join(name for name, on in r['intents'].items() if on) or 'none'
+        print(f"{r['mode']:<6} {r['members']:>9,} {r['cached_members']:>9,} {r['cached_users']:>9,} "
+              f"{r['rss_delta_bytes'] / 2**20:>9.1f} MiB {r['bytes_per_10k_members'] / 2**20:>7.2f} MiB  {enabled}")
+
+    full, lean = results
+    saved = full['rss_delta_bytes'] - lean['rss_delta_bytes']
+    if full['rss_delta_bytes'] > 0:
+        print(f"lean mode saves {saved / 2**20:.1f} MiB ({saved / full['rss_delta_bytes']:.0%}) of member cache")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,442 @@
+"""Run AetherBot as several processes, each serving a slice of the shards.
+
+The launcher splits the shards into contiguous chunks, starts one `main.py` per
+chunk (one at a time, so identifies stay within Discord's limits), restarts any
+that crash with exponential backoff, and hosts the IPC hub that carries
+cross-cluster operations such as /broadcast totals and /botstats.
+
+    python cluster.py --clusters 4                  # shard count from Discord
+    python cluster.py --clusters 2 --shards 8
+    python cluster.py --clusters 2 --shards 4 --stand-in --check
+
+--stand-in serves a small fake Discord API and gateway on localhost, with
+synthetic guilds and a throwaway database, so the whole setup can be tried
+without a token. --check waits for every cluster, runs stats and a broadcast
+through the hub, prints the results and shuts down.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import aiohttp
+from aiohttp import web
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+DISCORD_API = 'https://discord.com/api/v10'
+
+IPC_TIMEOUT = 30             # seconds a cross-cluster request waits for answers by default
+IPC_TIMEOUT_MAX = 6 * 3600   # longest a request may ask for (a broadcast sizes its own)
+READY_TIMEOUT = 300          # seconds a cluster gets to bring all its shards up
+SHUTDOWN_TIMEOUT = 30        # seconds between SIGINT and SIGKILL on shutdown
+RESTART_BACKOFF_MIN = 1
+RESTART_BACKOFF_MAX = 60
+RESTART_STABLE_AFTER = 60    # a cluster that ran this long starts over at the minimum backoff
+
+def shard_chunks(shard_count, clusters):
+    """Split shard ids into `clusters` contiguous, near-equal chunks"""
+    clusters = min(clusters, shard_count)
+    size, extra = divmod(shard_count, clusters)
+    chunks, start = [], 0
+    for i in range(clusters):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append(list(range(start, end)))
+        start = end
+    return chunks
+
+async def recommended_shards(token):
+    headers = {'Authorization': f'Bot {token}'}
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f'{DISCORD_API}/gateway/bot', headers=headers) as resp:
+            resp.raise_for_status()
+            return (await resp.json())['shards']
+
+def send_line(writer, payload):
+    writer.write(json.dumps(payload).encode() + b'\n')
+
+class Hub:
+    """Routes JSON-lines requests from one cluster to all the others and collects the replies"""
+
+    def __init__(self):
+        self.clusters = {}  # cluster id -> StreamWriter
+        self.ready = {}     # cluster id -> Event, set once the cluster says hello
+        self._pending = {}  # request id -> (replies, waiting ids, Event)
+        self._next_id = 0
+        self._server = None
+
+    def ready_event(self, cluster_id):
+        return self.ready.setdefault(cluster_id, asyncio.Event())
+
+    async def start(self, port, host='127.0.0.1'):
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        cluster_id = None
+        try:
+            async for line in reader:
+                message = json.loads(line)
+                if message['type'] == 'hello':
+                    cluster_id = message['cluster']
+                    self.clusters[cluster_id] = writer
+                    self.ready_event(cluster_id).set()
+                elif message['type'] == 'request':
+                    asyncio.create_task(self._relay(cluster_id, writer, message))
+                elif message['type'] == 'reply':
+                    self._collect(message)
+        except (ConnectionError, json.JSONDecodeError):
+            pass
+        finally:
+            if cluster_id is not None and self.clusters.get(cluster_id) is writer:
+                del self.clusters[cluster_id]
+                self.ready_event(cluster_id).clear()
+            writer.close()
+
+    def _collect(self, message):
+        pending = self._pending.get(message['id'])
+        if pending is None:
+            return
+        replies, waiting, done = pending
+        waiting.discard(message['cluster'])
+        replies.append({'cluster': message['cluster'], 'data': message['data'], 'error': message['error']})
+        if not waiting:
+            done.set()
+
+    async def fan_out(self, op, data, targets, timeout=IPC_TIMEOUT, request_id=None):
+        """Ask each target cluster to run op; returns (replies, missing cluster ids)"""
+        if request_id is None:
+            self._next_id += 1
+            request_id = f'hub:{self._next_id}'
+        replies, waiting, done = self._pending[request_id] = ([], set(targets), asyncio.Event())
+        request = {'type': 'request', 'id': request_id, 'op': op, 'data': data}
+        for cluster_id in targets:
+            try:
+                send_line(self.clusters[cluster_id], request)
+            except (KeyError, ConnectionError):
+                pass
+        try:
+            if waiting:
+                await asyncio.wait_for(done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            del self._pending[request_id]
+        return replies, sorted(waiting)
+
+    async def _relay(self, origin, writer, message):
+        targets = [cluster_id for cluster_id in self.clusters if cluster_id != origin]
+        timeout = min(message.get('timeout', IPC_TIMEOUT), IPC_TIMEOUT_MAX)
+        replies, missing = await self.fan_out(message['op'], message['data'], targets, timeout, message['id'])
+        try:
+            send_line(writer, {'type': 'result', 'id': message['id'], 'replies': replies, 'missing': missing})
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+class Launcher:
+    """Starts, supervises and stops one main.py process per shard chunk"""
+
+    def __init__(self, chunks, shard_count, hub, env):
+        self.chunks = chunks
+        self.shard_count = shard_count
+        self.hub = hub
+        self.env = env
+        self.processes = {}
+        self.stopping = False
+        self._supervisors = []
+
+    def cluster_env(self, cluster_id):
+        env = dict(self.env)
+        env.update({
+            'AETHER_CLUSTER_ID': str(cluster_id),
+            'AETHER_CLUSTER_COUNT': str(len(self.chunks)),
+            'AETHER_SHARD_COUNT': str(self.shard_count),
+            'AETHER_SHARD_IDS': ','.join(map(str, self.chunks[cluster_id])),
+            'AETHER_HTTP_PORT': str(int(env.get('AETHER_HTTP_PORT', 8080)) + cluster_id),
+        })
+        return env
+
+    async def start(self):
+        for cluster_id, shards in enumerate(self.chunks):
+            print(f"🚀 Starting cluster {cluster_id} with shards {shards}")
+            self._supervisors.append(asyncio.create_task(self._supervise(cluster_id)))
+            # One cluster at a time: each identifies all of its shards before the next begins
+            try:
+                await asyncio.wait_for(self.hub.ready_event(cluster_id).wait(), READY_TIMEOUT)
+            except asyncio.TimeoutError:
+                print(f"⚠️ Cluster {cluster_id} not ready after {READY_TIMEOUT}s, moving on")
+
+    async def _supervise(self, cluster_id):
+        backoff = RESTART_BACKOFF_MIN
+        while not self.stopping:
+            started = time.monotonic()
+            process = self.processes[cluster_id] = await asyncio.create_subprocess_exec(
+                sys.executable, MAIN, env=self.cluster_env(cluster_id))
+            code = await process.wait()
+            if self.stopping:
+                return
+            if time.monotonic() - started > RESTART_STABLE_AFTER:
+                backoff = RESTART_BACKOFF_MIN
+            print(f"💥 Cluster {cluster_id} exited with code {code}; restarting in {backoff}s")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, RESTART_BACKOFF_MAX)
+
+    def signal_all(self, sig):
+        for process in self.processes.values():
+            if process.returncode is None:
+                process.send_signal(sig)
+
+    async def stop(self):
+        self.stopping = True
+        # SIGINT lets each bot close cleanly and flush its buffers
+        self.signal_all(signal.SIGINT)
+        waits = [process.wait() for process in self.processes.values()]
+        try:
+            await asyncio.wait_for(asyncio.gather(*waits), SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.signal_all(signal.SIGKILL)
+        for task in self._supervisors:
+            task.cancel()
+
+# Stand-in Discord for local testing
+STAND_IN_APP_ID = 1100000000000000000
+STAND_IN_BOT_ID = 1100000000000000001
+HEARTBEAT_INTERVAL = 41250
+PERMISSIONS_EVERYONE = (1 << 10) | (1 << 11) | (1 << 14)  # view channel, send messages, embed links
+
+def json_response(data):
+    # discord.py only parses bodies whose content type is exactly application/json
+    return web.Response(body=json.dumps(data).encode(), headers={'Content-Type': 'application/json'})
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+class StandInDiscord:
+    """Just enough of the REST API and gateway for the bot to log in, shard and send messages"""
+
+    def __init__(self, guilds, members, shard_count):
+        self.shard_count = shard_count
+        self.guild_ids = [(1_000_000 + i) << 22 for i in range(guilds)]
+        self.members = members
+        self.sent = {}  # channel id -> messages received
+        self.base_url = None
+        self._next_message = 0
+        self._runner = None
+
+    @property
+    def bot_user(self):
+        return {'id': str(STAND_IN_BOT_ID), 'username': 'AetherBot', 'discriminator': '0',
+                'global_name': None, 'avatar': None, 'bot': True}
+
+    def guild_payload(self, guild_id):
+        member = lambda user: {'user': user, 'roles': [], 'joined_at': '2024-01-01T00:00:00+00:00',
+                               'deaf': False, 'mute': False, 'flags': 0}
+        members = [member(self.bot_user)] + [
+            member({'id': str(guild_id + i + 1), 'username': f'user{i}', 'discriminator': '0',
+                    'global_name': f'User {i}', 'avatar': None})
+            for i in range(self.members)
+        ]
+        channel_id = guild_id + 1_000_000
+        return {
+            'id': str(guild_id), 'name': f'Stand-in {guild_id >> 22}', 'owner_id': str(guild_id + 1),
+            'member_count': len(members), 'large': False, 'unavailable': False, 'joined_at': _now(),
+            'features': [], 'emojis': [], 'stickers': [], 'presences': [], 'voice_states': [],
+            'threads': [], 'stage_instances': [], 'guild_scheduled_events': [],
+            'system_channel_id': str(channel_id),
+            'roles': [{'id': str(guild_id), 'name': '@everyone', 'permissions': str(PERMISSIONS_EVERYONE),
+                       'position': 0, 'color': 0, 'hoist': False, 'managed': False, 'mentionable': False}],
+            'channels': [{'id': str(channel_id), 'type': 0, 'name': 'general', 'position': 0,
+                          'permission_overwrites': []}],
+            'members': members,
+        }
+
+    def guilds_for(self, shard_id, shard_count):
+        return [guild_id for guild_id in self.guild_ids if (guild_id >> 22) % shard_count == shard_id]
+
+    async def start(self, host='127.0.0.1', port=0):
+        app = web.Application()
+        app.router.add_get('/api/v10/users/{user_id}', self.me)
+        app.router.add_get('/api/v10/oauth2/applications/@me', self.application)
+        app.router.add_get('/api/v10/gateway/bot', self.gateway_bot)
+        app.router.add_get('/api/v10/gateway', self.gateway_bot)
+        app.router.add_put('/api/v10/applications/{app_id}/commands', self.sync_commands)
+        app.router.add_post('/api/v10/channels/{channel_id}/messages', self.send_message)
+        app.router.add_get('/gateway', self.gateway)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f'http://{host}:{port}'
+        return self.base_url
+
+    async def close(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def me(self, request):
+        return json_response(self.bot_user)
+
+    async def application(self, request):
+        return json_response({
+            'id': str(STAND_IN_APP_ID), 'name': 'AetherBot', 'description': '', 'icon': None,
+            'verify_key': '', 'bot_public': False, 'bot_require_code_grant': False, 'flags': 0,
+            'owner': {'id': '1', 'username': 'owner', 'discriminator': '0', 'global_name': None, 'avatar': None},
+        })
+
+    async def gateway_bot(self, request):
+        return json_response({
+            'url': self.base_url.replace('http', 'ws', 1) + '/gateway',
+            'shards': self.shard_count,
+            'session_start_limit': {'total': 1000, 'remaining': 1000, 'reset_after': 0, 'max_concurrency': 1},
+        })
+
+    async def sync_commands(self, request):
+        commands = await request.json()
+        for i, command in enumerate(commands):
+            command.update(id=str(STAND_IN_APP_ID + i + 1), application_id=str(STAND_IN_APP_ID), version='1')
+        return json_response(commands)
+
+    async def send_message(self, request):
+        channel_id = request.match_info['channel_id']
+        body = await request.json()
+        self.sent[channel_id] = self.sent.get(channel_id, 0) + 1
+        self._next_message += 1
+        return json_response({
+            'id': str((2_000_000 + self._next_message) << 22), 'channel_id': channel_id,
+            'author': self.bot_user, 'content': body.get('content') or '', 'timestamp': _now(),
+            'edited_timestamp': None, 'tts': False, 'mention_everyone': False, 'mentions': [],
+            'mention_roles': [], 'attachments': [], 'embeds': body.get('embeds') or [],
+            'pinned': False, 'type': 0,
+        })
+
+    async def gateway(self, request):
+        # Plain text frames; the client only decompresses binary ones
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        sequence = 0
+
+        async def dispatch(event, data):
+            nonlocal sequence
+            sequence += 1
+            await ws.send_json({'op': 0, 't': event, 's': sequence, 'd': data})
+
+        await ws.send_json({'op': 10, 'd': {'heartbeat_interval': HEARTBEAT_INTERVAL}})
+        async for msg in ws:
+            if msg.type is not aiohttp.WSMsgType.TEXT:
+                continue
+            payload = json.loads(msg.data)
+            op, data = payload['op'], payload.get('d')
+            if op == 1:
+                await ws.send_json({'op': 11})
+            elif op == 2:
+                shard_id, shard_count = data.get('shard', [0, 1])
+                guild_ids = self.guilds_for(shard_id, shard_count)
+                await dispatch('READY', {
+                    'v': 10, 'user': self.bot_user, 'session_id': f'stand-in-{shard_id}',
+                    'resume_gateway_url': self.base_url.replace('http', 'ws', 1) + '/gateway',
+                    'guilds': [{'id': str(guild_id), 'unavailable': True} for guild_id in guild_ids],
+                    'shard': [shard_id, shard_count], 'application': {'id': str(STAND_IN_APP_ID), 'flags': 0},
+                    'private_channels': [], 'relationships': [],
+                })
+                for guild_id in guild_ids:
+                    await dispatch('GUILD_CREATE', self.guild_payload(guild_id))
+            elif op == 6:
+                # No sessions to resume; make the client identify again
+                await ws.send_json({'op': 9, 'd': False})
+            elif op == 8:
+                guild_id = int(data['guild_id'])
+                await dispatch('GUILD_MEMBERS_CHUNK', {
+                    'guild_id': str(guild_id), 'members': self.guild_payload(guild_id)['members'],
+                    'chunk_index': 0, 'chunk_count': 1, 'nonce': data.get('nonce'),
+                })
+        return ws
+
+async def run_check(hub, clusters, stand_in):
+    replies, missing = await hub.fan_out('stats', {}, range(clusters))
+    for reply in sorted(replies, key=lambda reply: reply['cluster']):
+        print(f"📊 Cluster {reply['cluster']}: {reply['data'] or reply['error']}")
+    guilds = sum(reply['data']['guilds'] for reply in replies if reply['data'])
+    print(f"📊 {guilds}/{len(stand_in.guild_ids)} stand-in guilds served, no answer from {missing or 'none'}")
+
+    replies, missing = await hub.fan_out('broadcast', {'message': 'Stand-in check'}, range(clusters))
+    sent = sum(reply['data']['sent'] for reply in replies if reply['data'])
+    print(f"📢 Broadcast reached {sent} guilds; the stand-in received {sum(stand_in.sent.values())} messages")
+    return guilds == len(stand_in.guild_ids) and sent == len(stand_in.guild_ids) and not missing
+
+async def main(args):
+    env = dict(os.environ)
+    stand_in = None
+    if args.stand_in:
+        args.shards = args.shards or args.clusters
+        stand_in = StandInDiscord(args.stand_in_guilds, args.stand_in_members, args.shards)
+        base_url = await stand_in.start()
+        data_dir = tempfile.mkdtemp(prefix='aether-stand-in-')
+        env.update({
+            'AETHER_API_BASE': f'{base_url}/api/v10',
+            'AETHER_GATEWAY_URL': base_url.replace('http', 'ws', 1) + '/gateway',
+            'AETHER_DB_PATH': os.path.join(data_dir, 'aether.db'),
+            'AETHER_BACKUP_DIR': data_dir,
+            'DISCORD_TOKEN': 'stand-in',
+        })
+        env.setdefault('AETHER_HTTP_PORT', '18080')
+        print(f"🧪 Stand-in Discord at {base_url} with {args.stand_in_guilds} guilds, data in {data_dir}")
+
+    if not env.get('DISCORD_TOKEN'):
+        sys.exit("DISCORD_TOKEN is not set")
+    shard_count = args.shards or await recommended_shards(env['DISCORD_TOKEN'])
+    chunks = shard_chunks(shard_count, args.clusters)
+
+    hub = Hub()
+    env['AETHER_IPC_PORT'] = str(await hub.start(args.ipc_port))
+    launcher = Launcher(chunks, shard_count, hub, env)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    ok = True
+    try:
+        starting = asyncio.create_task(launcher.start())
+        stopped = asyncio.create_task(stop.wait())
+        await asyncio.wait([starting, stopped], return_when=asyncio.FIRST_COMPLETED)
+        if starting.done():
+            print(f"✅ {len(chunks)} clusters running {shard_count} shards")
+            if args.check:
+                ok = await run_check(hub, len(chunks), stand_in)
+            else:
+                await stopped
+        else:
+            starting.cancel()
+    finally:
+        print("👋 Shutting down clusters")
+        await launcher.stop()
+        await hub.close()
+        if stand_in:
+            await stand_in.close()
+    return ok
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clusters', type=int, default=os.cpu_count() or 1, help='processes to run (default: CPU count)')
+    parser.add_argument('--shards', type=int, help='total shard count (default: what Discord recommends)')
+    parser.add_argument('--ipc-port', type=int, default=0, help='port for the IPC hub (default: any free port)')
+    parser.add_argument('--stand-in', action='store_true', help='run against a local fake Discord')
+    parser.add_argument('--stand-in-guilds', type=int, default=20)
+    parser.add_argument('--stand-in-members', type=int, default=10)
+    parser.add_argument('--check', action='store_true', help='with --stand-in: verify stats and broadcast, then exit')
+    args = parser.parse_args()
+    if args.check and not args.stand_in:
+        parser.error('--check needs --stand-in')
+    sys.exit(0 if asyncio.run(main(args)) else 1)
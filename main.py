@@ -1,9 +1,14 @@
+import time
+PROCESS_STARTED = time.perf_counter()  # taken before the heavy imports, for the startup report
+
 import discord
 from discord.ext import commands, tasks
 from discord import app_commands, Interaction, Embed, ButtonStyle, SelectOption
 from discord.ui import Button, View, Select, Modal, TextInput
 import asyncio
+import bisect
 import aiohttp
+import yarl
 from datetime import datetime, timedelta
 import random
 import os
@@ -11,29 +16,383 @@ import json
 import sqlite3
 import hashlib
 import re
-from flask import Flask
-from threading import Thread
+import gzip
+import shutil
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, fields, replace
+from aiohttp import web
+from threading import local
 import logging
 
-# Flask for keeping bot alive
-app = Flask('')
-
-@app.route('/')
-def home():
-    return "🚀 AetherBot is running!"
+# Status server
+# Served from the bot's own event loop; each cluster process gets its own port from cluster.py
+HTTP_PORT = int(os.getenv('AETHER_HTTP_PORT', 8080))
+HEALTH_MAX_LOOP_LAG = float(os.getenv('AETHER_HEALTH_MAX_LOOP_LAG', 1.0))  # seconds
+HEALTH_DB_TIMEOUT = 2.0  # seconds
+
+async def home(request):
+    return web.Response(text="🚀 AetherBot is running!")
+
+async def metrics_endpoint(request):
+    return web.Response(body=metrics.render().encode(), headers={'Content-Type': 'text/plain; version=0.0.4'})
+
+def gateway_check():
+    if bot.is_closed() or not bot.is_ready():
+        return False, 'not ready'
+    shards = getattr(bot, 'shards', None)
+    if shards:
+        down = sorted(shard_id for shard_id, shard in shards.items() if shard.is_closed())
+        if down:
+            return False, f'shards {down} disconnected'
+    elif bot.ws is None or bot.ws.socket.closed:
+        return False, 'disconnected'
+    return True, f'{len(bot.guilds)} guilds'
+
+async def database_check():
+    try:
+        await asyncio.wait_for(storage.ping(), HEALTH_DB_TIMEOUT)
+    except Exception as e:
+        return False, f'{type(e).__name__}: {e}' if str(e) else type(e).__name__
+    return True, storage.name
+
+def loop_lag_check():
+    if last_loop_lag is None:
+        return True, 'no samples yet'
+    return last_loop_lag <= HEALTH_MAX_LOOP_LAG, f'{last_loop_lag:.3f}s'
+
+async def healthz(request):
+    """200 when the gateway is up, the database answers and the loop keeps up; 503 otherwise"""
+    checks = {
+        'gateway': gateway_check(),
+        'database': await database_check(),
+        'loop_lag': loop_lag_check(),
+    }
+    healthy = all(ok for ok, _ in checks.values())
+    body = {
+        'status': 'ok' if healthy else 'unavailable',
+        'cluster': CLUSTER_ID,
+        'checks': {name: {'ok': ok, 'detail': detail} for name, (ok, detail) in checks.items()},
+    }
+    return web.json_response(body, status=200 if healthy else 503)
 
-def run():
-    app.run(host='0.0.0.0', port=8080)
+http_app = web.Application()
+http_app.router.add_get('/', home)
+http_app.router.add_get('/metrics', metrics_endpoint)
+http_app.router.add_get('/healthz', healthz)
+_http_runner = None
 
-def keep_alive():
-    t = Thread(target=run)
-    t.start()
+async def start_http_server():
+    global _http_runner
+    if _http_runner is not None:
+        return
+    runner = web.AppRunner(http_app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, '0.0.0.0', HTTP_PORT).start()
+    except OSError as e:
+        await runner.cleanup()
+        print(f"❌ Couldn't serve HTTP on port {HTTP_PORT}: {e}")
+        return
+    _http_runner = runner
+    print(f"🌐 Status server listening on port {HTTP_PORT}")
+
+async def stop_http_server():
+    global _http_runner
+    if _http_runner is not None:
+        await _http_runner.cleanup()
+        _http_runner = None
+
+# Metrics
+# Plain dict counters on the hot paths; rendered in the Prometheus text format on scrape
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def samples(self):
+        for label_values, value in list(self._values.items()):
+            yield self.name, _format_labels(self.labels, label_values), value
+
+class Gauge(Counter):
+    """Set directly, or computed at scrape time by collect() -> {label_values: value}"""
+    type = 'gauge'
+
+    def __init__(self, name, help, labels=(), collect=None):
+        super().__init__(name, help, labels)
+        self.collect = collect
+
+    def set(self, value, *label_values):
+        self._values[label_values] = value
+
+    def samples(self):
+        if self.collect:
+            self._values = dict(self.collect())
+        yield from super().samples()
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._values = {}  # label values -> [per-bucket counts..., overflow count, sum]
+
+    def observe(self, value, *label_values):
+        entry = self._values.get(label_values)
+        if entry is None:
+            entry = self._values[label_values] = [0] * (len(self.buckets) + 2)
+        entry[bisect.bisect_left(self.buckets, value)] += 1
+        entry[-1] += value
+
+    def samples(self):
+        for label_values, entry in list(self._values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), entry):
+                cumulative += count
+                yield f'{self.name}_bucket', _format_labels(self.labels, label_values, [('le', bound)]), cumulative
+            yield f'{self.name}_sum', _format_labels(self.labels, label_values), entry[-1]
+            yield f'{self.name}_count', _format_labels(self.labels, label_values), cumulative
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=(), collect=None):
+        return self._register(Gauge(name, help, labels, collect))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {value}')
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+
+loop_lag = metrics.histogram('aether_event_loop_lag_seconds', 'How late the event loop ran a scheduled wakeup')
+event_duration = metrics.histogram('aether_event_duration_seconds', 'Gateway event handler run time', ('event',))
+command_duration = metrics.histogram('aether_command_duration_seconds', 'Slash command run time',
+                                     ('command', 'status'))
+db_duration = metrics.histogram('aether_db_query_duration_seconds',
+                                'Database call time, queueing for a connection included', ('kind',))
+cache_requests = metrics.counter('aether_cache_requests_total', 'In-memory cache lookups', ('cache', 'result'))
+http_requests = metrics.counter('aether_http_requests_total', 'Requests made to the Discord REST API',
+                                ('method', 'status'))
+http_rate_limited = metrics.counter('aether_http_rate_limited_total', 'Discord REST responses with status 429',
+                                    ('scope',))
+automod_actions = metrics.counter('aether_automod_actions_total', 'Automod actions taken',
+                                  ('guild', 'action', 'reason'))
+
+def _cache_hit_ratios():
+    totals = {}
+    for (cache, result), count in list(cache_requests._values.items()):
+        hits, lookups = totals.get(cache, (0, 0))
+        totals[cache] = (hits + count * (result == 'hit'), lookups + count)
+    return {(cache,): hits / lookups for cache, (hits, lookups) in totals.items() if lookups}
+
+metrics.gauge('aether_cache_hit_ratio', 'Share of cache lookups that hit, since start', ('cache',),
+              collect=_cache_hit_ratios)
+
+def cache_lookup(cache, hit):
+    cache_requests.inc(cache, 'hit' if hit else 'miss')
+    return hit
+
+LOOP_LAG_INTERVAL = 0.5  # seconds
+
+last_loop_lag = None
+
+async def monitor_loop_lag():
+    """Sleep in a loop and record how late each wakeup comes"""
+    global last_loop_lag
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        last_loop_lag = max(0.0, time.perf_counter() - start - LOOP_LAG_INTERVAL)
+        loop_lag.observe(last_loop_lag)
+
+_lag_monitor = None
+
+def start_loop_lag_monitor():
+    global _lag_monitor
+    if _lag_monitor is None or _lag_monitor.done():
+        _lag_monitor = asyncio.create_task(monitor_loop_lag())
+
+async def _trace_request_end(session, context, params):
+    http_requests.inc(params.method, params.response.status)
+    if params.response.status == 429:
+        http_rate_limited.inc(params.response.headers.get('X-RateLimit-Scope', 'unknown'))
+
+async def _trace_request_exception(session, context, params):
+    http_requests.inc(params.method, 'error')
+
+http_trace = aiohttp.TraceConfig()
+http_trace.on_request_end.append(_trace_request_end)
+http_trace.on_request_exception.append(_trace_request_exception)
 
 # Database setup
-def init_db():
-    conn = sqlite3.connect('aether.db')
-    c = conn.cursor()
+DB_PATH = os.getenv('AETHER_DB_PATH', 'aether.db')
+
+DB_READERS = 4
+DB_PRAGMAS = (
+    # Set first so that other cluster processes switching to WAL wait instead of failing
+    'PRAGMA busy_timeout = 5000',
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA mmap_size = 268435456',  # 256 MiB
+    'PRAGMA cache_size = -16000',    # 16 MiB
+)
+DB_STATEMENT_CACHE = 256
+
+class Database:
+    """Async access to SQLite through a pool of long-lived connections.
+
+    One writer connection lives on its own thread, so writes are serialized and never
+    contend with each other; reads fan out over a small pool of reader threads, each
+    with its own connection. WAL mode lets those readers run while a write is in progress,
+    and nothing ever blocks the event loop.
+
+    In cluster mode several processes share the file. Transactions take the write lock
+    up front (BEGIN IMMEDIATE), so a writer in another process makes them wait out
+    busy_timeout rather than fail halfway through with a stale snapshot.
+    """
+
+    def __init__(self, path, readers=DB_READERS):
+        self.path = path
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='aether-db-writer')
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix='aether-db-reader')
+        self._writer_conn = None
+        self._local = local()
+        self._reader_conns = []
+
+    def _connect(self, readonly=False):
+        # Readers are only ever used from their own thread; the flag just lets close() reach them.
+        # Autocommit mode: transaction() issues BEGIN/COMMIT itself
+        conn = sqlite3.connect(self.path, cached_statements=DB_STATEMENT_CACHE, check_same_thread=False,
+                               isolation_level=None)
+        for pragma in DB_PRAGMAS:
+            conn.execute(pragma)
+        if readonly:
+            conn.execute('PRAGMA query_only = ON')
+        return conn
+
+    def _call_writer(self, fn, *args):
+        if self._writer_conn is None:
+            self._writer_conn = self._connect()
+        return fn(self._writer_conn, *args)
+
+    def _call_reader(self, fn, *args):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect(readonly=True)
+            self._reader_conns.append(conn)
+        return fn(conn, *args)
+
+    async def run(self, fn, *args):
+        """Run fn(conn, *args) on the writer thread"""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._writer, self._call_writer, fn, *args)
+        finally:
+            db_duration.observe(time.perf_counter() - start, 'write')
+
+    async def read(self, fn, *args):
+        """Run fn(conn, *args) on a reader thread"""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._readers, self._call_reader, fn, *args)
+        finally:
+            db_duration.observe(time.perf_counter() - start, 'read')
+
+    async def transaction(self, fn, *args):
+        """Run fn(cursor, *args) on the writer inside a transaction; commits on success"""
+        def wrapper(conn, *args):
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = fn(conn.cursor(), *args)
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+            return result
+        return await self.run(wrapper, *args)
+
+    async def execute(self, sql, params=()):
+        def op(c):
+            c.execute(sql, params)
+            return c.rowcount
+        return await self.transaction(op)
+
+    async def executemany(self, sql, seq_of_params):
+        def op(c):
+            c.executemany(sql, seq_of_params)
+            return c.rowcount
+        return await self.transaction(op)
+
+    async def fetchone(self, sql, params=()):
+        return await self.read(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql, params=()):
+        return await self.read(lambda conn: conn.execute(sql, params).fetchall())
+
+    async def close(self):
+        def op(conn):
+            conn.close()
+            self._writer_conn = None
+        if self._writer_conn is not None:
+            await self.run(op)
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        for conn in self._reader_conns:
+            conn.close()
+        self._reader_conns.clear()
 
+def _ensure_columns(c, table, columns):
+    """Add columns introduced after a table was first created"""
+    c.execute(f'PRAGMA table_info({table})')
+    existing = {row[1] for row in c.fetchall()}
+    for name, definition in columns:
+        if name not in existing:
+            c.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
+
+def create_schema(c):
     # Guild configs
     c.execute('''CREATE TABLE IF NOT EXISTS guild_configs (
         guild_id TEXT PRIMARY KEY,
@@ -48,6 +407,19 @@ def init_db():
         music_enabled BOOLEAN DEFAULT 1,
         prefix TEXT DEFAULT '!'
     )''')
+    _ensure_columns(c, 'guild_configs', [
+        ('flood_messages', 'INTEGER DEFAULT 5'),
+        ('flood_seconds', 'REAL DEFAULT 3'),
+        ('flood_strikes', 'INTEGER DEFAULT 3'),
+        ('flood_timeout', 'INTEGER DEFAULT 300'),
+        ('raid_joins', 'INTEGER DEFAULT 10'),
+        ('raid_seconds', 'REAL DEFAULT 10'),
+        ('raid_duration', 'INTEGER DEFAULT 300'),
+        ('raid_min_account_age', 'INTEGER DEFAULT 0'),
+        ('raid_timeout', 'INTEGER DEFAULT 3600'),
+        ('announce_channel', 'TEXT'),
+        ('presence_enabled', 'BOOLEAN DEFAULT 1'),
+    ])
 
     # User XP and levels
     c.execute('''CREATE TABLE IF NOT EXISTS user_xp (
@@ -70,6 +442,32 @@ def init_db():
         timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
     )''')
 
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_warnings_user
+                 ON warnings (guild_id, user_id, id)''')
+
+    # Per-user warning totals, kept in step with the warnings table on every add and remove
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'warning_counts'")
+    backfill_counts = c.fetchone() is None
+    c.execute('''CREATE TABLE IF NOT EXISTS warning_counts (
+        guild_id TEXT,
+        user_id TEXT,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (guild_id, user_id)
+    )''')
+    if backfill_counts:
+        c.execute('''INSERT INTO warning_counts (guild_id, user_id, count)
+                     SELECT guild_id, user_id, COUNT(*) FROM warnings GROUP BY guild_id, user_id''')
+
+    # Automatic action once a user collects `threshold` warnings within the window
+    c.execute('''CREATE TABLE IF NOT EXISTS escalation_rules (
+        guild_id TEXT,
+        threshold INTEGER,
+        window_hours INTEGER,
+        action TEXT,
+        duration_minutes INTEGER,
+        PRIMARY KEY (guild_id, threshold)
+    )''')
+
     # Automod logs
     c.execute('''CREATE TABLE IF NOT EXISTS automod_logs (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -89,57 +487,1515 @@ def init_db():
         PRIMARY KEY (guild_id, message_id, emoji)
     )''')
 
-    conn.commit()
-    conn.close()
+    # Automod blocklists; existing guilds start from the default list the first time round
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'automod_words'")
+    seed_blocklists = c.fetchone() is None
+    c.execute('''CREATE TABLE IF NOT EXISTS automod_words (
+        guild_id TEXT,
+        word TEXT,
+        PRIMARY KEY (guild_id, word)
+    )''')
+    if seed_blocklists:
+        c.execute('SELECT guild_id FROM guild_configs')
+        for (guild_id,) in c.fetchall():
+            seed_blocklist(c, guild_id)
 
-# Bot setup
-intents = discord.Intents.all()
-bot = commands.Bot(command_prefix="!", intents=intents, help_command=None)
+    # Automod link allow/deny lists
+    c.execute('''CREATE TABLE IF NOT EXISTS automod_links (
+        guild_id TEXT,
+        domain TEXT,
+        action TEXT,
+        PRIMARY KEY (guild_id, domain)
+    )''')
 
-OWNER_ID = 123456789012345678  # Replace with your Discord ID
+    # Economy: an append-only ledger of every coin movement, plus periodic copies of all balances
+    c.execute('''CREATE TABLE IF NOT EXISTS economy_ledger (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        guild_id TEXT,
+        user_id TEXT,
+        kind TEXT,
+        amount INTEGER,
+        balance INTEGER,
+        created_at DATETIME
+    )''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_economy_ledger_user
+                 ON economy_ledger (guild_id, user_id, id)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS balance_snapshots (
+        taken_at DATETIME,
+        guild_id TEXT,
+        user_id TEXT,
+        coins INTEGER,
+        PRIMARY KEY (taken_at, guild_id, user_id)
+    )''')
 
-# Utility functions
-def get_db():
-    return sqlite3.connect('aether.db')
-
-def get_guild_config(guild_id):
-    conn = get_db()
-    c = conn.cursor()
-    c.execute('SELECT * FROM guild_configs WHERE guild_id = ?', (str(guild_id),))
-    result = c.fetchone()
-    conn.close()
-
-    if not result:
-        conn = get_db()
-        c = conn.cursor()
-        c.execute('''INSERT INTO guild_configs (guild_id) VALUES (?)''', (str(guild_id),))
-        conn.commit()
+    # Covering index for rank and leaderboard queries
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_user_xp_guild_xp
+                 ON user_xp (guild_id, xp DESC, user_id, level, coins)''')
+
+# Storage
+# Every read and write the bot makes goes through a Storage engine, grouped into one
+# repository per area. SQLiteStorage is what the bot runs on; MemoryStorage keeps
+# everything in dicts for benchmarks and tests. Another engine (a networked SQL server,
+# say) only has to provide the same repositories.
+STORAGE_ENGINE = os.getenv('AETHER_STORAGE', 'sqlite')
+
+@dataclass
+class UserStats:
+    xp: int = 0
+    level: int = 1
+    coins: int = 100
+    last_daily: str = None  # ISO date of the last /daily claim
+
+class GuildConfigRepository(ABC):
+    @abstractmethod
+    async def load_all(self):
+        """Every stored config, as GuildConfig objects"""
+
+    @abstractmethod
+    async def get_or_create(self, guild_id):
+        """The guild's config, created with the default blocklist if it is new"""
+
+    @abstractmethod
+    async def update(self, guild_id, values):
+        ...
+
+class UserRepository(ABC):
+    @abstractmethod
+    async def get(self, guild_id, user_id):
+        """UserStats for a user, or None if they have no row yet"""
+
+    @abstractmethod
+    async def get_many(self, guild_id, user_ids):
+        """{user_id: UserStats} for whichever of user_ids have rows"""
+
+    @abstractmethod
+    async def guild_xp(self, guild_id):
+        """[(user_id, xp)] for every user in the guild"""
+
+    @abstractmethod
+    async def save_xp(self, rows):
+        """Upsert (guild_id, user_id, xp, level, coins_earned) rows; coins are added, not replaced"""
+
+
+class EconomyRepository(ABC):
+    """Balance changes are single conditional writes, so concurrent calls can't overspend or double-claim"""
+
+    @abstractmethod
+    async def claim_daily(self, guild_id, user_id, today, level=None):
+        """Grant today's reward unless it was already claimed; returns (reward, balance) or None.
+
+        level stands in for the stored level when newer XP hasn't been written yet.
+        """
+
+    @abstractmethod
+    async def adjust(self, guild_id, user_id, delta, minimum):
+        """Add delta if the balance is at least minimum; returns the new balance or None"""
+
+    @abstractmethod
+    async def append_ledger(self, rows):
+        """Append (guild_id, user_id, kind, amount, balance, created_at) rows; balance may be None"""
+
+    @abstractmethod
+    async def snapshot(self, taken_at, keep_after):
+        """Copy every balance as of taken_at and drop snapshots older than keep_after; returns rows copied"""
+
+class WarningRepository(ABC):
+    """Moderation cases: one per warning, numbered by case id"""
+
+    @abstractmethod
+    async def add(self, guild_id, user_id, moderator_id, reason, since=None):
+        """Open a case; returns (case_id, total, recent).
+
+        recent lists the timestamps of the user's cases at or after since, the new one included.
+        """
+
+    @abstractmethod
+    async def count(self, guild_id, user_id):
+        ...
+
+    @abstractmethod
+    async def page(self, guild_id, user_id, before=None, limit=5):
+        """[(case_id, moderator_id, reason, timestamp)] newest first, only cases older than before if given"""
+
+    @abstractmethod
+    async def remove(self, guild_id, case_id):
+        """Close a case; returns the user it was against, or None if the guild has no such case"""
+
+    @abstractmethod
+    async def escalation_rules(self):
+        """[(guild_id, threshold, window_hours, action, duration_minutes)] for every guild"""
+
+    @abstractmethod
+    async def set_escalation_rule(self, guild_id, threshold, window_hours, action, duration_minutes):
+        ...
+
+    @abstractmethod
+    async def remove_escalation_rule(self, guild_id, threshold):
+        """Returns whether there was a rule at that threshold"""
+
+class AutomodRepository(ABC):
+    @abstractmethod
+    async def log(self, rows):
+        """Append (guild_id, user_id, action, reason) rows to the automod log"""
+
+    @abstractmethod
+    async def words(self, guild_id):
+        ...
+
+    @abstractmethod
+    async def add_word(self, guild_id, word):
+        ...
+
+    @abstractmethod
+    async def remove_word(self, guild_id, word):
+        """Returns whether the word was on the list"""
+
+    @abstractmethod
+    async def link_rules(self, guild_id):
+        """{domain: action} for the guild's allow/deny list"""
+
+    @abstractmethod
+    async def set_link_rule(self, guild_id, domain, action):
+        ...
+
+    @abstractmethod
+    async def remove_link_rule(self, guild_id, domain):
+        """Returns whether there was a rule for the domain"""
+
+class ReactionRoleRepository(ABC):
+    @abstractmethod
+    async def load_all(self):
+        """[(guild_id, message_id, emoji, role_id)] for every guild"""
+
+    @abstractmethod
+    async def for_guild(self, guild_id):
+        """{(message_id, emoji): role_id} for the guild"""
+
+    @abstractmethod
+    async def add(self, guild_id, message_id, emoji, role_id):
+        ...
+
+    @abstractmethod
+    async def remove(self, guild_id, message_id, emoji):
+        """Returns whether the message had that reaction role"""
+
+    @abstractmethod
+    async def remove_message(self, guild_id, message_id):
+        """Drop every reaction role on a message"""
+
+class Storage:
+    """One engine's set of repositories"""
+    name = None
+    supports_backups = False
+
+    guilds: GuildConfigRepository
+    users: UserRepository
+    economy: EconomyRepository
+    warnings: WarningRepository
+    automod: AutomodRepository
+    reaction_roles: ReactionRoleRepository
+
+    async def init(self):
+        """Create or migrate whatever the engine needs; safe to call more than once"""
+
+    async def ping(self):
+        """Raise if the backing store can't be reached"""
+
+    async def close(self):
+        pass
+
+# SQLite engine
+class SQLiteGuildConfigs(GuildConfigRepository):
+    def __init__(self, database):
+        self.db = database
+
+    async def load_all(self):
+        return [GuildConfig.from_row(row) for row in await self.db.fetchall(GUILD_CONFIG_SELECT)]
+
+    async def get_or_create(self, guild_id):
+        def op(c):
+            c.execute('INSERT OR IGNORE INTO guild_configs (guild_id) VALUES (?)', (guild_id,))
+            if c.rowcount:
+                seed_blocklist(c, guild_id)
+            c.execute(f'{GUILD_CONFIG_SELECT} WHERE guild_id = ?', (guild_id,))
+            return c.fetchone()
+        return GuildConfig.from_row(await self.db.transaction(op))
+
+    async def update(self, guild_id, values):
+        assignments = ', '.join(f'{key} = ?' for key in values)
+        await self.db.execute(f'UPDATE guild_configs SET {assignments} WHERE guild_id = ?',
+                              (*values.values(), guild_id))
+
+class SQLiteUsers(UserRepository):
+    def __init__(self, database):
+        self.db = database
+
+    async def get(self, guild_id, user_id):
+        row = await self.db.fetchone('SELECT xp, level, coins, last_daily FROM user_xp '
+                                     'WHERE user_id = ? AND guild_id = ?', (user_id, guild_id))
+        return UserStats(*row) if row else None
+
+    async def get_many(self, guild_id, user_ids):
+        if not user_ids:
+            return {}
+        placeholders = ', '.join('?' * len(user_ids))
+        rows = await self.db.fetchall(f'''SELECT user_id, xp, level, coins, last_daily FROM user_xp
+                                      WHERE guild_id = ? AND user_id IN ({placeholders})''',
+                                      (guild_id, *user_ids))
+        return {user_id: UserStats(*stats) for user_id, *stats in rows}
+
+    async def guild_xp(self, guild_id):
+        return await self.db.fetchall('SELECT user_id, xp FROM user_xp WHERE guild_id = ?', (guild_id,))
+
+    async def save_xp(self, rows):
+        await self.db.executemany('''INSERT INTO user_xp (user_id, guild_id, xp, level, coins)
+                                  VALUES (?, ?, ?, ?, ?)
+                                  ON CONFLICT (user_id, guild_id)
+                                  DO UPDATE SET xp = excluded.xp, level = excluded.level, coins = coins + ?''',
+                                  [(user_id, guild_id, xp, level, 100 + coins, coins)
+                                   for guild_id, user_id, xp, level, coins in rows])
+
+class SQLiteEconomy(EconomyRepository):
+    def __init__(self, database):
+        self.db = database
+
+    async def claim_daily(self, guild_id, user_id, today, level=None):
+        day = today.isoformat()
+        def op(conn):
+            # Higher levels earn more
+            rows = conn.execute('''UPDATE user_xp SET coins = coins + 50 + COALESCE(?, level) * 10, last_daily = ?
+                                 WHERE user_id = ? AND guild_id = ? AND (last_daily IS NULL OR last_daily < ?)
+                                 RETURNING 50 + COALESCE(?, level) * 10, coins''',
+                                 (level, day, user_id, guild_id, day, level)).fetchall()
+            if not rows:
+                # Either a first claim or already claimed today; the insert only succeeds for the former
+                rows = conn.execute('''INSERT INTO user_xp (user_id, guild_id, xp, level, coins, last_daily)
+                                     VALUES (?, ?, 0, 1, 100, ?) ON CONFLICT (user_id, guild_id) DO NOTHING
+                                     RETURNING 100, coins''', (user_id, guild_id, day)).fetchall()
+            return tuple(rows[0]) if rows else None
+        return await self.db.run(op)
+
+    async def adjust(self, guild_id, user_id, delta, minimum):
+        rows = await self.db.run(lambda conn: conn.execute(
+            'UPDATE user_xp SET coins = coins + ? WHERE user_id = ? AND guild_id = ? AND coins >= ? RETURNING coins',
+            (delta, user_id, guild_id, minimum)).fetchall())
+        return rows[0][0] if rows else None
+
+    async def append_ledger(self, rows):
+        await self.db.executemany('''INSERT INTO economy_ledger (guild_id, user_id, kind, amount, balance, created_at)
+                                  VALUES (?, ?, ?, ?, ?, ?)''', rows)
+
+    async def snapshot(self, taken_at, keep_after):
+        def op(c):
+            c.execute('''INSERT OR IGNORE INTO balance_snapshots (taken_at, guild_id, user_id, coins)
+                       SELECT ?, guild_id, user_id, coins FROM user_xp''', (taken_at,))
+            copied = c.rowcount
+            c.execute('DELETE FROM balance_snapshots WHERE taken_at < ?', (keep_after,))
+            return copied
+        return await self.db.transaction(op)
+
+class SQLiteWarnings(WarningRepository):
+    def __init__(self, database):
+        self.db = database
+
+    async def add(self, guild_id, user_id, moderator_id, reason, since=None):
+        def op(c):
+            c.execute('INSERT INTO warnings (user_id, guild_id, moderator_id, reason) VALUES (?, ?, ?, ?)',
+                      (user_id, guild_id, moderator_id, reason))
+            case_id = c.lastrowid
+            c.execute('''INSERT INTO warning_counts (guild_id, user_id, count) VALUES (?, ?, 1)
+                       ON CONFLICT (guild_id, user_id) DO UPDATE SET count = count + 1
+                       RETURNING count''', (guild_id, user_id))
+            total = c.fetchall()[0][0]
+            recent = []
+            if since is not None:
+                c.execute('''SELECT timestamp FROM warnings
+                           WHERE guild_id = ? AND user_id = ? AND timestamp >= ?''', (guild_id, user_id, since))
+                recent = [timestamp for (timestamp,) in c.fetchall()]
+            return case_id, total, recent
+        return await self.db.transaction(op)
+
+    async def count(self, guild_id, user_id):
+        row = await self.db.fetchone('SELECT count FROM warning_counts WHERE guild_id = ? AND user_id = ?',
+                                     (guild_id, user_id))
+        return row[0] if row else 0
+
+    async def page(self, guild_id, user_id, before=None, limit=5):
+        # Keyset pagination on the (guild_id, user_id, id) index: no OFFSET scan however deep the history
+        return await self.db.fetchall('''SELECT id, moderator_id, reason, timestamp FROM warnings
+                                      WHERE guild_id = ? AND user_id = ? AND id < ?
+                                      ORDER BY id DESC LIMIT ?''',
+                                      (guild_id, user_id, before if before is not None else 2 ** 63 - 1, limit))
+
+    async def remove(self, guild_id, case_id):
+        def op(c):
+            c.execute('DELETE FROM warnings WHERE id = ? AND guild_id = ? RETURNING user_id', (case_id, guild_id))
+            rows = c.fetchall()
+            if not rows:
+                return None
+            user_id = rows[0][0]
+            c.execute('UPDATE warning_counts SET count = count - 1 WHERE guild_id = ? AND user_id = ?',
+                      (guild_id, user_id))
+            return user_id
+        return await self.db.transaction(op)
+
+    async def escalation_rules(self):
+        return await self.db.fetchall('''SELECT guild_id, threshold, window_hours, action, duration_minutes
+                                      FROM escalation_rules''')
+
+    async def set_escalation_rule(self, guild_id, threshold, window_hours, action, duration_minutes):
+        await self.db.execute('''INSERT OR REPLACE INTO escalation_rules
+                              (guild_id, threshold, window_hours, action, duration_minutes)
+                              VALUES (?, ?, ?, ?, ?)''', (guild_id, threshold, window_hours, action, duration_minutes))
+
+    async def remove_escalation_rule(self, guild_id, threshold):
+        return await self.db.execute('DELETE FROM escalation_rules WHERE guild_id = ? AND threshold = ?',
+                                     (guild_id, threshold)) > 0
+
+class SQLiteAutomod(AutomodRepository):
+    def __init__(self, database):
+        self.db = database
+
+    async def log(self, rows):
+        await self.db.executemany('INSERT INTO automod_logs (guild_id, user_id, action, reason) VALUES (?, ?, ?, ?)',
+                                  rows)
+
+    async def words(self, guild_id):
+        rows = await self.db.fetchall('SELECT word FROM automod_words WHERE guild_id = ?', (guild_id,))
+        return {word for (word,) in rows}
+
+    async def add_word(self, guild_id, word):
+        await self.db.execute('INSERT OR IGNORE INTO automod_words (guild_id, word) VALUES (?, ?)', (guild_id, word))
+
+    async def remove_word(self, guild_id, word):
+        return bool(await self.db.execute('DELETE FROM automod_words WHERE guild_id = ? AND word = ?',
+                                          (guild_id, word)))
+
+    async def link_rules(self, guild_id):
+        return dict(await self.db.fetchall('SELECT domain, action FROM automod_links WHERE guild_id = ?',
+                                           (guild_id,)))
+
+    async def set_link_rule(self, guild_id, domain, action):
+        await self.db.execute('''INSERT INTO automod_links (guild_id, domain, action) VALUES (?, ?, ?)
+                              ON CONFLICT (guild_id, domain) DO UPDATE SET action = excluded.action''',
+                              (guild_id, domain, action))
+
+    async def remove_link_rule(self, guild_id, domain):
+        return bool(await self.db.execute('DELETE FROM automod_links WHERE guild_id = ? AND domain = ?',
+                                          (guild_id, domain)))
+
+class SQLiteReactionRoles(ReactionRoleRepository):
+    def __init__(self, database):
+        self.db = database
+
+    async def load_all(self):
+        return await self.db.fetchall('SELECT guild_id, message_id, emoji, role_id FROM reaction_roles')
+
+    async def for_guild(self, guild_id):
+        rows = await self.db.fetchall('SELECT message_id, emoji, role_id FROM reaction_roles WHERE guild_id = ?',
+                                      (guild_id,))
+        return {(message_id, emoji): role_id for message_id, emoji, role_id in rows}
+
+    async def add(self, guild_id, message_id, emoji, role_id):
+        await self.db.execute('''INSERT INTO reaction_roles (guild_id, message_id, emoji, role_id) VALUES (?, ?, ?, ?)
+                              ON CONFLICT (guild_id, message_id, emoji) DO UPDATE SET role_id = excluded.role_id''',
+                              (guild_id, message_id, emoji, role_id))
+
+    async def remove(self, guild_id, message_id, emoji):
+        return bool(await self.db.execute(
+            'DELETE FROM reaction_roles WHERE guild_id = ? AND message_id = ? AND emoji = ?',
+            (guild_id, message_id, emoji)))
+
+    async def remove_message(self, guild_id, message_id):
+        await self.db.execute('DELETE FROM reaction_roles WHERE guild_id = ? AND message_id = ?',
+                              (guild_id, message_id))
+
+class SQLiteStorage(Storage):
+    name = 'sqlite'
+    supports_backups = True
+
+    def __init__(self, path=DB_PATH):
+        self.db = Database(path)
+        self.guilds = SQLiteGuildConfigs(self.db)
+        self.users = SQLiteUsers(self.db)
+        self.economy = SQLiteEconomy(self.db)
+        self.warnings = SQLiteWarnings(self.db)
+        self.automod = SQLiteAutomod(self.db)
+        self.reaction_roles = SQLiteReactionRoles(self.db)
+
+    async def init(self):
+        await self.db.transaction(create_schema)
+
+    async def ping(self):
+        await self.db.fetchone('SELECT 1')
+
+    async def close(self):
+        await self.db.close()
+
+# In-memory engine
+class MemoryGuildConfigs(GuildConfigRepository):
+    def __init__(self, storage):
+        self.storage = storage
+        self._configs = {}
+
+    async def load_all(self):
+        return [replace(config) for config in self._configs.values()]
+
+    async def get_or_create(self, guild_id):
+        config = self._configs.get(guild_id)
+        if config is None:
+            config = self._configs[guild_id] = GuildConfig(guild_id)
+            await self.storage.automod.seed(guild_id)
+        return replace(config)
+
+    async def update(self, guild_id, values):
+        config = self._configs.get(guild_id)
+        if config is not None:
+            for key, value in values.items():
+                setattr(config, key, value)
+
+class MemoryUsers(UserRepository):
+    def __init__(self):
+        self._users = {}  # guild_id -> {user_id: UserStats}
+
+    async def get(self, guild_id, user_id):
+        stats = self._users.get(guild_id, {}).get(user_id)
+        return replace(stats) if stats else None
+
+    async def get_many(self, guild_id, user_ids):
+        users = self._users.get(guild_id, {})
+        return {user_id: replace(users[user_id]) for user_id in user_ids if user_id in users}
+
+    async def guild_xp(self, guild_id):
+        return [(user_id, stats.xp) for user_id, stats in self._users.get(guild_id, {}).items()]
+
+    async def save_xp(self, rows):
+        for guild_id, user_id, xp, level, coins in rows:
+            stats = self._users.setdefault(guild_id, {}).setdefault(user_id, UserStats())
+            stats.xp, stats.level = xp, level
+            stats.coins += coins
+
+class MemoryEconomy(EconomyRepository):
+    def __init__(self, users):
+        self._users = users._users
+        self.ledger = []
+        self.snapshots = []  # (taken_at, guild_id, user_id, coins)
+
+    async def claim_daily(self, guild_id, user_id, today, level=None):
+        users = self._users.setdefault(guild_id, {})
+        stats = users.get(user_id)
+        if stats is None:
+            stats = users[user_id] = UserStats(last_daily=today.isoformat())
+            return 100, stats.coins
+        if stats.last_daily is not None and stats.last_daily >= today.isoformat():
+            return None
+        reward = 50 + (level or stats.level) * 10
+        stats.coins += reward
+        stats.last_daily = today.isoformat()
+        return reward, stats.coins
+
+    async def adjust(self, guild_id, user_id, delta, minimum):
+        stats = self._users.get(guild_id, {}).get(user_id)
+        if stats is None or stats.coins < minimum:
+            return None
+        stats.coins += delta
+        return stats.coins
+
+    async def append_ledger(self, rows):
+        self.ledger.extend(rows)
+
+    async def snapshot(self, taken_at, keep_after):
+        rows = [(taken_at, guild_id, user_id, stats.coins)
+                for guild_id, users in self._users.items() for user_id, stats in users.items()]
+        self.snapshots = [row for row in self.snapshots if row[0] >= keep_after] + rows
+        return len(rows)
+
+class MemoryWarnings(WarningRepository):
+    def __init__(self):
+        self._cases = {}     # (guild_id, user_id) -> {case_id: (moderator_id, reason, timestamp)}, oldest first
+        self._owners = {}    # (guild_id, case_id) -> user_id
+        self._rules = {}     # guild_id -> {threshold: (window_hours, action, duration_minutes)}
+        self._next_id = 1
+
+    async def add(self, guild_id, user_id, moderator_id, reason, since=None):
+        case_id, self._next_id = self._next_id, self._next_id + 1
+        cases = self._cases.setdefault((guild_id, user_id), {})
+        cases[case_id] = (moderator_id, reason, datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'))
+        self._owners[(guild_id, case_id)] = user_id
+        recent = [timestamp for _, _, timestamp in cases.values() if since is not None and timestamp >= since]
+        return case_id, len(cases), recent
+
+    async def count(self, guild_id, user_id):
+        return len(self._cases.get((guild_id, user_id), ()))
+
+    async def page(self, guild_id, user_id, before=None, limit=5):
+        cases = self._cases.get((guild_id, user_id), {})
+        ids = [case_id for case_id in reversed(cases) if before is None or case_id < before][:limit]
+        return [(case_id, *cases[case_id]) for case_id in ids]
+
+    async def remove(self, guild_id, case_id):
+        user_id = self._owners.pop((guild_id, case_id), None)
+        if user_id is not None:
+            del self._cases[(guild_id, user_id)][case_id]
+        return user_id
+
+    async def escalation_rules(self):
+        return [(guild_id, threshold, *rule)
+                for guild_id, rules in self._rules.items() for threshold, rule in rules.items()]
+
+    async def set_escalation_rule(self, guild_id, threshold, window_hours, action, duration_minutes):
+        self._rules.setdefault(guild_id, {})[threshold] = (window_hours, action, duration_minutes)
+
+    async def remove_escalation_rule(self, guild_id, threshold):
+        return self._rules.get(guild_id, {}).pop(threshold, None) is not None
+
+class MemoryAutomod(AutomodRepository):
+    def __init__(self):
+        self.logs = []
+        self._words = {}
+        self._links = {}
+
+    async def seed(self, guild_id):
+        self._words.setdefault(guild_id, set()).update(DEFAULT_BAD_WORDS)
+
+    async def log(self, rows):
+        self.logs.extend(rows)
+
+    async def words(self, guild_id):
+        return set(self._words.get(guild_id, ()))
+
+    async def add_word(self, guild_id, word):
+        self._words.setdefault(guild_id, set()).add(word)
+
+    async def remove_word(self, guild_id, word):
+        words = self._words.get(guild_id, set())
+        removed = word in words
+        words.discard(word)
+        return removed
+
+    async def link_rules(self, guild_id):
+        return dict(self._links.get(guild_id, {}))
+
+    async def set_link_rule(self, guild_id, domain, action):
+        self._links.setdefault(guild_id, {})[domain] = action
+
+    async def remove_link_rule(self, guild_id, domain):
+        return self._links.get(guild_id, {}).pop(domain, None) is not None
+
+class MemoryReactionRoles(ReactionRoleRepository):
+    def __init__(self):
+        self._roles = {}
+
+    async def load_all(self):
+        return [(guild_id, message_id, emoji, role_id)
+                for guild_id, roles in self._roles.items() for (message_id, emoji), role_id in roles.items()]
+
+    async def for_guild(self, guild_id):
+        return dict(self._roles.get(guild_id, {}))
+
+    async def add(self, guild_id, message_id, emoji, role_id):
+        self._roles.setdefault(guild_id, {})[(message_id, emoji)] = role_id
+
+    async def remove(self, guild_id, message_id, emoji):
+        return self._roles.get(guild_id, {}).pop((message_id, emoji), None) is not None
+
+    async def remove_message(self, guild_id, message_id):
+        roles = self._roles.get(guild_id, {})
+        for key in [key for key in roles if key[0] == message_id]:
+            del roles[key]
+
+class MemoryStorage(Storage):
+    """Nothing survives a restart; for benchmarks and tests"""
+    name = 'memory'
+
+    def __init__(self):
+        self.guilds = MemoryGuildConfigs(self)
+        self.users = MemoryUsers()
+        self.economy = MemoryEconomy(self.users)
+        self.warnings = MemoryWarnings()
+        self.automod = MemoryAutomod()
+        self.reaction_roles = MemoryReactionRoles()
+
+STORAGE_ENGINES = {
+    'sqlite': SQLiteStorage,
+    'memory': MemoryStorage,
+}
+
+def create_storage(engine=STORAGE_ENGINE):
+    if engine not in STORAGE_ENGINES:
+        raise ValueError(f"Unknown storage engine {engine!r}; pick one of {', '.join(STORAGE_ENGINES)}")
+    return STORAGE_ENGINES[engine]()
+
+storage = create_storage()
+
+# Database backups
+BACKUP_DIR = os.getenv('AETHER_BACKUP_DIR', '.')
+BACKUP_PREFIX = 'backup_aether_'
+BACKUP_RETENTION = 7          # newest backups kept
+BACKUP_PAGES_PER_STEP = 1024  # pages copied before the backup yields to writers
+BACKUP_STEP_SLEEP = 0.005     # seconds
+BACKUP_COMPRESS = True
+
+def _check_integrity(conn):
+    result = conn.execute('PRAGMA integrity_check').fetchone()[0]
+    if result != 'ok':
+        raise sqlite3.DatabaseError(f"integrity check failed: {result}")
+
+def _write_backup(source_path, dest_path, compress):
+    """Runs in a worker thread: online backup, integrity check, then optional gzip"""
+    tmp_path = dest_path + '.tmp'
+    src = sqlite3.connect(source_path)
+    dst = sqlite3.connect(tmp_path)
+    try:
+        # Copies a step at a time so live writers only ever wait for one step
+        src.backup(dst, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP)
+        _check_integrity(dst)
+    except Exception:
+        dst.close()
+        os.remove(tmp_path)
+        raise
+    finally:
+        src.close()
+    dst.close()
+
+    if compress:
+        try:
+            with open(tmp_path, 'rb') as raw, gzip.open(dest_path + '.part', 'wb') as packed:
+                shutil.copyfileobj(raw, packed)
+        except Exception:
+            for leftover in (tmp_path, dest_path + '.part'):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            raise
+        os.remove(tmp_path)
+        os.replace(dest_path + '.part', dest_path)
+    else:
+        os.replace(tmp_path, dest_path)
+
+def list_backups():
+    """Backup file names, newest first"""
+    names = [name for name in os.listdir(BACKUP_DIR)
+             if name.startswith(BACKUP_PREFIX) and name.endswith(('.db', '.db.gz'))]
+    return sorted(names, key=lambda name: os.path.getmtime(os.path.join(BACKUP_DIR, name)), reverse=True)
+
+def _rotate_backups():
+    for name in list_backups()[BACKUP_RETENTION:]:
+        os.remove(os.path.join(BACKUP_DIR, name))
+
+def _require_backups():
+    if not storage.supports_backups:
+        raise RuntimeError(f"the {storage.name} storage engine doesn't support backups")
+
+async def create_backup(compress=BACKUP_COMPRESS):
+    """Take a consistent online backup without blocking the event loop; returns its file name"""
+    _require_backups()
+    await xp_buffer.flush()
+    await economy.flush()
+
+    name = f"{BACKUP_PREFIX}{datetime.now().strftime('%Y%m%d_%H%M%S')}.db{'.gz' if compress else ''}"
+    await asyncio.to_thread(_write_backup, storage.db.path, os.path.join(BACKUP_DIR, name), compress)
+    await asyncio.to_thread(_rotate_backups)
+    return name
+
+def _open_backup(path):
+    """Runs in a worker thread: unpack and verify a backup, returning a connection to it"""
+    if path.endswith('.gz'):
+        unpacked = path[:-3] + '.restore'
+        with gzip.open(path, 'rb') as packed, open(unpacked, 'wb') as raw:
+            shutil.copyfileobj(packed, raw)
+        path = unpacked
+
+    conn = sqlite3.connect(path, check_same_thread=False)
+    try:
+        _check_integrity(conn)
+    except Exception:
         conn.close()
-        return get_guild_config(guild_id)
+        raise
+    return conn, path
+
+async def restore_backup(name):
+    """Replace the live database with a backup and reload every cluster's in-memory caches.
+
+    Returns the ids of clusters that didn't confirm their reload.
+    """
+    _require_backups()
+    if name not in list_backups():
+        raise FileNotFoundError(name)
+
+    path = os.path.join(BACKUP_DIR, name)
+    src, opened_path = await asyncio.to_thread(_open_backup, path)
+    try:
+        await xp_buffer.flush()
+        await economy.flush()
+        await enforcer.flush(notices=False)
+        # The writer thread owns the live connection, so the copy happens there
+        await storage.db.run(lambda conn: src.backup(conn, pages=BACKUP_PAGES_PER_STEP))
+    finally:
+        src.close()
+        if opened_path != path:
+            os.remove(opened_path)
+
+    await storage.init()
+    await reset_caches()
+    # The other clusters share the database; their buffered XP and cached configs predate
+    # the restore and would otherwise be flushed over it
+    replies, missing = await cluster_link.request('reset_caches')
+    return sorted(missing + [reply['cluster'] for reply in replies if reply['error']])
+
+async def reset_caches():
+    xp_buffer.reset()
+    rank_index.reset()
+    blocklists.reset()
+    link_scanner.reset()
+    await load_guild_configs()
+    await load_escalation_rules()
+    await reaction_roles.load()
+
+# Bot setup
+# Cluster mode: cluster.py starts one process per cluster, each running a slice of the shards
+CLUSTER_ID = int(os.getenv('AETHER_CLUSTER_ID', 0))
+CLUSTER_COUNT = int(os.getenv('AETHER_CLUSTER_COUNT', 1))
+SHARD_COUNT = int(os.getenv('AETHER_SHARD_COUNT', 0)) or None
+SHARD_IDS = [int(shard) for shard in os.getenv('AETHER_SHARD_IDS', '').split(',') if shard] or None
+IPC_PORT = int(os.getenv('AETHER_IPC_PORT', 0))
+
+# Point the bot at a stand-in Discord (cluster.py --stand-in) for local testing
+if os.getenv('AETHER_API_BASE'):
+    discord.http.Route.BASE = os.getenv('AETHER_API_BASE')
+if os.getenv('AETHER_GATEWAY_URL'):
+    discord.gateway.DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(os.getenv('AETHER_GATEWAY_URL'))
+
+class AetherTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction):
+        interaction.extras['started'] = time.perf_counter()
+        return True
+
+    async def on_error(self, interaction, error):
+        observe_command(interaction, 'error')
+        await super().on_error(interaction, error)
+
+def observe_command(interaction, status):
+    started = interaction.extras.get('started')
+    if started is not None and interaction.command is not None:
+        command_duration.observe(time.perf_counter() - started, interaction.command.qualified_name, status)
+
+class AetherBotMixin:
+    async def _run_event(self, coro, event_name, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            await super()._run_event(coro, event_name, *args, **kwargs)
+        finally:
+            event_duration.observe(time.perf_counter() - start, event_name)
+
+    async def setup_hook(self):
+        # Runs once per process, unlike on_ready which fires again after every gateway reconnect
+        await run_startup()
+
+    async def close(self):
+        # Pending automod deletions still need the HTTP session, so they go first
+        await enforcer.flush(notices=False)
+        await super().close()
+        await stop_http_server()
+        await xp_buffer.flush()
+        await economy.flush()
+        if link_scanner.resolver:
+            await link_scanner.resolver.close()
+        await cluster_link.close()
+        await storage.close()
+
+class AetherBot(AetherBotMixin, commands.Bot):
+    pass
+
+class AetherShardedBot(AetherBotMixin, commands.AutoShardedBot):
+    pass
+
+# Lean mode derives intents and member caching from the features guilds actually use,
+# instead of caching every member and presence everywhere
+LEAN_MODE = os.getenv('AETHER_LEAN_MODE', '').lower() in ('1', 'true', 'yes')
+
+# Which gateway intent each toggleable feature depends on
+FEATURE_INTENTS = {
+    'welcome_enabled': 'members',
+    'automod_enabled': 'message_content',
+    'xp_enabled': 'message_content',
+    'presence_enabled': 'presences',
+}
+
+def feature_usage(path=DB_PATH):
+    """Whether any guild has each member-heavy feature on; read synchronously before the bot starts"""
+    usage = dict.fromkeys(FEATURE_INTENTS, True)
+    if STORAGE_ENGINE != 'sqlite' or not os.path.exists(path):
+        return usage
+
+    columns = ', '.join(f'MAX({feature})' for feature in FEATURE_INTENTS)
+    try:
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            row = conn.execute(f'SELECT {columns} FROM guild_configs').fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        # Older schema without the newer columns: assume everything is in use
+        return usage
+
+    if row[0] is None:
+        return usage
+    return {feature: bool(value) for feature, value in zip(FEATURE_INTENTS, row)}
+
+def build_client_options(lean=LEAN_MODE, usage=None):
+    if not lean:
+        return {'intents': discord.Intents.all()}
+
+    usage = feature_usage() if usage is None else usage
+    intents = discord.Intents.default()
+    intents.presences = usage['presence_enabled']
+    # Join events drive welcomes and raid detection; presence counts need the member list too
+    intents.members = usage['welcome_enabled'] or usage['automod_enabled'] or intents.presences
+    intents.message_content = usage['automod_enabled'] or usage['xp_enabled']
+
+    if intents.presences:
+        # Status counts are only right with every member cached
+        member_cache_flags = discord.MemberCacheFlags.from_intents(intents)
+        chunk_guilds = True
+    else:
+        member_cache_flags = discord.MemberCacheFlags.none()
+        chunk_guilds = False
 
     return {
-        'guild_id': result[0],
-        'logs_channel': result[1],
-        'welcome_channel': result[2],
-        'modlog_channel': result[3],
-        'automod_channel': result[4],
-        'xp_enabled': bool(result[5]),
-        'welcome_enabled': bool(result[6]),
-        'automod_enabled': bool(result[7]),
-        'economy_enabled': bool(result[8]),
-        'music_enabled': bool(result[9]),
-        'prefix': result[10]
+        'intents': intents,
+        'member_cache_flags': member_cache_flags,
+        'chunk_guilds_at_startup': chunk_guilds,
     }
 
-def update_guild_config(guild_id, **kwargs):
-    conn = get_db()
-    c = conn.cursor()
+def create_bot():
+    options = dict(build_client_options(), tree_cls=AetherTree, http_trace=http_trace)
+    if SHARD_COUNT:
+        return AetherShardedBot(command_prefix="!", help_command=None,
+                                shard_count=SHARD_COUNT, shard_ids=SHARD_IDS, **options)
+    return AetherBot(command_prefix="!", help_command=None, **options)
+
+bot = create_bot()
+
+def _gateway_latencies():
+    if isinstance(bot, commands.AutoShardedBot):
+        latencies = bot.latencies
+    else:
+        latencies = [(bot.shard_id or 0, bot.latency)]
+    # Latency is inf (or nan without a connection) until the first heartbeat is acknowledged
+    return {(shard_id,): latency for shard_id, latency in latencies if latency < float('inf')}
+
+metrics.gauge('aether_gateway_latency_seconds', 'Heartbeat round trip per shard', ('shard',),
+              collect=_gateway_latencies)
+
+OWNER_ID = 123456789012345678  # Replace with your Discord ID
+
+# Cluster IPC
+IPC_TIMEOUT = 30  # seconds the hub waits for every cluster to answer, unless a request asks for longer
+
+class ClusterLink:
+    """JSON-lines connection to the cluster.py hub, for operations that span every cluster.
+
+    request() asks every *other* cluster to run a handler and returns their answers;
+    callers do their own share locally, so a single process (no hub) behaves the same
+    with an empty list of remote replies.
+    """
+
+    def __init__(self, cluster_id, port, host='127.0.0.1'):
+        self.cluster_id = cluster_id
+        self.host = host
+        self.port = port
+        self._handlers = {}
+        self._pending = {}
+        self._next_id = 0
+        self._writer = None
+        self._listener = None
+
+    @property
+    def connected(self):
+        return self._writer is not None and not self._writer.is_closing()
+
+    def handler(self, op):
+        def decorator(fn):
+            self._handlers[op] = fn
+            return fn
+        return decorator
+
+    async def connect(self):
+        reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        await self._send({'type': 'hello', 'cluster': self.cluster_id})
+        self._listener = asyncio.create_task(self._listen(reader))
+
+    async def _send(self, payload):
+        self._writer.write(json.dumps(payload).encode() + b'\n')
+        await self._writer.drain()
+
+    async def _listen(self, reader):
+        writer = self._writer
+        try:
+            async for line in reader:
+                message = json.loads(line)
+                if message['type'] == 'request':
+                    asyncio.create_task(self._answer(message))
+                elif message['type'] == 'result':
+                    future = self._pending.pop(message['id'], None)
+                    if future and not future.done():
+                        future.set_result((message['replies'], message['missing']))
+        finally:
+            writer.close()
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError('cluster hub went away'))
+            self._pending.clear()
+
+    async def _answer(self, message):
+        reply = {'type': 'reply', 'id': message['id'], 'cluster': self.cluster_id, 'data': None, 'error': None}
+        handler = self._handlers.get(message['op'])
+        try:
+            if handler is None:
+                raise LookupError(f"no handler for {message['op']!r}")
+            reply['data'] = await handler(**message['data'])
+        except Exception as e:
+            reply['error'] = str(e)
+        await self._send(reply)
+
+    async def request(self, op, timeout=IPC_TIMEOUT, **data):
+        """Run op on every other cluster; returns (replies, missing cluster ids)"""
+        if not self.connected:
+            return [], []
+
+        self._next_id += 1
+        request_id = f'{self.cluster_id}:{self._next_id}'
+        future = self._pending[request_id] = asyncio.get_running_loop().create_future()
+        await self._send({'type': 'request', 'id': request_id, 'op': op, 'data': data, 'timeout': timeout})
+        try:
+            return await asyncio.wait_for(future, timeout + 5)
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def close(self):
+        if self._listener:
+            self._listener.cancel()
+            self._listener = None
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+
+cluster_link = ClusterLink(CLUSTER_ID, IPC_PORT)
+
+# Utility functions
+# Guild config cache
+@dataclass
+class GuildConfig:
+    guild_id: str
+    logs_channel: str = None
+    welcome_channel: str = None
+    modlog_channel: str = None
+    automod_channel: str = None
+    xp_enabled: bool = True
+    welcome_enabled: bool = True
+    automod_enabled: bool = True
+    economy_enabled: bool = True
+    music_enabled: bool = True
+    prefix: str = '!'
+    # Flood detection: flood_messages messages within flood_seconds is a strike,
+    # flood_strikes strikes in a row earn a timeout of flood_timeout seconds
+    flood_messages: int = 5
+    flood_seconds: float = 3.0
+    flood_strikes: int = 3
+    flood_timeout: int = 300
+    # Raid mode: raid_joins joins within raid_seconds pauses welcomes for raid_duration seconds;
+    # while it lasts, accounts younger than raid_min_account_age days (0 = off) get a raid_timeout
+    raid_joins: int = 10
+    raid_seconds: float = 10.0
+    raid_duration: int = 300
+    raid_min_account_age: int = 0
+    raid_timeout: int = 3600
+    announce_channel: str = None
+    presence_enabled: bool = True
+
+    @classmethod
+    def from_row(cls, row):
+        values = {}
+        for field, value in zip(fields(cls), row):
+            if value is not None and field.type in (bool, int, float):
+                value = field.type(value)
+            values[field.name] = value
+        return cls(**values)
+
+GUILD_CONFIG_COLUMNS = {f.name: f.type for f in fields(GuildConfig) if f.name != 'guild_id'}
+GUILD_CONFIG_SELECT = f"SELECT guild_id, {', '.join(GUILD_CONFIG_COLUMNS)} FROM guild_configs"
+
+# Process-wide cache; every write goes through update_guild_config so it never goes stale
+guild_configs = {}
+
+async def load_guild_configs():
+    """Load every stored guild config into the cache"""
+    configs = await storage.guilds.load_all()
+
+    guild_configs.clear()
+    for config in configs:
+        guild_configs[config.guild_id] = config
+
+async def get_guild_config(guild_id):
+    config = guild_configs.get(str(guild_id))
+    if cache_lookup('guild_config', config is not None):
+        return config
+
+    result = await storage.guilds.get_or_create(str(guild_id))
+
+    # Another caller may have filled the cache while we were waiting on the DB
+    config = guild_configs.setdefault(str(guild_id), result)
+    return config
+
+def parse_channel_id(value):
+    """A stored channel id as an int, or None if it's unset or not an id"""
+    try:
+        return int(value) if value else None
+    except (TypeError, ValueError):
+        return None
 
+async def update_guild_config(guild_id, **kwargs):
+    if not kwargs:
+        return
+
+    unknown = set(kwargs) - set(GUILD_CONFIG_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown config fields: {', '.join(sorted(unknown))}")
+
+    config = await get_guild_config(guild_id)
+    await storage.guilds.update(str(guild_id), kwargs)
+
+    # Write-through so the message hot path sees the change immediately
     for key, value in kwargs.items():
-        c.execute(f'UPDATE guild_configs SET {key} = ? WHERE guild_id = ?', (value, str(guild_id)))
+        if value is not None and GUILD_CONFIG_COLUMNS[key] in (bool, int, float):
+            value = GUILD_CONFIG_COLUMNS[key](value)
+        setattr(config, key, value)
+
+# Write-behind XP buffer
+XP_FLUSH_INTERVAL = 5  # seconds
+XP_BUFFER_MAX_USERS = 50000
+
+class XPAccumulator:
+    """Tracks XP for active users in memory and writes changes back in batches.
+
+    Level-ups are decided from the in-memory state as soon as XP is added; the database
+    only sees one executemany per flush instead of a write per message.
+    """
+
+    def __init__(self, users):
+        self.users = users
+        self._state = {}          # (guild_id, user_id) -> [xp, level]
+        self._pending_coins = {}  # (guild_id, user_id) -> coins earned since last flush
+        self._dirty = set()
+        self._lock = asyncio.Lock()
+        self._generation = 0      # bumped when a flush starts and again when it ends
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def _load(self, key):
+        guild_id, user_id = key
+        stats = await self.users.get(guild_id, user_id)
+        # Another message from the same user may have loaded the entry while we waited
+        return self._state.setdefault(key, [stats.xp, stats.level] if stats else [0, 1])
+
+    async def add(self, guild_id, user_id, xp_gain):
+        """Add XP and return (leveled_up, xp, level, coins_reward)"""
+        key = (str(guild_id), str(user_id))
+        entry = self._state.get(key)
+        if not cache_lookup('xp_state', entry is not None):
+            entry = await self._load(key)
+
+        entry[0] += xp_gain
+        xp, level = entry
+        self._dirty.add(key)
+        rank_index.update(key[0], key[1], xp)
+
+        # Check for level up
+        if xp >= level * 150 + 50:
+            level += 1
+            entry[1] = level
+            coins_reward = level * 50
+            self._pending_coins[key] = self._pending_coins.get(key, 0) + coins_reward
+            return True, xp, level, coins_reward
+
+        return False, xp, level, 0
+
+    def level(self, guild_id, user_id):
+        """The in-memory level, which can be ahead of the database; None if the user isn't loaded"""
+        entry = self._state.get((str(guild_id), str(user_id)))
+        return entry[1] if entry else None
+
+    def _overlay(self, key, stats):
+        entry = self._state.get(key)
+        if entry is None:
+            return stats
+        # A buffered user without a stored row gets one with the default balance on flush
+        stats = replace(stats) if stats else UserStats()
+        stats.xp, stats.level = entry
+        stats.coins += self._pending_coins.get(key, 0)
+        return stats
+
+    async def _read(self, read):
+        # A flush moves pending coins into the rows; a read it overlaps may or may not see
+        # them, so wait it out and read again rather than count them twice or not at all
+        while True:
+            await self._idle.wait()
+            generation = self._generation
+            result = await read()
+            if self._generation == generation:
+                return result
+
+    async def get(self, guild_id, user_id):
+        """Stored stats with unwritten XP, level and coins applied, without flushing"""
+        guild_id, user_id = str(guild_id), str(user_id)
+        stats = await self._read(lambda: self.users.get(guild_id, user_id))
+        return self._overlay((guild_id, user_id), stats)
+
+    async def get_many(self, guild_id, user_ids):
+        """Like get() for several users of one guild; users with no data are left out"""
+        guild_id = str(guild_id)
+        details = await self._read(lambda: self.users.get_many(guild_id, user_ids))
+        merged = {}
+        for user_id in user_ids:
+            stats = self._overlay((guild_id, user_id), details.get(user_id))
+            if stats:
+                merged[user_id] = stats
+        return merged
+
+    def guild_xp(self, guild_id):
+        """(user_id, xp) for every user of the guild held in memory"""
+        guild_id = str(guild_id)
+        return [(user_id, entry[0]) for (gid, user_id), entry in self._state.items() if gid == guild_id]
+
+    def has_pending_coins(self, guild_id, user_id):
+        return (str(guild_id), str(user_id)) in self._pending_coins
+
+    def is_dirty(self, guild_id, user_id):
+        return (str(guild_id), str(user_id)) in self._dirty
+
+    def reset(self):
+        """Forget everything, pending changes included"""
+        self._state.clear()
+        self._pending_coins.clear()
+        self._dirty.clear()
+
+    async def flush(self):
+        """Write all pending XP changes in one transaction"""
+        async with self._lock:
+            if not self._dirty:
+                return
+
+            dirty, self._dirty = self._dirty, set()
+            coins, self._pending_coins = self._pending_coins, {}
+            rows = []
+            for key in dirty:
+                guild_id, user_id = key
+                xp, level = self._state[key]
+                rows.append((guild_id, user_id, xp, level, coins.get(key, 0)))
+
+            self._generation += 1
+            self._idle.clear()
+            try:
+                await self.users.save_xp(rows)
+            except Exception:
+                # Put everything back so the next flush retries it
+                self._dirty |= dirty
+                for key, delta in coins.items():
+                    self._pending_coins[key] = self._pending_coins.get(key, 0) + delta
+                raise
+            finally:
+                self._generation += 1
+                self._idle.set()
+            economy.record_many([(guild_id, user_id, 'level_up', amount, None)
+                                 for (guild_id, user_id), amount in coins.items()])
+
+            if len(self._state) > XP_BUFFER_MAX_USERS:
+                for key in [key for key in self._state if key not in self._dirty]:
+                    del self._state[key]
+
+xp_buffer = XPAccumulator(storage.users)
+
+# Economy
+ECONOMY_LEDGER_INTERVAL = 5          # seconds between ledger writes
+ECONOMY_SNAPSHOT_INTERVAL = 1        # hours between balance snapshots
+ECONOMY_SNAPSHOT_RETENTION = timedelta(days=30)
+
+def _db_timestamp(when=None):
+    return (when or datetime.utcnow()).strftime('%Y-%m-%d %H:%M:%S')
+
+class EconomyEngine:
+    """Every coin movement goes through here.
+
+    Checks and mutations happen in one conditional write, so a balance is never read in one
+    step and changed in another. Each movement is also queued for the append-only ledger,
+    which is written in batches; the balance itself is always committed first.
+    """
+
+    def __init__(self, economy):
+        self.economy = economy
+        self._ledger = []
+        self._lock = asyncio.Lock()
+
+    def record_many(self, rows):
+        """Queue (guild_id, user_id, kind, amount, balance) ledger rows"""
+        now = _db_timestamp()
+        self._ledger.extend((*row, now) for row in rows)
+
+    async def _settle_xp(self, guild_id, user_id, level=False):
+        # Level-up coins wait in the XP buffer; only write them out when this user has some.
+        # The daily reward also needs the level, and a user with no stored row yet has it
+        # only in the buffer
+        if xp_buffer.has_pending_coins(guild_id, user_id) or (level and xp_buffer.is_dirty(guild_id, user_id)):
+            await xp_buffer.flush()
+
+    async def balance(self, guild_id, user_id):
+        await self._settle_xp(guild_id, user_id)
+        stats = await storage.users.get(str(guild_id), str(user_id))
+        return stats.coins if stats else 0
+
+    async def claim_daily(self, guild_id, user_id, today):
+        """Returns (reward, balance), or None if today's reward was already claimed"""
+        guild_id, user_id = str(guild_id), str(user_id)
+        await self._settle_xp(guild_id, user_id, level=True)
+        result = await self.economy.claim_daily(guild_id, user_id, today, xp_buffer.level(guild_id, user_id))
+        if result:
+            self.record_many([(guild_id, user_id, 'daily', *result)])
+        return result
+
+    async def settle_bet(self, guild_id, user_id, stake, delta):
+        """Apply a bet's outcome if the balance covers the stake; returns the new balance or None"""
+        guild_id, user_id = str(guild_id), str(user_id)
+        await self._settle_xp(guild_id, user_id)
+        balance = await self.economy.adjust(guild_id, user_id, delta, stake)
+        if balance is not None:
+            self.record_many([(guild_id, user_id, 'gamble', delta, balance)])
+        return balance
+
+    async def flush(self):
+        """Write queued ledger rows in one batch"""
+        async with self._lock:
+            if not self._ledger:
+                return
+            rows, self._ledger = self._ledger, []
+            try:
+                await self.economy.append_ledger(rows)
+            except Exception:
+                self._ledger[:0] = rows
+                raise
+
+    async def snapshot(self):
+        """Copy every balance into balance_snapshots; returns how many were copied"""
+        now = datetime.utcnow()
+        await xp_buffer.flush()
+        await self.flush()
+        return await self.economy.snapshot(_db_timestamp(now), _db_timestamp(now - ECONOMY_SNAPSHOT_RETENTION))
+
+economy = EconomyEngine(storage.economy)
+
+# Ranking index
+class _TreapNode:
+    __slots__ = ('key', 'priority', 'left', 'right', 'size')
+
+    def __init__(self, key):
+        self.key = key
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+        self.size = 1
+
+def _size(node):
+    return node.size if node else 0
+
+def _resize(node):
+    node.size = 1 + _size(node.left) + _size(node.right)
+
+def _split(node, key):
+    """Split into (keys < key, keys >= key)"""
+    if node is None:
+        return None, None
+    if node.key < key:
+        node.right, right = _split(node.right, key)
+        _resize(node)
+        return node, right
+    left, node.left = _split(node.left, key)
+    _resize(node)
+    return left, node
+
+def _merge(left, right):
+    if left is None or right is None:
+        return left or right
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        _resize(left)
+        return left
+    right.left = _merge(left, right.left)
+    _resize(right)
+    return right
+
+def _insert(node, new):
+    if node is None:
+        return new
+    if new.priority > node.priority:
+        new.left, new.right = _split(node, new.key)
+        _resize(new)
+        return new
+    if new.key < node.key:
+        node.left = _insert(node.left, new)
+    else:
+        node.right = _insert(node.right, new)
+    _resize(node)
+    return node
+
+def _remove(node, key):
+    if node is None:
+        return None
+    if key == node.key:
+        return _merge(node.left, node.right)
+    if key < node.key:
+        node.left = _remove(node.left, key)
+    else:
+        node.right = _remove(node.right, key)
+    _resize(node)
+    return node
+
+class OrderStatisticTree:
+    """Randomized balanced BST (treap) with subtree sizes.
+
+    insert/remove/count_less are O(log n); slice(offset, k) is O(log n + k).
+    """
+
+    def __init__(self):
+        self._root = None
+
+    def __len__(self):
+        return _size(self._root)
 
-    conn.commit()
-    conn.close()
+    def insert(self, key):
+        self._root = _insert(self._root, _TreapNode(key))
+
+    def remove(self, key):
+        self._root = _remove(self._root, key)
+
+    def count_less(self, key):
+        count, node = 0, self._root
+        while node:
+            if node.key < key:
+                count += _size(node.left) + 1
+                node = node.right
+            else:
+                node = node.left
+        return count
+
+    def slice(self, offset, limit):
+        # Walk down to the offset-th key, stacking every node still to be visited in order
+        stack, node = [], self._root
+        while node:
+            left = _size(node.left)
+            if offset < left:
+                stack.append(node)
+                node = node.left
+            elif offset == left:
+                stack.append(node)
+                break
+            else:
+                offset -= left + 1
+                node = node.right
+
+        keys = []
+        while stack and len(keys) < limit:
+            node = stack.pop()
+            keys.append(node.key)
+            node = node.right
+            while node:
+                stack.append(node)
+                node = node.left
+        return keys
+
+class GuildRanking:
+    """XP ordering of one guild; keys are (-xp, user_id) so the tree's order is rank order"""
+
+    def __init__(self):
+        self.tree = OrderStatisticTree()
+        self.xp = {}
+
+    def __len__(self):
+        return len(self.xp)
+
+    def set(self, user_id, xp):
+        old = self.xp.get(user_id)
+        if old == xp:
+            return
+        if old is not None:
+            self.tree.remove((-old, user_id))
+        self.tree.insert((-xp, user_id))
+        self.xp[user_id] = xp
+
+    def rank_of_xp(self, xp):
+        """1 + number of users with strictly more XP, matching the old COUNT(*) + 1 query"""
+        return self.tree.count_less((-xp, '')) + 1
+
+    def page(self, offset, limit):
+        return [(user_id, -neg_xp) for neg_xp, user_id in self.tree.slice(offset, limit)]
+
+class RankIndex:
+    """Per-guild in-memory rankings, loaded lazily and kept in sync by the XP buffer"""
+
+    def __init__(self, users):
+        self.users = users
+        self._guilds = {}
+        self._loading = {}
+
+    def reset(self):
+        self._guilds.clear()
+        self._loading.clear()
+
+    def update(self, guild_id, user_id, xp):
+        ranking = self._guilds.get(str(guild_id))
+        if ranking is not None:
+            ranking.set(str(user_id), xp)
+
+    def setdefault(self, guild_id, user_id, xp):
+        ranking = self._guilds.get(str(guild_id))
+        if ranking is not None and str(user_id) not in ranking.xp:
+            ranking.set(str(user_id), xp)
+
+    async def get(self, guild_id):
+        guild_id = str(guild_id)
+        task = self._loading.get(guild_id)
+        if not cache_lookup('rank_index', task is None and guild_id in self._guilds):
+            if task is None:
+                task = self._loading[guild_id] = asyncio.ensure_future(self._load(guild_id))
+                task.add_done_callback(lambda done: self._loaded(guild_id, done))
+            # Shielded so one cancelled caller doesn't abort the load for everyone waiting on it
+            return await asyncio.shield(task)
+        return self._guilds[guild_id]
+
+    def _loaded(self, guild_id, task):
+        if self._loading.get(guild_id) is task:
+            del self._loading[guild_id]
+        if not task.cancelled():
+            task.exception()  # retrieved here in case every caller was cancelled
+
+    async def _load(self, guild_id):
+        # Register first so XP gains that land while we read are kept; they are newer than the rows
+        ranking = self._guilds[guild_id] = GuildRanking()
+        try:
+            rows = await self.users.guild_xp(guild_id)
+        except BaseException:
+            # Never leave a half-loaded ranking behind, not even when cancelled
+            if self._guilds.get(guild_id) is ranking:
+                del self._guilds[guild_id]
+            raise
+
+        for user_id, xp in rows:
+            if user_id not in ranking.xp:
+                ranking.set(user_id, xp)
+        # The buffer holds XP that hasn't been written yet
+        for user_id, xp in xp_buffer.guild_xp(guild_id):
+            ranking.set(user_id, xp)
+        return ranking
+
+rank_index = RankIndex(storage.users)
 
 # Advanced security functions
 def is_spam(message):
@@ -158,31 +2014,741 @@ def is_spam(message):
 
     return False
 
-def contains_bad_words(text):
-    """Basic profanity filter"""
-    bad_words = ['spam', 'scam', 'hack', 'free nitro', 'discord.gg/', 'bit.ly']
-    return any(word in text.lower() for word in bad_words)
+# Flood detection
+FLOOD_MAX_TRACKED = 100000
+FLOOD_IDLE_SECONDS = 600
+
+class FloodTracker:
+    """Sliding-window message rate per (guild, channel, user) with bounded memory.
+
+    Each window is a deque capped at the guild's message threshold, so checking it is O(1):
+    the window is flooded when it is full and its oldest entry is still inside the time span.
+    Entries live in LRU order and are dropped once idle or when the tracker is full.
+    """
+
+    def __init__(self, max_tracked=FLOOD_MAX_TRACKED, idle_seconds=FLOOD_IDLE_SECONDS):
+        self.max_tracked = max_tracked
+        self.idle_seconds = idle_seconds
+        self._windows = OrderedDict()  # (guild_id, channel_id, user_id) -> deque of timestamps
+        self._strikes = OrderedDict()  # (guild_id, user_id) -> [strikes, last strike time]
+
+    def _evict(self, entries, now, last_seen):
+        while entries:
+            value = next(iter(entries.values()))
+            if len(entries) <= self.max_tracked and now - last_seen(value) < self.idle_seconds:
+                break
+            entries.popitem(last=False)
+
+    def hit(self, guild_id, channel_id, user_id, limit, per, now=None):
+        """Record a message and return True if it pushes the user over limit messages per seconds"""
+        now = time.monotonic() if now is None else now
+        key = (guild_id, channel_id, user_id)
+
+        window = self._windows.get(key)
+        if window is None or window.maxlen != limit:
+            window = self._windows[key] = deque(window or (), maxlen=limit)
+        else:
+            self._windows.move_to_end(key)
+
+        window.append(now)
+        self._evict(self._windows, now, lambda w: w[-1])
+        return len(window) == limit and now - window[0] <= per
+
+    def strike(self, guild_id, user_id, now=None):
+        """Count a flood strike and return how many the user has collected while active"""
+        now = time.monotonic() if now is None else now
+        key = (guild_id, user_id)
+
+        entry = self._strikes.pop(key, None)
+        if entry is None or now - entry[1] >= self.idle_seconds:
+            entry = [0, now]
+        entry[0] += 1
+        entry[1] = now
+        self._strikes[key] = entry
+
+        self._evict(self._strikes, now, lambda e: e[1])
+        return entry[0]
+
+    def reset(self, guild_id, user_id):
+        self._strikes.pop((guild_id, user_id), None)
+
+flood_tracker = FloodTracker()
+
+# Duplicate content detection
+DUPLICATE_HISTORY = 8          # fingerprints remembered per user
+DUPLICATE_MAX_USERS = 50000
+DUPLICATE_WINDOW = 60          # seconds
+DUPLICATE_REPEATS = 3          # same content this many times in the window...
+DUPLICATE_CHANNELS = 3         # ...or in this many different channels
+DUPLICATE_MIN_LENGTH = 8       # ignore short chatter like "lol" or "gm"
+
+_WHITESPACE = re.compile(r'\s+')
+
+def fingerprint(message):
+    """Hash of the normalized text plus attachment identities, or None for trivial messages"""
+    text = _WHITESPACE.sub(' ', normalize_text(message.content)).strip()
+    if len(text) < DUPLICATE_MIN_LENGTH and not message.attachments:
+        return None
+
+    digest = hashlib.blake2b(text.encode(), digest_size=8)
+    for attachment in message.attachments:
+        # Discord doesn't give us content hashes; name + size identifies a re-upload well enough
+        digest.update(f'\0{attachment.filename}:{attachment.size}'.encode())
+    return digest.digest()
+
+class DuplicateTracker:
+    """Remembers each user's last few message fingerprints in a fixed-size ring buffer.
+
+    Users are kept in LRU order and capped, so memory is bounded; each check scans one
+    buffer of DUPLICATE_HISTORY entries, which is constant work per message.
+    """
+
+    def __init__(self, max_users=DUPLICATE_MAX_USERS):
+        self.max_users = max_users
+        self._history = OrderedDict()  # (guild_id, user_id) -> deque of (fingerprint, channel_id, time)
+
+    def check(self, guild_id, user_id, channel_id, digest, now=None):
+        """Record a fingerprint; return 'repeated', 'cross_channel' or None"""
+        now = time.monotonic() if now is None else now
+        key = (guild_id, user_id)
+
+        history = self._history.get(key)
+        if history is None:
+            history = self._history[key] = deque(maxlen=DUPLICATE_HISTORY)
+            if len(self._history) > self.max_users:
+                self._history.popitem(last=False)
+        else:
+            self._history.move_to_end(key)
+
+        history.append((digest, channel_id, now))
+
+        repeats = 0
+        channels = set()
+        for seen, seen_channel, seen_at in history:
+            if seen == digest and now - seen_at <= DUPLICATE_WINDOW:
+                repeats += 1
+                channels.add(seen_channel)
+
+        if len(channels) >= DUPLICATE_CHANNELS:
+            return 'cross_channel'
+        if repeats >= DUPLICATE_REPEATS:
+            return 'repeated'
+        return None
+
+duplicate_tracker = DuplicateTracker()
+
+# Join burst detection
+WELCOME_BATCH_WINDOW = 3  # seconds to gather joins into one welcome
+WELCOME_MAX_MENTIONS = 20
+
+class JoinMonitor:
+    """Per-guild join rate; a burst above the guild's threshold switches it into raid mode"""
+
+    def __init__(self):
+        self._joins = {}       # guild_id -> deque of join times
+        self._raid_until = {}  # guild_id -> time raid mode ends
+
+    def record(self, guild_id, limit, per, duration, now=None):
+        """Record a join; return True if raid mode has just started"""
+        now = time.monotonic() if now is None else now
+
+        joins = self._joins.get(guild_id)
+        if joins is None or joins.maxlen != limit:
+            joins = self._joins[guild_id] = deque(joins or (), maxlen=limit)
+        joins.append(now)
+
+        was_raided = self.in_raid(guild_id, now)
+        if len(joins) == limit and now - joins[0] <= per:
+            self._raid_until[guild_id] = now + duration
+        elif was_raided:
+            # Joins keep trickling in during a raid; keep the guild locked down
+            self._raid_until[guild_id] = max(self._raid_until[guild_id], now + duration)
+        return not was_raided and self.in_raid(guild_id, now)
+
+    def in_raid(self, guild_id, now=None):
+        until = self._raid_until.get(guild_id)
+        if until is None:
+            return False
+        if (time.monotonic() if now is None else now) >= until:
+            del self._raid_until[guild_id]
+            return False
+        return True
+
+    def end_raid(self, guild_id):
+        return self._raid_until.pop(guild_id, None) is not None
+
+class WelcomeBatcher:
+    """Gathers members joining within WELCOME_BATCH_WINDOW into one welcome message per guild"""
+
+    def __init__(self):
+        self._pending = {}  # guild_id -> [members]
+        self._tasks = set()  # the loop only keeps weak references to tasks
+
+    def add(self, member, channel):
+        pending = self._pending.get(member.guild.id)
+        if pending is None:
+            pending = self._pending[member.guild.id] = []
+            asyncio.get_running_loop().call_later(WELCOME_BATCH_WINDOW, self._start_send, member.guild, channel)
+        pending.append(member)
+
+    def _start_send(self, guild, channel):
+        task = asyncio.ensure_future(self._send(guild, channel))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def cancel(self, guild_id):
+        self._pending.pop(guild_id, None)
+
+    async def _send(self, guild, channel):
+        members = self._pending.pop(guild.id, None)
+        if not members:
+            return
+
+        if len(members) == 1:
+            member = members[0]
+            embed = Embed(
+                title="🎉 Welcome to the server!",
+                description=f"Hey {member.mention}! Welcome to **{guild.name}**",
+                color=0x00ff88
+            )
+            embed.set_thumbnail(url=member.display_avatar.url)
+            embed.add_field(name="👤 Member Count", value=f"You are member #{guild.member_count}", inline=False)
+        else:
+            mentions = [member.mention for member in members[:WELCOME_MAX_MENTIONS]]
+            if len(members) > WELCOME_MAX_MENTIONS:
+                mentions.append(f"{len(members) - WELCOME_MAX_MENTIONS} others")
+            names = ", ".join(mentions[:-1]) + f" and {mentions[-1]}"
+            embed = Embed(
+                title="🎉 Welcome to the server!",
+                description=f"Hey {names}! Welcome to **{guild.name}**",
+                color=0x00ff88
+            )
+            embed.add_field(name="👤 Member Count", value=f"We're now **{guild.member_count}** members", inline=False)
+
+        embed.set_footer(text=f"Joined • {datetime.now().strftime('%Y-%m-%d %H:%M')}")
+        try:
+            await channel.send(embed=embed)
+        except discord.HTTPException:
+            pass
+
+join_monitor = JoinMonitor()
+welcome_batcher = WelcomeBatcher()
+
+# Member status counters
+SERVERINFO_CACHE_SECONDS = 30
+
+STATUS_BUCKETS = {
+    discord.Status.online: 'online',
+    discord.Status.idle: 'idle',
+    discord.Status.dnd: 'dnd',
+}
+
+def _status_bucket(member):
+    return STATUS_BUCKETS.get(member.status, 'offline')
+
+class PresenceCounters:
+    """Per-guild member counts by status, kept current from gateway events.
+
+    A full scan only happens when a guild is first seen (reconcile); after that every
+    join, leave and presence change is a single increment or decrement.
+    """
+
+    def __init__(self):
+        self._counts = {}  # guild_id -> {'online': n, 'idle': n, 'dnd': n, 'offline': n}
+
+    def reconcile(self, guild):
+        counts = dict.fromkeys(('online', 'idle', 'dnd', 'offline'), 0)
+        for member in guild.members:
+            counts[_status_bucket(member)] += 1
+        self._counts[guild.id] = counts
+        return counts
+
+    def get(self, guild):
+        counts = self._counts.get(guild.id)
+        return counts if counts is not None else self.reconcile(guild)
+
+    def _adjust(self, member, bucket, delta):
+        counts = self._counts.get(member.guild.id)
+        if counts is not None:
+            counts[bucket] = max(0, counts[bucket] + delta)
+
+    def joined(self, member):
+        self._adjust(member, _status_bucket(member), 1)
+
+    def left(self, member):
+        self._adjust(member, _status_bucket(member), -1)
+
+    def changed(self, before, after):
+        old, new = _status_bucket(before), _status_bucket(after)
+        if old != new:
+            self._adjust(after, old, -1)
+            self._adjust(after, new, 1)
+
+    def forget(self, guild_id):
+        self._counts.pop(guild_id, None)
+
+presence_counters = PresenceCounters()
+serverinfo_cache = {}  # guild_id -> (expires at, embed)
+
+# Automod word matching
+DEFAULT_BAD_WORDS = ['spam', 'scam', 'hack', 'free nitro', 'discord.gg/', 'bit.ly']
+
+_NORMALIZE_TABLE = str.maketrans({
+    # Zero-width and invisible characters used to split words
+    '\u00ad': None, '\u200b': None, '\u200c': None, '\u200d': None, '\u2060': None, '\ufeff': None,
+    # Common leetspeak
+    '0': 'o', '1': 'i', '!': 'i', '3': 'e', '4': 'a', '@': 'a', '5': 's', '$': 's', '7': 't', '8': 'b',
+})
+
+def normalize_text(text):
+    """Casefold, drop zero-width characters and undo common leetspeak"""
+    return text.casefold().translate(_NORMALIZE_TABLE)
+
+def seed_blocklist(c, guild_id):
+    c.executemany('INSERT OR IGNORE INTO automod_words (guild_id, word) VALUES (?, ?)',
+                  [(guild_id, word) for word in DEFAULT_BAD_WORDS])
+
+class AhoCorasick:
+    """Multi-pattern substring matcher; search is linear in the text no matter how many words"""
+
+    def __init__(self, words):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [None]
+
+        for word in words:
+            node = 0
+            for ch in word:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(None)
+                node = nxt
+            if word:
+                self._output[node] = word
+
+        # Breadth-first pass to wire failure links; each node inherits the nearest match on its fail chain
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for ch, nxt in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                if self._output[nxt] is None:
+                    self._output[nxt] = self._output[self._fail[nxt]]
+                queue.append(nxt)
+
+    def search(self, text):
+        """Return the first blocked word found in text, or None"""
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if output[node] is not None:
+                return output[node]
+        return None
+
+class BlocklistCache:
+    """Per-guild word lists and their compiled matchers, rebuilt only when a list changes"""
+
+    def __init__(self, automod):
+        self.automod = automod
+        self._words = {}
+        self._matchers = {}
+
+    def reset(self):
+        self._words.clear()
+        self._matchers.clear()
+
+    async def words(self, guild_id):
+        guild_id = str(guild_id)
+        if guild_id not in self._words:
+            self._words.setdefault(guild_id, await self.automod.words(guild_id))
+        return self._words[guild_id]
+
+    async def matcher(self, guild_id):
+        matcher = self._matchers.get(str(guild_id))
+        if not cache_lookup('blocklist_matcher', matcher is not None):
+            words = await self.words(guild_id)
+            matcher = self._matchers[str(guild_id)] = AhoCorasick(normalize_text(word) for word in words)
+        return matcher
+
+    async def add(self, guild_id, word):
+        words = await self.words(guild_id)
+        await self.automod.add_word(str(guild_id), word)
+        words.add(word)
+        self._matchers.pop(str(guild_id), None)
+
+    async def remove(self, guild_id, word):
+        words = await self.words(guild_id)
+        removed = await self.automod.remove_word(str(guild_id), word)
+        words.discard(word)
+        self._matchers.pop(str(guild_id), None)
+        return removed
+
+blocklists = BlocklistCache(storage.automod)
+
+async def contains_bad_words(guild_id, text):
+    """Profanity filter using the guild's blocklist"""
+    matcher = await blocklists.matcher(guild_id)
+    return matcher.search(normalize_text(text)) is not None
+
+# Link scanning
+URL_PATTERN = re.compile(
+    r'(?:https?://)?(?:[^\s/@:<>]+@)?((?:[a-z0-9\u00a1-\uffff-]+\.)+[a-z\u00a1-\uffff]{2,}\.?)(?::\d+)?(/[^\s<>]*)?',
+    re.IGNORECASE
+)
+INVITE_HOSTS = {'discord.gg', 'discord.io', 'discord.me'}
+INVITE_PATH_HOSTS = {'discord.com', 'discordapp.com'}  # only /invite/... links
+SHORTENER_HOSTS = {'bit.ly', 'tinyurl.com', 't.co', 'goo.gl', 'is.gd', 'cutt.ly', 'rb.gy', 'ow.ly', 'buff.ly'}
+LINK_VERDICT_CACHE = 4096
+
+def normalize_host(host):
+    host = host.lower().rstrip('.')
+    if host.startswith('www.'):
+        host = host[4:]
+    try:
+        return host.encode('idna').decode('ascii')
+    except UnicodeError:
+        return host
+
+def extract_links(text):
+    """One pass over the text; returns [(host, path)] with invite links folded onto discord.gg"""
+    links = []
+    for match in URL_PATTERN.finditer(text):
+        host, path = normalize_host(match.group(1)), match.group(2) or ''
+        if host in INVITE_HOSTS or host in INVITE_PATH_HOSTS and path.startswith('/invite/'):
+            host = 'discord.gg'
+        links.append((host, path))
+    return links
+
+class DomainSuffixTrie:
+    """Domains stored by reversed labels, so an entry for evil.example also covers every subdomain.
+
+    Lookups walk one label at a time and return the most specific entry, O(labels).
+    """
+
+    def __init__(self):
+        self._root = {}
+
+    def add(self, domain, value):
+        node = self._root
+        for label in reversed(domain.split('.')):
+            node = node.setdefault(label, {})
+        node[None] = value
+
+    def match(self, host):
+        node, found = self._root, None
+        for label in reversed(host.split('.')):
+            node = node.get(label)
+            if node is None:
+                break
+            found = node.get(None, found)
+        return found
+
+class LRUCache:
+    def __init__(self, maxsize, name=None):
+        self.maxsize = maxsize
+        self.name = name
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        hit = key in self._data
+        if self.name:
+            cache_lookup(self.name, hit)
+        if not hit:
+            return default
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+class ShortenerResolver:
+    """Expands shortened links; subclasses decide how. This base expands nothing."""
+
+    async def resolve(self, url):
+        """The link url redirects to, or None to check it as written"""
+        return None
+
+    async def close(self):
+        pass
+
+class StaticShortenerResolver(ShortenerResolver):
+    """Resolves from a fixed mapping, for tests and benchmarks that must not touch the network"""
+
+    def __init__(self, mapping):
+        self.mapping = mapping
+
+    async def resolve(self, url):
+        return self.mapping.get(url)
+
+class HTTPShortenerResolver(ShortenerResolver):
+    """Reads the redirect target with a HEAD request, without following it"""
+
+    def __init__(self, timeout=3):
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._session = None
+
+    async def resolve(self, url):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=self.timeout)
+        try:
+            async with self._session.head(url, allow_redirects=False) as resp:
+                return resp.headers.get('Location')
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+class LinkScanner:
+    """Checks links against per-guild allow/deny suffix tries, caching verdicts per host"""
+
+    def __init__(self, automod, resolver=None):
+        self.automod = automod
+        self.resolver = resolver
+        self._entries = {}   # guild_id -> {domain: action}
+        self._tries = {}     # guild_id -> DomainSuffixTrie
+        self._verdicts = {}  # guild_id -> LRUCache of host -> action
+        self._expanded = LRUCache(LINK_VERDICT_CACHE, 'link_expansions')
+
+    async def entries(self, guild_id):
+        guild_id = str(guild_id)
+        if guild_id not in self._entries:
+            self._entries.setdefault(guild_id, await self.automod.link_rules(guild_id))
+        return self._entries[guild_id]
+
+    async def _trie(self, guild_id):
+        trie = self._tries.get(guild_id)
+        if trie is None:
+            trie = DomainSuffixTrie()
+            for domain, action in (await self.entries(guild_id)).items():
+                trie.add(domain, action)
+            self._tries[guild_id] = trie
+            self._verdicts[guild_id] = LRUCache(LINK_VERDICT_CACHE, 'link_verdicts')
+        return trie
+
+    def reset(self):
+        self._entries.clear()
+        self._tries.clear()
+        self._verdicts.clear()
+        self._expanded.clear()
+
+    def _invalidate(self, guild_id):
+        self._tries.pop(guild_id, None)
+        self._verdicts.pop(guild_id, None)
+
+    async def set(self, guild_id, domain, action):
+        guild_id = str(guild_id)
+        entries = await self.entries(guild_id)
+        await self.automod.set_link_rule(guild_id, domain, action)
+        entries[domain] = action
+        self._invalidate(guild_id)
+
+    async def remove(self, guild_id, domain):
+        guild_id = str(guild_id)
+        entries = await self.entries(guild_id)
+        removed = await self.automod.remove_link_rule(guild_id, domain)
+        entries.pop(domain, None)
+        self._invalidate(guild_id)
+        return removed
+
+    async def verdict(self, guild_id, host):
+        guild_id = str(guild_id)
+        trie = await self._trie(guild_id)
+        cache = self._verdicts[guild_id]
+        verdict = cache.get(host, False)
+        if verdict is False:
+            verdict = trie.match(host)
+            cache.put(host, verdict)
+        return verdict
+
+    async def _expand(self, host, path):
+        url = f'https://{host}{path}'
+        expanded = self._expanded.get(url, False)
+        if expanded is False:
+            target = await self.resolver.resolve(url)
+            match = URL_PATTERN.search(target) if target else None
+            expanded = normalize_host(match.group(1)) if match else None
+            self._expanded.put(url, expanded)
+        return expanded
+
+    async def scan(self, guild_id, text):
+        """Return the first denied host linked from text, or None"""
+        if not await self.entries(guild_id):
+            return None
+
+        for host, path in extract_links(text):
+            verdict = await self.verdict(guild_id, host)
+            if verdict == 'deny':
+                return host
+            if verdict is None and host in SHORTENER_HOSTS and self.resolver and path.strip('/'):
+                target = await self._expand(host, path)
+                if target and await self.verdict(guild_id, target) == 'deny':
+                    return target
+        return None
+
+link_scanner = LinkScanner(storage.automod, HTTPShortenerResolver())
+
+# Startup
+class StartupTimer:
+    """Seconds from process start to each startup milestone"""
+
+    def __init__(self, started):
+        self.started = started
+        self.marks = {}
+
+    def mark(self, phase):
+        self.marks.setdefault(phase, time.perf_counter() - self.started)
+
+    def report(self):
+        steps, previous = [], 0.0
+        for phase, at in self.marks.items():
+            steps.append(f"{phase} +{at - previous:.2f}s")
+            previous = at
+        return f"⏱️ Ready {previous:.2f}s after start: " + ' → '.join(steps)
+
+startup = StartupTimer(PROCESS_STARTED)
+metrics.gauge('aether_startup_seconds', 'Seconds from process start to each startup milestone', ('phase',),
+              collect=lambda: {(phase,): at for phase, at in startup.marks.items()})
+
+# Command sync
+# Global sync is a slow, heavily rate-limited call, so it only happens when the tree changed.
+# AETHER_SYNC_GUILD syncs to one test guild instead, where updates show up immediately
+SYNC_STATE_PATH = os.getenv('AETHER_SYNC_STATE', os.path.join(os.path.dirname(DB_PATH), 'command_sync.json'))
+SYNC_GUILD_ID = os.getenv('AETHER_SYNC_GUILD')
+FORCE_SYNC = os.getenv('AETHER_FORCE_SYNC', '').lower() in ('1', 'true', 'yes')
+
+def command_tree_hash(tree, guild=None):
+    payload = sorted((command.to_dict(tree) for command in tree.get_commands(guild=guild)),
+                     key=lambda command: (command.get('type', 1), command['name']))
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+def read_sync_state(path=SYNC_STATE_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def write_sync_state(state, path=SYNC_STATE_PATH):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+async def sync_commands(force=FORCE_SYNC):
+    """Sync the command tree if it changed since the last sync; returns the number synced, or None if skipped"""
+    guild = discord.Object(int(SYNC_GUILD_ID)) if SYNC_GUILD_ID else None
+    if guild and not bot.tree.get_commands(guild=guild):
+        bot.tree.copy_global_to(guild=guild)
+
+    key = f"{bot.application_id}:{guild.id if guild else 'global'}"
+    digest = command_tree_hash(bot.tree, guild)
+    state = await asyncio.to_thread(read_sync_state)
+    if state.get(key) == digest and not force:
+        return None
+
+    synced = await bot.tree.sync(guild=guild)
+    state[key] = digest
+    await asyncio.to_thread(write_sync_state, state)
+    return len(synced)
+
+async def run_startup():
+    """One-time startup, run from setup_hook after login and before the gateway connects"""
+    startup.mark('logged in')
+    await start_http_server()
+    start_loop_lag_monitor()
+
+    await storage.init()
+    await load_guild_configs()
+    await load_escalation_rules()
+    await reaction_roles.load()
+    startup.mark('storage loaded')
+
+    # Every cluster runs the same tree, so one of them syncing is enough
+    if CLUSTER_ID == 0:
+        try:
+            synced = await sync_commands()
+            if synced is None:
+                print("⚡ Slash commands unchanged, skipped sync")
+            else:
+                print(f"⚡ Synced {synced} slash commands" + (f" to guild {SYNC_GUILD_ID}" if SYNC_GUILD_ID else ""))
+        except Exception as e:
+            print(f"❌ Failed to sync commands: {e}")
+        startup.mark('commands synced')
+
+    # Start background tasks; every cluster shares one database, so only cluster 0 backs it up
+    # and snapshots balances
+    if CLUSTER_ID == 0:
+        snapshot_balances.start()
+        if storage.supports_backups:
+            auto_backup.start()
+    flush_xp.start()
+    flush_enforcement.start()
+    flush_ledger.start()
 
 # Bot events
 @bot.event
 async def on_ready():
-    init_db()
     print(f"🚀 AetherBot is online as {bot.user}")
     print(f"📊 Connected to {len(bot.guilds)} guilds")
 
-    try:
-        synced = await bot.tree.sync()
-        print(f"⚡ Synced {len(synced)} slash commands")
-    except Exception as e:
-        print(f"❌ Failed to sync commands: {e}")
+    # The guild cache is rebuilt on every fresh session, so this runs each time
+    for guild in bot.guilds:
+        presence_counters.reconcile(guild)
 
-    # Start background tasks
-    auto_backup.start()
+    # Saying hello to the hub tells cluster.py this cluster is up, so it waits for ready
+    if IPC_PORT and not cluster_link.connected:
+        try:
+            await cluster_link.connect()
+            print(f"🛰️ Cluster {CLUSTER_ID} joined the hub (shards {SHARD_IDS})")
+        except OSError as e:
+            print(f"❌ Couldn't reach the cluster hub: {e}")
+
+    if 'ready' not in startup.marks:
+        startup.mark('ready')
+        print(startup.report())
+
+@bot.event
+async def on_guild_channel_delete(channel):
+    if announcement_channels.get(channel.guild.id) == channel.id:
+        del announcement_channels[channel.guild.id]
+
+@bot.event
+async def on_guild_remove(guild):
+    announcement_channels.pop(guild.id, None)
+    presence_counters.forget(guild.id)
+    serverinfo_cache.pop(guild.id, None)
+
+@bot.event
+async def on_presence_update(before, after):
+    presence_counters.changed(before, after)
+
+@bot.event
+async def on_member_remove(member):
+    presence_counters.left(member)
 
 @bot.event
 async def on_guild_join(guild):
     """Initialize config when bot joins a guild"""
-    get_guild_config(guild.id)
+    await get_guild_config(guild.id)
+    presence_counters.reconcile(guild)
 
     # Send welcome message to owner
     try:
@@ -192,75 +2758,188 @@ async def on_guild_join(guild):
             color=0x00ff88
         )
         embed.add_field(name="📖 Getting Started", value="Run `/help` to see all commands", inline=False)
-        await guild.owner.send(embed=embed)
+        # Lean mode caches no members, so the owner may need fetching
+        owner = await resolve_member(guild, discord.Object(guild.owner_id))
+        if owner:
+            await owner.send(embed=embed)
     except:
         pass
 
-@bot.event
-async def on_message(message):
-    if message.author.bot or not message.guild:
-        return
+# Automod enforcement
+ENFORCEMENT_INTERVAL = 1  # seconds between bulk deletes and log writes
+NOTICE_WINDOW = 5         # at most one automod notice per channel this often
+NOTICE_MAX_LINES = 10
 
-    config = get_guild_config(message.guild.id)
+class AutomodEnforcer:
+    """Queues automod actions and applies them in bulk.
+
+    Deletions are grouped per channel into delete_messages calls of up to 100 messages,
+    automod_logs rows are written in a single transaction, and everyone warned in the
+    same channel within NOTICE_WINDOW shares one notice.
+    """
+
+    def __init__(self, automod):
+        self.automod = automod
+        self._deletions = {}    # channel_id -> (channel, {message_id: message})
+        self._logs = []
+        self._notices = {}      # channel_id -> (channel, {user_id: line})
+        self._last_notice = {}  # channel_id -> time of the last notice
+        self._lock = asyncio.Lock()
+
+    def delete(self, message):
+        _, pending = self._deletions.setdefault(message.channel.id, (message.channel, {}))
+        pending[message.id] = message
+
+    def log(self, message, action, reason):
+        self._logs.append((str(message.guild.id), str(message.author.id), action, reason))
+        automod_actions.inc(message.guild.id, action, reason.split('/')[0])
+
+    def notify(self, message, line):
+        _, pending = self._notices.setdefault(message.channel.id, (message.channel, {}))
+        pending[message.author.id] = f"{message.author.mention} {line}"
+
+    async def flush(self, notices=True):
+        async with self._lock:
+            deletions, self._deletions = self._deletions, {}
+            logs, self._logs = self._logs, []
 
-    # Automod system
-    if config['automod_enabled']:
-        if is_spam(message) or contains_bad_words(message.content):
             try:
-                await message.delete()
-
-                # Log automod action
-                conn = get_db()
-                c = conn.cursor()
-                c.execute('''INSERT INTO automod_logs (user_id, guild_id, action, reason) 
-                           VALUES (?, ?, ?, ?)''', 
-                         (str(message.author.id), str(message.guild.id), 'message_deleted', 'spam/bad_words'))
-                conn.commit()
-                conn.close()
-
-                # Send warning
-                embed = Embed(
-                    title="⚠️ Message Deleted",
-                    description=f"{message.author.mention}, your message was deleted for violating server rules.",
-                    color=0xff6b6b
-                )
-                await message.channel.send(embed=embed, delete_after=5)
+                for channel, pending in deletions.values():
+                    messages = list(pending.values())
+                    for start in range(0, len(messages), 100):
+                        await self._bulk_delete(channel, messages[start:start + 100])
+            finally:
+                # The audit trail is written even if a deletion blew up
+                if logs:
+                    try:
+                        await self.automod.log(logs)
+                    except Exception:
+                        self._logs[:0] = logs
+                        raise
+
+            if notices:
+                await self._send_notices()
+
+    async def _bulk_delete(self, channel, messages):
+        try:
+            await channel.delete_messages(messages, reason="Automod")
+        except discord.Forbidden:
+            pass
+        except discord.HTTPException:
+            # One already-deleted message fails the whole bulk call; fall back to single deletes
+            for message in messages:
+                try:
+                    await message.delete()
+                except discord.HTTPException:
+                    pass
+
+    async def _send_notices(self):
+        now = time.monotonic()
+        for channel_id in list(self._notices):
+            if now - self._last_notice.get(channel_id, 0) < NOTICE_WINDOW:
+                continue
+
+            channel, pending = self._notices.pop(channel_id)
+            self._last_notice[channel_id] = now
+
+            lines = list(pending.values())
+            description = "\n".join(lines[:NOTICE_MAX_LINES])
+            if len(lines) > NOTICE_MAX_LINES:
+                description += f"\n…and {len(lines) - NOTICE_MAX_LINES} more"
 
-            except discord.Forbidden:
+            embed = Embed(
+                title="⚠️ Auto Moderation",
+                description=description,
+                color=0xff6b6b
+            )
+            try:
+                await channel.send(embed=embed, delete_after=NOTICE_WINDOW)
+            except (discord.Forbidden, discord.NotFound):
                 pass
 
-    # XP System
-    if config['xp_enabled'] and not message.content.startswith('!'):
-        conn = get_db()
-        c = conn.cursor()
-
-        # Get or create user XP
-        c.execute('SELECT * FROM user_xp WHERE user_id = ? AND guild_id = ?', 
-                 (str(message.author.id), str(message.guild.id)))
-        user_data = c.fetchone()
-
-        if not user_data:
-            c.execute('''INSERT INTO user_xp (user_id, guild_id, xp, level, coins) 
-                       VALUES (?, ?, ?, ?, ?)''', 
-                     (str(message.author.id), str(message.guild.id), 0, 1, 100))
-            xp, level = 0, 1
-        else:
-            xp, level = user_data[2], user_data[3]
+        for channel_id, sent_at in list(self._last_notice.items()):
+            if now - sent_at >= NOTICE_WINDOW:
+                del self._last_notice[channel_id]
 
-        # Add XP
-        xp_gain = random.randint(10, 25)
-        xp += xp_gain
+enforcer = AutomodEnforcer(storage.automod)
 
-        # Check for level up
-        xp_needed = level * 150 + 50
-        if xp >= xp_needed:
-            level += 1
-            coins_reward = level * 50
+async def timeout_member(member, seconds, reason):
+    try:
+        await member.timeout(timedelta(seconds=seconds), reason=reason)
+        return True
+    except (discord.Forbidden, discord.NotFound):
+        return False
+
+async def run_automod(message, config):
+    # Flood check runs on every message, even ones that pass the content filters
+    if flood_tracker.hit(message.guild.id, message.channel.id, message.author.id,
+                         config.flood_messages, config.flood_seconds):
+        await punish_flood(message, config)
+        return
+
+    digest = fingerprint(message)
+    if digest is not None:
+        verdict = duplicate_tracker.check(message.guild.id, message.author.id, message.channel.id, digest)
+        if verdict:
+            await punish_duplicate(message, config, verdict)
+            return
+
+    denied_host = await link_scanner.scan(message.guild.id, message.content)
+    if denied_host:
+        enforcer.delete(message)
+        enforcer.log(message, 'message_deleted', f'link/{denied_host}')
+        enforcer.notify(message, f"links to `{denied_host}` aren't allowed here.")
+        return
+
+    if is_spam(message) or await contains_bad_words(message.guild.id, message.content):
+        enforcer.delete(message)
+        enforcer.log(message, 'message_deleted', 'spam/bad_words')
+        enforcer.notify(message, "your message was deleted for violating server rules.")
+
+async def punish_flood(message, config):
+    """Delete flood messages, escalating to a timeout after repeated strikes"""
+    strikes = flood_tracker.strike(message.guild.id, message.author.id)
+
+    enforcer.delete(message)
+    enforcer.log(message, 'message_deleted', 'flood')
+
+    if strikes >= config.flood_strikes:
+        flood_tracker.reset(message.guild.id, message.author.id)
+        if await timeout_member(message.author, config.flood_timeout, "Automod: message flooding"):
+            enforcer.log(message, 'timeout', 'flood')
+            enforcer.notify(message, f"was timed out for {config.flood_timeout // 60} minutes for flooding.")
+    elif strikes == 1:
+        enforcer.notify(message, "you're sending messages too fast.")
+
+async def punish_duplicate(message, config, verdict):
+    """Delete repeated content; the same post across several channels also earns a timeout"""
+    enforcer.delete(message)
+    enforcer.log(message, 'message_deleted', f'duplicate/{verdict}')
+
+    if verdict == 'cross_channel':
+        if await timeout_member(message.author, config.flood_timeout, "Automod: cross-channel spam"):
+            enforcer.log(message, 'timeout', f'duplicate/{verdict}')
+            enforcer.notify(message, "was timed out for posting the same message across channels.")
+    else:
+        enforcer.notify(message, "please don't repeat the same message.")
+
+@bot.event
+async def on_message(message):
+    if message.author.bot or not message.guild:
+        return
+
+    config = await get_guild_config(message.guild.id)
+
+    # Automod system
+    if config.automod_enabled:
+        await run_automod(message, config)
 
-            c.execute('''UPDATE user_xp SET xp = ?, level = ?, coins = coins + ? 
-                       WHERE user_id = ? AND guild_id = ?''', 
-                     (xp, level, coins_reward, str(message.author.id), str(message.guild.id)))
+    # XP System
+    if config.xp_enabled and not message.content.startswith('!'):
+        xp_gain = random.randint(10, 25)
+        leveled_up, xp, level, coins_reward = await xp_buffer.add(message.guild.id, message.author.id, xp_gain)
 
+        if leveled_up:
             # Level up message
             embed = Embed(
                 title="🎉 Level Up!",
@@ -270,35 +2949,56 @@ async def on_message(message):
             embed.add_field(name="💰 Reward", value=f"+{coins_reward} coins", inline=True)
             embed.add_field(name="📊 XP", value=f"{xp}/{(level * 150 + 50)}", inline=True)
             await message.channel.send(embed=embed)
-        else:
-            c.execute('''UPDATE user_xp SET xp = ? WHERE user_id = ? AND guild_id = ?''', 
-                     (xp, str(message.author.id), str(message.guild.id)))
-
-        conn.commit()
-        conn.close()
 
     await bot.process_commands(message)
 
 @bot.event
 async def on_member_join(member):
-    """Welcome new members"""
-    config = get_guild_config(member.guild.id)
+    """Welcome new members, holding back during join raids"""
+    presence_counters.joined(member)
+    config = await get_guild_config(member.guild.id)
+    guild_id = member.guild.id
+
+    if config.automod_enabled:
+        if join_monitor.record(guild_id, config.raid_joins, config.raid_seconds, config.raid_duration):
+            welcome_batcher.cancel(guild_id)
+            await announce_raid(member.guild, config)
+
+        if join_monitor.in_raid(guild_id):
+            account_age = discord.utils.utcnow() - member.created_at
+            if config.raid_min_account_age and account_age < timedelta(days=config.raid_min_account_age):
+                await timeout_member(member, config.raid_timeout, "Automod: new account during raid")
+            return
 
-    if config['welcome_enabled'] and config['welcome_channel']:
-        try:
-            channel = bot.get_channel(int(config['welcome_channel']))
-            if channel:
-                embed = Embed(
-                    title="🎉 Welcome to the server!",
-                    description=f"Hey {member.mention}! Welcome to **{member.guild.name}**",
-                    color=0x00ff88
-                )
-                embed.set_thumbnail(url=member.display_avatar.url)
-                embed.add_field(name="👤 Member Count", value=f"You are member #{member.guild.member_count}", inline=False)
-                embed.set_footer(text=f"Joined • {datetime.now().strftime('%Y-%m-%d %H:%M')}")
-                await channel.send(embed=embed)
-        except:
-            pass
+    welcome_channel_id = parse_channel_id(config.welcome_channel)
+    if config.welcome_enabled and welcome_channel_id:
+        channel = bot.get_channel(welcome_channel_id)
+        if channel:
+            welcome_batcher.add(member, channel)
+
+async def announce_raid(guild, config):
+    channel_id = parse_channel_id(config.automod_channel) or parse_channel_id(config.modlog_channel)
+    channel = bot.get_channel(channel_id) if channel_id else None
+    if not channel:
+        return
+
+    embed = Embed(
+        title="🚨 Raid Mode Enabled",
+        description=(f"**{config.raid_joins}** members joined within **{config.raid_seconds:g}s**.\n"
+                     f"Welcome messages are paused for {config.raid_duration // 60} minutes."),
+        color=0xff6b6b
+    )
+    if config.raid_min_account_age:
+        embed.add_field(
+            name="🔇 New Accounts",
+            value=f"Accounts younger than {config.raid_min_account_age} days are timed out on join.",
+            inline=False
+        )
+    embed.set_footer(text="Use /automod endraid to lift raid mode early")
+    try:
+        await channel.send(embed=embed)
+    except discord.HTTPException:
+        pass
 
 # Advanced Setup Modal
 class SetupModal(Modal, title="🚀 AetherBot Setup"):
@@ -333,11 +3033,19 @@ class SetupModal(Modal, title="🚀 AetherBot Setup"):
             max_length=20
         )
 
+        self.announce_channel = TextInput(
+            label="📢 Announcement Channel ID",
+            placeholder="Enter channel ID for bot announcements...",
+            required=False,
+            max_length=20
+        )
+
         # Add the TextInput components to the modal
         self.add_item(self.logs_channel)
         self.add_item(self.welcome_channel)
         self.add_item(self.modlog_channel)
         self.add_item(self.automod_channel)
+        self.add_item(self.announce_channel)
 
     async def on_submit(self, interaction: Interaction):
         try:
@@ -351,8 +3059,24 @@ class SetupModal(Modal, title="🚀 AetherBot Setup"):
                 update_data['modlog_channel'] = self.modlog_channel.value
             if self.automod_channel.value:
                 update_data['automod_channel'] = self.automod_channel.value
+            if self.announce_channel.value:
+                update_data['announce_channel'] = self.announce_channel.value
+
+            # Nothing is saved unless every id names a channel in this server
+            invalid = [key for key, value in update_data.items()
+                       if interaction.guild.get_channel(parse_channel_id(value.strip()) or 0) is None]
+            if invalid:
+                embed = Embed(
+                    title="❌ Invalid Channel",
+                    description="These aren't channel IDs from this server: "
+                                + ", ".join(key.replace('_', ' ').title() for key in invalid),
+                    color=0xff6b6b
+                )
+                await interaction.response.send_message(embed=embed, ephemeral=True)
+                return
+            update_data = {key: value.strip() for key, value in update_data.items()}
 
-            update_guild_config(interaction.guild.id, **update_data)
+            await update_guild_config(interaction.guild.id, **update_data)
 
             embed = Embed(
                 title="✅ Setup Complete!",
@@ -399,7 +3123,8 @@ async def setup(interaction: Interaction):
     app_commands.Choice(name="Welcome Messages", value="welcome_enabled"),
     app_commands.Choice(name="Auto Moderation", value="automod_enabled"),
     app_commands.Choice(name="Economy System", value="economy_enabled"),
-    app_commands.Choice(name="Music Commands", value="music_enabled")
+    app_commands.Choice(name="Music Commands", value="music_enabled"),
+    app_commands.Choice(name="Presence Counts", value="presence_enabled")
 ])
 async def toggle(interaction: Interaction, feature: app_commands.Choice[str]):
     if not interaction.user.guild_permissions.administrator:
@@ -411,11 +3136,11 @@ async def toggle(interaction: Interaction, feature: app_commands.Choice[str]):
         await interaction.response.send_message(embed=embed, ephemeral=True)
         return
 
-    config = get_guild_config(interaction.guild.id)
-    current_status = config[feature.value]
+    config = await get_guild_config(interaction.guild.id)
+    current_status = getattr(config, feature.value)
     new_status = not current_status
 
-    update_guild_config(interaction.guild.id, **{feature.value: new_status})
+    await update_guild_config(interaction.guild.id, **{feature.value: new_status})
 
     embed = Embed(
         title="🔧 Feature Toggled",
@@ -423,6 +3148,14 @@ async def toggle(interaction: Interaction, feature: app_commands.Choice[str]):
         color=0x00ff88 if new_status else 0xff6b6b
     )
 
+    intent = FEATURE_INTENTS.get(feature.value)
+    if new_status and intent and not getattr(bot.intents, intent):
+        embed.add_field(
+            name="♻️ Restart Needed",
+            value="The bot is running in lean mode without this feature's gateway intent; it takes effect after a restart.",
+            inline=False
+        )
+
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
 # Advanced Help Command with Navigation
@@ -462,6 +3195,8 @@ class HelpView(View):
         embed.add_field(name="/kick", value="Kick a user from the server", inline=False)
         embed.add_field(name="/warn", value="Warn a user for misconduct", inline=False)
         embed.add_field(name="/warnings", value="View user's warning history", inline=False)
+        embed.add_field(name="/unwarn", value="Remove a warning case", inline=False)
+        embed.add_field(name="/escalation", value="Auto timeout, kick or ban repeat offenders", inline=False)
         embed.add_field(name="/purge", value="Delete multiple messages", inline=False)
         await interaction.response.edit_message(embed=embed, view=self)
 
@@ -514,18 +3249,49 @@ async def help_command(interaction: Interaction):
     await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
 
 # User Info Command
+MEMBER_FETCH_TTL = 60  # seconds
+
+fetched_members = LRUCache(1024, 'fetched_members')
+
+async def resolve_member(guild, user):
+    """The member for user, from cache when we have it and fetched on demand otherwise"""
+    if isinstance(user, discord.Member):
+        return user
+
+    member = guild.get_member(user.id)
+    if member:
+        return member
+
+    cached = fetched_members.get((guild.id, user.id))
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+
+    try:
+        member = await guild.fetch_member(user.id)
+    except discord.NotFound:
+        return None
+    except discord.HTTPException as e:
+        # Forbidden, a 5xx or a rate limit; treat the member as unavailable rather than fail the caller
+        print(f"⚠️ Couldn't fetch member {user.id} in {guild.id}: {e}")
+        return None
+    fetched_members.put((guild.id, user.id), (time.monotonic() + MEMBER_FETCH_TTL, member))
+    return member
+
 @bot.tree.command(name="userinfo", description="👤 Get detailed info about a user")
-async def userinfo(interaction: Interaction, user: discord.Member = None):
-    if not user:
-        user = interaction.user
+async def userinfo(interaction: Interaction, user: discord.User = None):
+    member = await resolve_member(interaction.guild, user or interaction.user)
+    if not member:
+        embed = Embed(
+            title="❌ Not a Member",
+            description=f"Couldn't find {(user or interaction.user).mention} in this server.",
+            color=0xff6b6b
+        )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+    user = member
 
     # Get user XP data
-    conn = get_db()
-    c = conn.cursor()
-    c.execute('SELECT * FROM user_xp WHERE user_id = ? AND guild_id = ?', 
-             (str(user.id), str(interaction.guild.id)))
-    xp_data = c.fetchone()
-    conn.close()
+    xp_data = await xp_buffer.get(interaction.guild.id, user.id)
 
     embed = Embed(
         title=f"👤 {user.display_name}",
@@ -540,9 +3306,9 @@ async def userinfo(interaction: Interaction, user: discord.Member = None):
 
     # XP info
     if xp_data:
-        embed.add_field(name="📊 Level", value=xp_data[3], inline=True)
-        embed.add_field(name="⚡ XP", value=xp_data[2], inline=True)
-        embed.add_field(name="💰 Coins", value=xp_data[4], inline=True)
+        embed.add_field(name="📊 Level", value=xp_data.level, inline=True)
+        embed.add_field(name="⚡ XP", value=xp_data.xp, inline=True)
+        embed.add_field(name="💰 Coins", value=xp_data.coins, inline=True)
 
     # Roles
     roles = [role.mention for role in user.roles[1:]]  # Exclude @everyone
@@ -557,13 +3323,8 @@ async def rank(interaction: Interaction, user: discord.Member = None):
     if not user:
         user = interaction.user
 
-    conn = get_db()
-    c = conn.cursor()
-
     # Get user data
-    c.execute('SELECT * FROM user_xp WHERE user_id = ? AND guild_id = ?', 
-             (str(user.id), str(interaction.guild.id)))
-    user_data = c.fetchone()
+    user_data = await xp_buffer.get(interaction.guild.id, user.id)
 
     if not user_data:
         embed = Embed(
@@ -575,16 +3336,11 @@ async def rank(interaction: Interaction, user: discord.Member = None):
         return
 
     # Get rank
-    c.execute('''SELECT COUNT(*) + 1 FROM user_xp 
-               WHERE guild_id = ? AND xp > ?''', 
-             (str(interaction.guild.id), user_data[2]))
-    rank = c.fetchone()[0]
+    rank = (await rank_index.get(interaction.guild.id)).rank_of_xp(user_data.xp)
 
-    conn.close()
-
-    level = user_data[3]
-    xp = user_data[2]
-    coins = user_data[4]
+    level = user_data.level
+    xp = user_data.xp
+    coins = user_data.coins
     next_level_xp = level * 150 + 50
 
     embed = Embed(
@@ -610,119 +3366,202 @@ async def rank(interaction: Interaction, user: discord.Member = None):
 # Daily Coins Command
 @bot.tree.command(name="daily", description="💰 Claim your daily coins")
 async def daily(interaction: Interaction):
-    conn = get_db()
-    c = conn.cursor()
-
-    # Check if user exists
-    c.execute('SELECT * FROM user_xp WHERE user_id = ? AND guild_id = ?', 
-             (str(interaction.user.id), str(interaction.guild.id)))
-    user_data = c.fetchone()
-
-    if not user_data:
-        c.execute('''INSERT INTO user_xp (user_id, guild_id, xp, level, coins, last_daily) 
-                   VALUES (?, ?, ?, ?, ?, ?)''', 
-                 (str(interaction.user.id), str(interaction.guild.id), 0, 1, 100, datetime.now().date()))
-        daily_reward = 100
-    else:
-        last_daily = user_data[5]
-        if last_daily and datetime.strptime(last_daily, '%Y-%m-%d').date() == datetime.now().date():
-            embed = Embed(
-                title="⏰ Already Claimed",
-                description="You've already claimed your daily coins today! Come back tomorrow.",
-                color=0xff6b6b
-            )
-            await interaction.response.send_message(embed=embed, ephemeral=True)
-            conn.close()
-            return
-
-        # Calculate daily reward based on level
-        level = user_data[3]
-        daily_reward = 50 + (level * 10)
+    claimed = await economy.claim_daily(interaction.guild.id, interaction.user.id, datetime.now().date())
 
-        c.execute('''UPDATE user_xp SET coins = coins + ?, last_daily = ? 
-                   WHERE user_id = ? AND guild_id = ?''', 
-                 (daily_reward, datetime.now().date(), str(interaction.user.id), str(interaction.guild.id)))
+    rank_index.setdefault(interaction.guild.id, interaction.user.id, 0)
 
-    conn.commit()
-    conn.close()
+    if claimed is None:
+        embed = Embed(
+            title="⏰ Already Claimed",
+            description="You've already claimed your daily coins today! Come back tomorrow.",
+            color=0xff6b6b
+        )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
 
+    daily_reward, new_balance = claimed
     embed = Embed(
         title="💰 Daily Coins Claimed!",
         description=f"You received **{daily_reward}** coins!",
         color=0x00ff88
     )
+    embed.add_field(name="💰 New Balance", value=f"{new_balance:,} coins", inline=True)
     embed.add_field(name="💡 Tip", value="Higher levels give more daily coins!", inline=False)
     embed.set_footer(text="Come back tomorrow for more coins!")
 
     await interaction.response.send_message(embed=embed)
 
 # Leaderboard Command
-@bot.tree.command(name="leaderboard", description="🏆 View the server leaderboard")
-async def leaderboard(interaction: Interaction):
-    conn = get_db()
-    c = conn.cursor()
-
-    c.execute('''SELECT user_id, xp, level, coins FROM user_xp 
-               WHERE guild_id = ? ORDER BY xp DESC LIMIT 10''', 
-             (str(interaction.guild.id),))
+LEADERBOARD_PAGE_SIZE = 10
 
-    top_users = c.fetchall()
-    conn.close()
+async def build_leaderboard_embed(guild, page):
+    ranking = await rank_index.get(guild.id)
+    pages = max(1, -(-len(ranking) // LEADERBOARD_PAGE_SIZE))
+    page = max(0, min(page, pages - 1))
 
-    if not top_users:
+    if not len(ranking):
         embed = Embed(
             title="📊 Server Leaderboard",
             description="No users with XP found yet!",
             color=0x7289da
         )
-        await interaction.response.send_message(embed=embed)
-        return
+        return embed, page, pages
+
+    offset = page * LEADERBOARD_PAGE_SIZE
+    entries = ranking.page(offset, LEADERBOARD_PAGE_SIZE)
+
+    details = await xp_buffer.get_many(guild.id, [user_id for user_id, _ in entries])
 
     embed = Embed(
         title="🏆 Server Leaderboard",
-        description="Top 10 users by XP",
+        description=f"Users #{offset + 1}-{offset + len(entries)} by XP",
         color=0xffd700
     )
 
-    medals = ["🥇", "🥈", "🥉"] + ["🏅"] * 7
+    medals = ["🥇", "🥈", "🥉"]
 
-    for i, (user_id, xp, level, coins) in enumerate(top_users):
+    for i, (user_id, xp) in enumerate(entries, offset):
         user = bot.get_user(int(user_id))
         name = user.display_name if user else f"User {user_id}"
+        stats = details.get(user_id)
+        level, coins = (stats.level, stats.coins) if stats else (1, 0)
 
         embed.add_field(
-            name=f"{medals[i]} #{i+1} {name}",
+            name=f"{medals[i] if i < len(medals) else '🏅'} #{i+1} {name}",
             value=f"Level {level} • {xp} XP • {coins} 💰",
             inline=False
         )
 
-    await interaction.response.send_message(embed=embed)
+    embed.set_footer(text=f"Page {page + 1}/{pages}")
+    return embed, page, pages
+
+class LeaderboardView(View):
+    def __init__(self, guild, page, pages):
+        super().__init__(timeout=120)
+        self.guild = guild
+        self.page = page
+        self._sync_buttons(pages)
+
+    def _sync_buttons(self, pages):
+        self.prev_page.disabled = self.page <= 0
+        self.next_page.disabled = self.page >= pages - 1
+
+    async def _show(self, interaction: Interaction, page):
+        embed, self.page, pages = await build_leaderboard_embed(self.guild, page)
+        self._sync_buttons(pages)
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    @discord.ui.button(label="◀️ Prev", style=ButtonStyle.secondary)
+    async def prev_page(self, interaction: Interaction, button: Button):
+        await self._show(interaction, self.page - 1)
+
+    @discord.ui.button(label="Next ▶️", style=ButtonStyle.secondary)
+    async def next_page(self, interaction: Interaction, button: Button):
+        await self._show(interaction, self.page + 1)
+
+@bot.tree.command(name="leaderboard", description="🏆 View the server leaderboard")
+@app_commands.describe(page="Page to start on (default: 1)")
+async def leaderboard(interaction: Interaction, page: int = 1):
+    embed, page, pages = await build_leaderboard_embed(interaction.guild, page - 1)
+
+    if pages > 1:
+        await interaction.response.send_message(embed=embed, view=LeaderboardView(interaction.guild, page, pages))
+    else:
+        await interaction.response.send_message(embed=embed)
+
+# Moderation cases
+# Each warning is a case. Escalation rules are held in memory per guild and checked against
+# the user's recent cases every time a new one is opened
+ESCALATION_ACTIONS = ('timeout', 'kick', 'ban')  # least to most severe
+MAX_TIMEOUT_MINUTES = 40320  # Discord caps timeouts at 28 days
+WARNINGS_PAGE_SIZE = 5
+
+@dataclass(frozen=True)
+class EscalationRule:
+    threshold: int
+    window_hours: int
+    action: str
+    duration_minutes: int = 0  # timeouts only
+
+    def describe(self):
+        action = f"timeout for {self.duration_minutes}m" if self.action == 'timeout' else self.action
+        return f"{self.threshold} warnings within {self.window_hours}h → {action}"
+
+escalation_rules = {}  # guild_id -> [EscalationRule], by threshold
+
+def _set_guild_rules(guild_id, rules):
+    if rules:
+        escalation_rules[guild_id] = sorted(rules, key=lambda rule: rule.threshold)
+    else:
+        escalation_rules.pop(guild_id, None)
+
+async def load_escalation_rules():
+    rules = {}
+    for guild_id, *rule in await storage.warnings.escalation_rules():
+        rules.setdefault(guild_id, []).append(EscalationRule(*rule))
+    escalation_rules.clear()
+    for guild_id, guild_rules in rules.items():
+        _set_guild_rules(guild_id, guild_rules)
+
+def match_escalation(rules, recent, now):
+    """The most severe rule whose threshold the recent case timestamps just reached, or None"""
+    matched = []
+    for rule in rules:
+        since = _db_timestamp(now - timedelta(hours=rule.window_hours))
+        # Exactly the threshold, so a rule fires once when it's crossed rather than on every warning after
+        if sum(timestamp >= since for timestamp in recent) == rule.threshold:
+            matched.append(rule)
+    return max(matched, key=lambda rule: (ESCALATION_ACTIONS.index(rule.action), rule.duration_minutes),
+               default=None)
+
+async def apply_escalation(member, rule, case_id):
+    """Carry out a rule; returns a line describing what happened"""
+    reason = f"Auto-escalation: {rule.threshold} warnings within {rule.window_hours}h (case #{case_id})"
+    try:
+        if rule.action == 'timeout':
+            await member.timeout(timedelta(minutes=rule.duration_minutes), reason=reason)
+            return f"⏱️ Timed out for {rule.duration_minutes} minutes"
+        if rule.action == 'kick':
+            await member.kick(reason=reason)
+            return "👢 Kicked"
+        await member.ban(reason=reason, delete_message_seconds=0)
+        return "🔨 Banned"
+    except (discord.Forbidden, discord.NotFound):
+        return f"❌ Couldn't {rule.action} them; check my permissions and role position"
+
+async def open_case(guild, member, moderator, reason):
+    """Record a warning and run any escalation rule it trips; returns (case_id, total, outcome)"""
+    rules = escalation_rules.get(str(guild.id), ())
+    now = datetime.utcnow()
+    since = _db_timestamp(now - timedelta(hours=max(rule.window_hours for rule in rules))) if rules else None
+    case_id, total, recent = await storage.warnings.add(
+        str(guild.id), str(member.id), str(moderator.id), reason, since
+    )
+    rule = match_escalation(rules, recent, now)
+    outcome = await apply_escalation(member, rule, case_id) if rule else None
+    return case_id, total, outcome
 
 # Moderation Commands
+async def _require_moderator(interaction: Interaction):
+    if interaction.user.guild_permissions.moderate_members:
+        return True
+    embed = Embed(
+        title="❌ Permission Denied",
+        description="You need **Moderate Members** permission to use this command.",
+        color=0xff6b6b
+    )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+    return False
+
 @bot.tree.command(name="warn", description="⚠️ Warn a user")
 @app_commands.describe(user="User to warn", reason="Reason for the warning")
 async def warn(interaction: Interaction, user: discord.Member, reason: str = "No reason provided"):
-    if not interaction.user.guild_permissions.moderate_members:
-        embed = Embed(
-            title="❌ Permission Denied",
-            description="You need **Moderate Members** permission to use this command.",
-            color=0xff6b6b
-        )
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+    if not await _require_moderator(interaction):
         return
 
-    conn = get_db()
-    c = conn.cursor()
-    c.execute('''INSERT INTO warnings (user_id, guild_id, moderator_id, reason) 
-               VALUES (?, ?, ?, ?)''', 
-             (str(user.id), str(interaction.guild.id), str(interaction.user.id), reason))
-    conn.commit()
-
-    # Count total warnings
-    c.execute('SELECT COUNT(*) FROM warnings WHERE user_id = ? AND guild_id = ?', 
-             (str(user.id), str(interaction.guild.id)))
-    warning_count = c.fetchone()[0]
-    conn.close()
+    # Escalation may kick or ban, which is slower than the 3 second window for a first response
+    await interaction.response.defer()
+    case_id, warning_count, outcome = await open_case(interaction.guild, user, interaction.user, reason)
 
     embed = Embed(
         title="⚠️ User Warned",
@@ -732,98 +3571,622 @@ async def warn(interaction: Interaction, user: discord.Member, reason: str = "No
     embed.add_field(name="👮 Moderator", value=interaction.user.mention, inline=True)
     embed.add_field(name="📋 Reason", value=reason, inline=True)
     embed.add_field(name="📊 Total Warnings", value=warning_count, inline=True)
+    if outcome:
+        embed.add_field(name="🚨 Escalation", value=outcome, inline=False)
+    embed.set_footer(text=f"Case #{case_id}")
+
+    await interaction.followup.send(embed=embed)
+
+    # Try to DM the user
+    try:
+        dm_embed = Embed(
+            title="⚠️ Warning Received",
+            description=f"You have been warned in **{interaction.guild.name}**",
+            color=0xffa500
+        )
+        dm_embed.add_field(name="📋 Reason", value=reason, inline=False)
+        dm_embed.add_field(name="📊 Total Warnings", value=warning_count, inline=False)
+        await user.send(embed=dm_embed)
+    except discord.Forbidden:
+        pass
+
+async def build_warnings_embed(guild, user, before=None):
+    """Returns (embed, cases, has_more) for the page of cases older than case `before`"""
+    guild_id, user_id = str(guild.id), str(user.id)
+    total, cases = await asyncio.gather(
+        storage.warnings.count(guild_id, user_id),
+        storage.warnings.page(guild_id, user_id, before, WARNINGS_PAGE_SIZE + 1),
+    )
+    has_more = len(cases) > WARNINGS_PAGE_SIZE
+    cases = cases[:WARNINGS_PAGE_SIZE]
+
+    embed = Embed(
+        title=f"📋 Warnings for {user.display_name}",
+        description=f"Total warnings: **{total}**",
+        color=0xffa500
+    )
+    embed.set_thumbnail(url=user.display_avatar.url)
+
+    if not cases:
+        embed.add_field(name="✅ Clean Record", value="No warnings found!", inline=False)
+    for case_id, mod_id, reason, timestamp in cases:
+        moderator = bot.get_user(int(mod_id))
+        mod_name = moderator.display_name if moderator else "Unknown Moderator"
+
+        embed.add_field(
+            name=f"Case #{case_id}",
+            value=f"**Moderator:** {mod_name}\n**Reason:** {reason}\n**Date:** {timestamp[:10]}",
+            inline=False
+        )
+
+    if cases:
+        embed.set_footer(text="Use /unwarn with a case number to remove it")
+    return embed, cases, has_more
+
+class WarningsView(View):
+    """Pages through a user's cases by case id, newest first"""
+
+    def __init__(self, guild, user, cases, has_more):
+        super().__init__(timeout=120)
+        self.guild = guild
+        self.user = user
+        self.cursors = [None]  # the `before` id of every page up to the one showing
+        self._sync_buttons(cases, has_more)
+
+    def _sync_buttons(self, cases, has_more):
+        self.last_id = cases[-1][0] if cases else None
+        self.prev_page.disabled = len(self.cursors) <= 1
+        self.next_page.disabled = not has_more
+
+    async def _show(self, interaction: Interaction):
+        embed, cases, has_more = await build_warnings_embed(self.guild, self.user, self.cursors[-1])
+        self._sync_buttons(cases, has_more)
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    @discord.ui.button(label="◀️ Newer", style=ButtonStyle.secondary)
+    async def prev_page(self, interaction: Interaction, button: Button):
+        if len(self.cursors) > 1:
+            self.cursors.pop()
+        await self._show(interaction)
+
+    @discord.ui.button(label="Older ▶️", style=ButtonStyle.secondary)
+    async def next_page(self, interaction: Interaction, button: Button):
+        if self.last_id is not None:
+            self.cursors.append(self.last_id)
+        await self._show(interaction)
+
+@bot.tree.command(name="warnings", description="📋 View a user's warning history")
+@app_commands.describe(user="User to check warnings for")
+async def warnings(interaction: Interaction, user: discord.Member):
+    if not await _require_moderator(interaction):
+        return
 
+    embed, cases, has_more = await build_warnings_embed(interaction.guild, user)
+    if has_more:
+        await interaction.response.send_message(embed=embed, view=WarningsView(interaction.guild, user, cases, has_more))
+    else:
+        await interaction.response.send_message(embed=embed)
+
+@bot.tree.command(name="unwarn", description="🧹 Remove a warning case")
+@app_commands.describe(case="Case number, as shown by /warnings")
+async def unwarn(interaction: Interaction, case: int):
+    if not await _require_moderator(interaction):
+        return
+
+    user_id = await storage.warnings.remove(str(interaction.guild.id), case)
+    if user_id is None:
+        await interaction.response.send_message(f"❌ There's no case #{case} in this server.", ephemeral=True)
+        return
+
+    remaining = await storage.warnings.count(str(interaction.guild.id), user_id)
+    embed = Embed(
+        title="🧹 Warning Removed",
+        description=f"Case #{case} against <@{user_id}> has been removed.",
+        color=0x00ff88
+    )
+    embed.add_field(name="📊 Remaining Warnings", value=remaining, inline=True)
     await interaction.response.send_message(embed=embed)
 
-    # Try to DM the user
-    try:
-        dm_embed = Embed(
-            title="⚠️ Warning Received",
-            description=f"You have been warned in **{interaction.guild.name}**",
-            color=0xffa500
-        )
-        dm_embed.add_field(name="📋 Reason", value=reason, inline=False)
-        dm_embed.add_field(name="📊 Total Warnings", value=warning_count, inline=False)
-        await user.send(embed=dm_embed)
-    except discord.Forbidden:
-        pass
+# Escalation rule commands
+escalation_group = app_commands.Group(name="escalation", description="🚨 Automatic actions for repeat warnings")
+
+@escalation_group.command(name="set", description="➕ Add or replace the rule for a warning count")
+@app_commands.describe(
+    warnings="Warnings that trigger the rule (2-50)",
+    window_hours="Those warnings must fall within this many hours (1-8760)",
+    action="What to do",
+    timeout_minutes=f"Timeout length in minutes, for timeouts (1-{MAX_TIMEOUT_MINUTES})"
+)
+@app_commands.choices(action=[app_commands.Choice(name=action.title(), value=action) for action in ESCALATION_ACTIONS])
+async def escalation_set(interaction: Interaction,
+                         warnings: app_commands.Range[int, 2, 50],
+                         window_hours: app_commands.Range[int, 1, 8760],
+                         action: str,
+                         timeout_minutes: app_commands.Range[int, 1, MAX_TIMEOUT_MINUTES] = 60):
+    if not await _require_admin(interaction):
+        return
+
+    guild_id = str(interaction.guild.id)
+    rule = EscalationRule(warnings, window_hours, action, timeout_minutes if action == 'timeout' else 0)
+    await storage.warnings.set_escalation_rule(guild_id, rule.threshold, rule.window_hours, rule.action,
+                                               rule.duration_minutes)
+    others = [other for other in escalation_rules.get(guild_id, ()) if other.threshold != rule.threshold]
+    _set_guild_rules(guild_id, others + [rule])
+
+    embed = Embed(
+        title="🚨 Escalation Rule Saved",
+        description=rule.describe(),
+        color=0x00ff88
+    )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@escalation_group.command(name="remove", description="➖ Remove the rule for a warning count")
+@app_commands.describe(warnings="Warning count of the rule to remove")
+async def escalation_remove(interaction: Interaction, warnings: int):
+    if not await _require_admin(interaction):
+        return
+
+    guild_id = str(interaction.guild.id)
+    if not await storage.warnings.remove_escalation_rule(guild_id, warnings):
+        await interaction.response.send_message(f"❌ There's no rule for {warnings} warnings.", ephemeral=True)
+        return
+    _set_guild_rules(guild_id, [rule for rule in escalation_rules.get(guild_id, ()) if rule.threshold != warnings])
+
+    embed = Embed(
+        title="✅ Escalation Rule Removed",
+        description=f"Reaching {warnings} warnings no longer triggers anything.",
+        color=0x00ff88
+    )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@escalation_group.command(name="list", description="📋 Show the escalation rules")
+async def escalation_list(interaction: Interaction):
+    if not await _require_admin(interaction):
+        return
+
+    rules = escalation_rules.get(str(interaction.guild.id), ())
+    embed = Embed(
+        title="🚨 Escalation Rules",
+        description="\n".join(f"• {rule.describe()}" for rule in rules) or "No rules set; warnings never escalate.",
+        color=0x7289da
+    )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+bot.tree.add_command(escalation_group)
+
+# Purge engine
+PURGE_MAX = 50000
+PURGE_SCAN_MAX = 200000           # with filters, stop looking after this many messages
+PURGE_BULK_MAX_AGE = timedelta(days=14, minutes=-5)  # bulk delete rejects anything 14 days or older
+PURGE_SINGLE_RATE = 1             # single deletes per second for older messages, bursting to 5
+PURGE_PROGRESS_INTERVAL = 3       # seconds between progress edits
+PURGE_TEXT_MAX = 200
+
+active_purges = set()  # channel ids with a purge running
+
+@dataclass
+class PurgeFilter:
+    author_id: int = None
+    bots: bool = False
+    text: str = None  # casefolded; plain substring so no pattern can stall the event loop
+    attachments: bool = False
+    links: bool = False
+
+    def active(self):
+        return any(getattr(self, f.name) for f in fields(self))
+
+    def matches(self, message):
+        if self.author_id is not None and message.author.id != self.author_id:
+            return False
+        if self.bots and not message.author.bot:
+            return False
+        if self.attachments and not message.attachments:
+            return False
+        if self.links and not URL_PATTERN.search(message.content):
+            return False
+        if self.text is not None and self.text not in message.content.casefold():
+            return False
+        return True
+
+class PurgeJob:
+    """Deletes up to limit matching messages from a channel, newest first.
+
+    History is streamed page by page and deleted as it goes, so memory stays flat however
+    many messages are involved. Messages young enough are removed 100 at a time with bulk
+    delete; older ones can only go one by one, paced by a token bucket.
+    """
+
+    def __init__(self, channel, purge_filter, limit, after=None, before=None, interaction=None):
+        self.channel = channel
+        self.filter = purge_filter
+        self.limit = limit
+        self.after = after
+        self.before = before
+        self.interaction = interaction
+        self.scanned = 0
+        self.matched = 0
+        self.deleted = 0
+        self.failed = 0
+        self._single_bucket = TokenBucket(rate=PURGE_SINGLE_RATE, capacity=5)
+        self._last_report = time.monotonic()
+
+    async def candidates(self):
+        """Yield matching messages until limit have matched or the scan budget runs out"""
+        scan_limit = PURGE_SCAN_MAX if self.filter.active() else self.limit
+        async for message in self.channel.history(limit=scan_limit, before=self.before, after=self.after,
+                                                  oldest_first=False):
+            self.scanned += 1
+            if self.filter.matches(message):
+                self.matched += 1
+                yield message
+                if self.matched >= self.limit:
+                    return
+
+    async def run(self):
+        bulk_cutoff = discord.utils.utcnow() - PURGE_BULK_MAX_AGE
+        batch = []
+        async for message in self.candidates():
+            if message.created_at > bulk_cutoff:
+                batch.append(message)
+                if len(batch) == 100:
+                    await self._delete_bulk(batch)
+                    batch = []
+            else:
+                # Newest first, so everything from here on is too old for bulk delete
+                if batch:
+                    await self._delete_bulk(batch)
+                    batch = []
+                await self._delete_single(message)
+            await self.report()
+        if batch:
+            await self._delete_bulk(batch)
+        await self.report(done=True)
+
+    async def _delete_bulk(self, messages):
+        try:
+            await self.channel.delete_messages(messages, reason="Purge")
+            self.deleted += len(messages)
+        except discord.Forbidden:
+            raise
+        except discord.HTTPException:
+            # One already-deleted message fails the whole bulk call; fall back to single deletes
+            for message in messages:
+                await self._delete_single(message)
+
+    async def _delete_single(self, message):
+        await self._single_bucket.acquire()
+        try:
+            await message.delete()
+            self.deleted += 1
+        except discord.NotFound:
+            pass
+        except discord.Forbidden:
+            raise
+        except discord.HTTPException:
+            self.failed += 1
+
+    def embed(self, done=False):
+        embed = Embed(
+            title="🗑️ Messages Purged" if done else "🗑️ Purging…",
+            description=(f"🗑️ Deleted: **{self.deleted:,}**\n🔍 Scanned: {self.scanned:,}\n"
+                         f"❌ Failed: {self.failed:,}"),
+            color=0x00ff88 if done else 0x7289da
+        )
+        if done and self.filter.active() and self.matched < self.limit and self.scanned >= PURGE_SCAN_MAX:
+            embed.add_field(name="ℹ️ Stopped early",
+                            value=f"Looked through the newest {PURGE_SCAN_MAX:,} messages.", inline=False)
+        if done and self.interaction is not None:
+            embed.set_footer(text=f"Requested by {self.interaction.user.display_name}")
+        return embed
+
+    async def report(self, done=False):
+        if self.interaction is None:
+            return
+        now = time.monotonic()
+        if not done and now - self._last_report < PURGE_PROGRESS_INTERVAL:
+            return
+        self._last_report = now
+        try:
+            await self.interaction.edit_original_response(embed=self.embed(done))
+        except discord.HTTPException:
+            # The interaction token expires after 15 minutes; keep deleting regardless
+            pass
+
+@bot.tree.command(name="purge", description="🗑️ Delete messages, optionally filtered")
+@app_commands.describe(
+    amount=f"Most messages to delete (1-{PURGE_MAX:,})",
+    user="Only messages from this user",
+    bots="Only messages from bots",
+    contains="Only messages containing this text (not case-sensitive)",
+    attachments="Only messages with attachments",
+    links="Only messages containing links",
+    within_hours="Only messages from the last this many hours",
+    older_than_hours="Only messages older than this many hours"
+)
+async def purge(interaction: Interaction, amount: app_commands.Range[int, 1, PURGE_MAX],
+                user: discord.User = None, bots: bool = False, contains: str = None,
+                attachments: bool = False, links: bool = False,
+                within_hours: app_commands.Range[float, 0.01, 87600.0] = None,
+                older_than_hours: app_commands.Range[float, 0.0, 87600.0] = None):
+    if not interaction.user.guild_permissions.manage_messages:
+        embed = Embed(
+            title="❌ Permission Denied",
+            description="You need **Manage Messages** permission to use this command.",
+            color=0xff6b6b
+        )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+
+    if contains is not None and len(contains) > PURGE_TEXT_MAX:
+        embed = Embed(
+            title="❌ Invalid Filter",
+            description=f"The text to match can be at most {PURGE_TEXT_MAX} characters.",
+            color=0xff6b6b
+        )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+
+    now = discord.utils.utcnow()
+    after = now - timedelta(hours=within_hours) if within_hours is not None else None
+    before = now - timedelta(hours=older_than_hours) if older_than_hours else None
+    if after and before and after >= before:
+        await interaction.response.send_message("❌ That time range is empty.", ephemeral=True)
+        return
+
+    channel = interaction.channel
+    if channel.id in active_purges:
+        await interaction.response.send_message("⏳ A purge is already running in this channel.", ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True)
+
+    purge_filter = PurgeFilter(user.id if user else None, bots,
+                               contains.casefold() if contains else None, attachments, links)
+    job = PurgeJob(channel, purge_filter, amount, after, before, interaction)
+    active_purges.add(channel.id)
+    try:
+        await job.run()
+    except discord.Forbidden:
+        embed = Embed(
+            title="❌ Missing Permissions",
+            description="I need **Read Message History** and **Manage Messages** in this channel.",
+            color=0xff6b6b
+        )
+        await interaction.edit_original_response(embed=embed)
+    finally:
+        active_purges.discard(channel.id)
+
+# Automod blocklist commands
+blocklist_group = app_commands.Group(name="blocklist", description="🚫 Manage the automod word blocklist")
+
+async def _require_admin(interaction: Interaction):
+    if interaction.user.guild_permissions.administrator:
+        return True
+    embed = Embed(
+        title="❌ Permission Denied",
+        description="You need **Administrator** permissions to use this command.",
+        color=0xff6b6b
+    )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+    return False
+
+@blocklist_group.command(name="add", description="➕ Block a word or phrase")
+@app_commands.describe(word="Word or phrase to block")
+async def blocklist_add(interaction: Interaction, word: str):
+    if not await _require_admin(interaction):
+        return
+
+    word = word.strip()
+    if not word:
+        await interaction.response.send_message("❌ The word can't be empty.", ephemeral=True)
+        return
+
+    await blocklists.add(interaction.guild.id, word)
+
+    embed = Embed(
+        title="🚫 Word Blocked",
+        description=f"`{word}` has been added to the blocklist.",
+        color=0x00ff88
+    )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@blocklist_group.command(name="remove", description="➖ Unblock a word or phrase")
+@app_commands.describe(word="Word or phrase to unblock")
+async def blocklist_remove(interaction: Interaction, word: str):
+    if not await _require_admin(interaction):
+        return
+
+    if not await blocklists.remove(interaction.guild.id, word.strip()):
+        await interaction.response.send_message(f"❌ `{word}` is not on the blocklist.", ephemeral=True)
+        return
+
+    embed = Embed(
+        title="✅ Word Unblocked",
+        description=f"`{word}` has been removed from the blocklist.",
+        color=0x00ff88
+    )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@blocklist_group.command(name="list", description="📋 Show the blocked words")
+async def blocklist_list(interaction: Interaction):
+    if not await _require_admin(interaction):
+        return
+
+    words = sorted(await blocklists.words(interaction.guild.id))
+    listing = ", ".join(f"`{word}`" for word in words)
+    if len(listing) > 4000:
+        listing = listing[:4000].rsplit(",", 1)[0] + ", …"
+
+    embed = Embed(
+        title="🚫 Blocked Words",
+        description=listing or "The blocklist is empty.",
+        color=0x7289da
+    )
+    embed.set_footer(text=f"{len(words)} entries")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+bot.tree.add_command(blocklist_group)
+
+# Link list commands
+links_group = app_commands.Group(name="links", description="🔗 Manage allowed and blocked link domains")
+
+def _clean_domain(domain):
+    domain = domain.strip()
+    if domain.startswith('*.'):
+        domain = domain[2:]
+    match = URL_PATTERN.fullmatch(domain)
+    return normalize_host(match.group(1)) if match else None
 
-@bot.tree.command(name="warnings", description="📋 View a user's warning history")
-@app_commands.describe(user="User to check warnings for")
-async def warnings(interaction: Interaction, user: discord.Member):
-    if not interaction.user.guild_permissions.moderate_members:
-        embed = Embed(
-            title="❌ Permission Denied",
-            description="You need **Moderate Members** permission to use this command.",
-            color=0xff6b6b
-        )
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+async def _set_link_rule(interaction: Interaction, domain: str, action: str):
+    if not await _require_admin(interaction):
         return
 
-    conn = get_db()
-    c = conn.cursor()
-    c.execute('''SELECT moderator_id, reason, timestamp FROM warnings 
-               WHERE user_id = ? AND guild_id = ? ORDER BY timestamp DESC LIMIT 10''', 
-             (str(user.id), str(interaction.guild.id)))
+    host = _clean_domain(domain)
+    if not host:
+        await interaction.response.send_message(f"❌ `{domain}` isn't a valid domain.", ephemeral=True)
+        return
 
-    warnings_list = c.fetchall()
-    conn.close()
+    await link_scanner.set(interaction.guild.id, host, action)
 
     embed = Embed(
-        title=f"📋 Warnings for {user.display_name}",
-        description=f"Total warnings: **{len(warnings_list)}**",
-        color=0xffa500
+        title="🔗 Link Rule Saved",
+        description=f"Links to `{host}` and its subdomains are now **{'blocked' if action == 'deny' else 'allowed'}**.",
+        color=0x00ff88
     )
-    embed.set_thumbnail(url=user.display_avatar.url)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
 
-    if not warnings_list:
-        embed.add_field(name="✅ Clean Record", value="No warnings found!", inline=False)
-    else:
-        for i, (mod_id, reason, timestamp) in enumerate(warnings_list[:5], 1):
-            moderator = bot.get_user(int(mod_id))
-            mod_name = moderator.display_name if moderator else f"Unknown Moderator"
-
-            embed.add_field(
-                name=f"Warning #{i}",
-                value=f"**Moderator:** {mod_name}\n**Reason:** {reason}\n**Date:** {timestamp[:10]}",
-                inline=False
-            )
+@links_group.command(name="deny", description="🚫 Block links to a domain and its subdomains")
+@app_commands.describe(domain="Domain to block, e.g. evil.example")
+async def links_deny(interaction: Interaction, domain: str):
+    await _set_link_rule(interaction, domain, 'deny')
 
-    await interaction.response.send_message(embed=embed)
+@links_group.command(name="allow", description="✅ Allow a domain even if a parent domain is blocked")
+@app_commands.describe(domain="Domain to allow, e.g. good.evil.example")
+async def links_allow(interaction: Interaction, domain: str):
+    await _set_link_rule(interaction, domain, 'allow')
 
-@bot.tree.command(name="purge", description="🗑️ Delete multiple messages")
-@app_commands.describe(amount="Number of messages to delete (1-100)")
-async def purge(interaction: Interaction, amount: int):
-    if not interaction.user.guild_permissions.manage_messages:
-        embed = Embed(
-            title="❌ Permission Denied",
-            description="You need **Manage Messages** permission to use this command.",
-            color=0xff6b6b
-        )
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+@links_group.command(name="remove", description="➖ Remove a link rule")
+@app_commands.describe(domain="Domain to remove the rule for")
+async def links_remove(interaction: Interaction, domain: str):
+    if not await _require_admin(interaction):
         return
 
-    if amount < 1 or amount > 100:
-        embed = Embed(
-            title="❌ Invalid Amount",
-            description="Please specify a number between 1 and 100.",
-            color=0xff6b6b
-        )
-        await interaction.response.send_message(embed=embed, ephemeral=True)
+    host = _clean_domain(domain)
+    if not host or not await link_scanner.remove(interaction.guild.id, host):
+        await interaction.response.send_message(f"❌ There's no rule for `{domain}`.", ephemeral=True)
         return
 
-    await interaction.response.defer(ephemeral=True)
+    await interaction.response.send_message(f"✅ Removed the rule for `{host}`.", ephemeral=True)
+
+@links_group.command(name="list", description="📋 Show the link rules")
+async def links_list(interaction: Interaction):
+    if not await _require_admin(interaction):
+        return
+
+    entries = await link_scanner.entries(interaction.guild.id)
+    embed = Embed(title="🔗 Link Rules", color=0x7289da)
+    for action, label in (('deny', '🚫 Blocked'), ('allow', '✅ Allowed')):
+        domains = sorted(domain for domain, rule in entries.items() if rule == action)
+        value = ", ".join(f"`{domain}`" for domain in domains)
+        if len(value) > 1000:
+            value = value[:1000].rsplit(",", 1)[0] + ", …"
+        embed.add_field(name=label, value=value or "None", inline=False)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+bot.tree.add_command(links_group)
+
+automod_group = app_commands.Group(name="automod", description="🤖 Configure auto moderation")
+
+@automod_group.command(name="flood", description="🌊 Configure flood detection")
+@app_commands.describe(
+    messages="Messages allowed within the window (2-50)",
+    seconds="Length of the window in seconds (1-60)",
+    strikes="Flood strikes before a timeout (1-10)",
+    timeout_minutes="Timeout length in minutes (1-1440)"
+)
+async def automod_flood(interaction: Interaction,
+                        messages: app_commands.Range[int, 2, 50] = None,
+                        seconds: app_commands.Range[float, 1, 60] = None,
+                        strikes: app_commands.Range[int, 1, 10] = None,
+                        timeout_minutes: app_commands.Range[int, 1, 1440] = None):
+    if not await _require_admin(interaction):
+        return
+
+    update_data = {}
+    if messages is not None:
+        update_data['flood_messages'] = messages
+    if seconds is not None:
+        update_data['flood_seconds'] = seconds
+    if strikes is not None:
+        update_data['flood_strikes'] = strikes
+    if timeout_minutes is not None:
+        update_data['flood_timeout'] = timeout_minutes * 60
 
-    deleted = await interaction.followup.channel.purge(limit=amount)
+    await update_guild_config(interaction.guild.id, **update_data)
+    config = await get_guild_config(interaction.guild.id)
 
     embed = Embed(
-        title="🗑️ Messages Purged",
-        description=f"Successfully deleted **{len(deleted)}** messages.",
+        title="🌊 Flood Detection",
+        description=(f"**{config.flood_messages}** messages within **{config.flood_seconds:g}s** "
+                     f"counts as flooding.\n**{config.flood_strikes}** strikes earn a "
+                     f"**{config.flood_timeout // 60} minute** timeout."),
         color=0x00ff88
     )
-    embed.set_footer(text=f"Requested by {interaction.user.display_name}")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
 
-    await interaction.followup.send(embed=embed, ephemeral=True)
+@automod_group.command(name="raid", description="🚨 Configure join raid detection")
+@app_commands.describe(
+    joins="Joins that trigger raid mode (3-100)",
+    seconds="Window those joins must land in, in seconds (1-120)",
+    duration_minutes="How long raid mode lasts after the last burst (1-120)",
+    min_account_age_days="During a raid, time out accounts younger than this (0 to disable)"
+)
+async def automod_raid(interaction: Interaction,
+                       joins: app_commands.Range[int, 3, 100] = None,
+                       seconds: app_commands.Range[float, 1, 120] = None,
+                       duration_minutes: app_commands.Range[int, 1, 120] = None,
+                       min_account_age_days: app_commands.Range[int, 0, 365] = None):
+    if not await _require_admin(interaction):
+        return
+
+    update_data = {}
+    if joins is not None:
+        update_data['raid_joins'] = joins
+    if seconds is not None:
+        update_data['raid_seconds'] = seconds
+    if duration_minutes is not None:
+        update_data['raid_duration'] = duration_minutes * 60
+    if min_account_age_days is not None:
+        update_data['raid_min_account_age'] = min_account_age_days
+
+    await update_guild_config(interaction.guild.id, **update_data)
+    config = await get_guild_config(interaction.guild.id)
+
+    embed = Embed(
+        title="🚨 Raid Detection",
+        description=(f"**{config.raid_joins}** joins within **{config.raid_seconds:g}s** enables raid mode "
+                     f"for **{config.raid_duration // 60} minutes**."),
+        color=0x00ff88
+    )
+    embed.add_field(
+        name="🔇 New Accounts",
+        value=(f"Timed out if younger than {config.raid_min_account_age} days"
+               if config.raid_min_account_age else "Not timed out"),
+        inline=False
+    )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@automod_group.command(name="endraid", description="✅ Lift raid mode now")
+async def automod_endraid(interaction: Interaction):
+    if not await _require_admin(interaction):
+        return
+
+    if join_monitor.end_raid(interaction.guild.id):
+        await interaction.response.send_message("✅ Raid mode lifted; welcomes are back on.", ephemeral=True)
+    else:
+        await interaction.response.send_message("ℹ️ This server isn't in raid mode.", ephemeral=True)
+
+bot.tree.add_command(automod_group)
 
 # Economy Commands
 @bot.tree.command(name="balance", description="💰 Check your coin balance")
@@ -831,15 +4194,7 @@ async def balance(interaction: Interaction, user: discord.Member = None):
     if not user:
         user = interaction.user
 
-    conn = get_db()
-    c = conn.cursor()
-    c.execute('SELECT coins FROM user_xp WHERE user_id = ? AND guild_id = ?', 
-             (str(user.id), str(interaction.guild.id)))
-
-    result = c.fetchone()
-    conn.close()
-
-    coins = result[0] if result else 0
+    coins = await economy.balance(interaction.guild.id, user.id)
 
     embed = Embed(
         title=f"💰 {user.display_name}'s Balance",
@@ -865,22 +4220,6 @@ async def gamble(interaction: Interaction, amount: int):
         await interaction.response.send_message(embed=embed, ephemeral=True)
         return
 
-    conn = get_db()
-    c = conn.cursor()
-    c.execute('SELECT coins FROM user_xp WHERE user_id = ? AND guild_id = ?', 
-             (str(interaction.user.id), str(interaction.guild.id)))
-
-    result = c.fetchone()
-    if not result or result[0] < amount:
-        embed = Embed(
-            title="❌ Insufficient Funds",
-            description="You don't have enough coins to gamble that amount!",
-            color=0xff6b6b
-        )
-        await interaction.response.send_message(embed=embed, ephemeral=True)
-        conn.close()
-        return
-
     # Gambling logic
     roll = random.randint(1, 100)
 
@@ -901,14 +4240,16 @@ async def gamble(interaction: Interaction, amount: int):
         multiplier = 5
         result_coins = amount * 4
 
-    # Update coins
-    c.execute('''UPDATE user_xp SET coins = coins + ? 
-               WHERE user_id = ? AND guild_id = ?''', 
-             (result_coins, str(interaction.user.id), str(interaction.guild.id)))
+    new_balance = await economy.settle_bet(interaction.guild.id, interaction.user.id, amount, result_coins)
 
-    new_balance = result[0] + result_coins
-    conn.commit()
-    conn.close()
+    if new_balance is None:
+        embed = Embed(
+            title="❌ Insufficient Funds",
+            description="You don't have enough coins to gamble that amount!",
+            color=0xff6b6b
+        )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
 
     # Create response embed
     if outcome == "lose":
@@ -949,16 +4290,29 @@ async def gamble(interaction: Interaction, amount: int):
 async def serverinfo(interaction: Interaction):
     guild = interaction.guild
 
+    cached = serverinfo_cache.get(guild.id)
+    if cached and cached[0] > time.monotonic():
+        await interaction.response.send_message(embed=cached[1])
+        return
+
     # Count different channel types
     text_channels = len(guild.text_channels)
     voice_channels = len(guild.voice_channels)
     categories = len(guild.categories)
 
     # Count members by status
-    online = sum(1 for m in guild.members if m.status == discord.Status.online)
-    idle = sum(1 for m in guild.members if m.status == discord.Status.idle)
-    dnd = sum(1 for m in guild.members if m.status == discord.Status.dnd)
-    offline = len(guild.members) - online - idle - dnd
+    config = await get_guild_config(guild.id)
+    if not config.presence_enabled:
+        members = f"**{guild.member_count}** total"
+    elif bot.intents.presences:
+        counts = presence_counters.get(guild)
+        members = (f"**{guild.member_count}** total\n🟢 {counts['online']} online\n🟡 {counts['idle']} idle\n"
+                   f"🔴 {counts['dnd']} dnd\n⚫ {counts['offline']} offline")
+    else:
+        # Lean mode without presences: Discord's approximate counts cost one REST call per cache period
+        counted = await bot.fetch_guild(guild.id, with_counts=True)
+        members = (f"**{counted.approximate_member_count}** total\n"
+                   f"🟢 ~{counted.approximate_presence_count} online")
 
     embed = Embed(
         title=f"ℹ️ {guild.name}",
@@ -969,13 +4323,13 @@ async def serverinfo(interaction: Interaction):
     if guild.icon:
         embed.set_thumbnail(url=guild.icon.url)
 
-    embed.add_field(name="👑 Owner", value=guild.owner.mention, inline=True)
+    embed.add_field(name="👑 Owner", value=f"<@{guild.owner_id}>", inline=True)
     embed.add_field(name="🆔 Server ID", value=guild.id, inline=True)
     embed.add_field(name="📅 Created", value=guild.created_at.strftime("%Y-%m-%d"), inline=True)
 
     embed.add_field(
         name="👥 Members",
-        value=f"**{guild.member_count}** total\n🟢 {online} online\n🟡 {idle} idle\n🔴 {dnd} dnd\n⚫ {offline} offline",
+        value=members,
         inline=True
     )
 
@@ -990,6 +4344,7 @@ async def serverinfo(interaction: Interaction):
     embed.add_field(name="⚡ Boost Level", value=guild.premium_tier, inline=True)
     embed.add_field(name="💎 Boosts", value=guild.premium_subscription_count, inline=True)
 
+    serverinfo_cache[guild.id] = (time.monotonic() + SERVERINFO_CACHE_SECONDS, embed)
     await interaction.response.send_message(embed=embed)
 
 # Fun Commands
@@ -1055,17 +4410,52 @@ async def roll(interaction: Interaction, sides: int = 6):
 async def auto_backup():
     """Daily backup of database"""
     try:
-        import shutil
-        shutil.copy2('aether.db', f'backup_aether_{datetime.now().strftime("%Y%m%d")}.db')
-        print("🔄 Database backup completed")
+        name = await create_backup()
+        print(f"🔄 Database backup completed: {name}")
     except Exception as e:
         print(f"❌ Backup failed: {e}")
 
+@tasks.loop(seconds=XP_FLUSH_INTERVAL)
+async def flush_xp():
+    """Persist buffered XP"""
+    try:
+        await xp_buffer.flush()
+    except Exception as e:
+        print(f"❌ XP flush failed: {e}")
+
+@tasks.loop(seconds=ENFORCEMENT_INTERVAL)
+async def flush_enforcement():
+    """Apply queued automod deletions, logs and notices"""
+    try:
+        await enforcer.flush()
+    except Exception as e:
+        print(f"❌ Automod flush failed: {e}")
+
+@tasks.loop(seconds=ECONOMY_LEDGER_INTERVAL)
+async def flush_ledger():
+    """Persist queued economy ledger rows"""
+    try:
+        await economy.flush()
+    except Exception as e:
+        print(f"❌ Ledger flush failed: {e}")
+
+@tasks.loop(hours=ECONOMY_SNAPSHOT_INTERVAL)
+async def snapshot_balances():
+    """Periodic copy of every balance, to check the ledger against"""
+    try:
+        await economy.snapshot()
+    except Exception as e:
+        print(f"❌ Balance snapshot failed: {e}")
+
 @auto_backup.before_loop
 async def before_backup():
     await bot.wait_until_ready()
 
 # Error handling
+@bot.event
+async def on_app_command_completion(interaction: Interaction, command):
+    observe_command(interaction, 'ok')
+
 @bot.event
 async def on_command_error(ctx, error):
     if isinstance(error, commands.CommandNotFound):
@@ -1099,6 +4489,150 @@ async def on_app_command_error(interaction: Interaction, error: app_commands.App
             await interaction.followup.send(embed=embed, ephemeral=True)
 
 # Special owner commands
+BROADCAST_CONCURRENCY = 8
+BROADCAST_PROGRESS_INTERVAL = 2  # seconds between progress edits
+
+class TokenBucket:
+    """Allows rate events per second with bursts of up to capacity"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+class KeyedTokenBuckets:
+    """One TokenBucket per route key, dropped again once they have refilled"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._buckets = {}
+
+    async def acquire(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+        await bucket.acquire()
+
+        now = time.monotonic()
+        idle = self.capacity / self.rate
+        for stale in [k for k, b in self._buckets.items() if now - b._updated > idle]:
+            del self._buckets[stale]
+
+# Discord allows 50 requests/s globally and 5 messages per 5s per channel; the global
+# limit is per bot, so clusters split it between them
+global_send_bucket = TokenBucket(rate=45 / CLUSTER_COUNT, capacity=45 / CLUSTER_COUNT)
+channel_send_buckets = KeyedTokenBuckets(rate=1, capacity=5)
+broadcast_slots = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+
+# guild_id -> channel_id picked for announcements when the guild hasn't configured one
+announcement_channels = {}
+
+def _can_send(guild, channel):
+    return channel is not None and channel.permissions_for(guild.me).send_messages
+
+async def resolve_announcement_channel(guild):
+    config = await get_guild_config(guild.id)
+    channel_id = parse_channel_id(config.announce_channel)
+    if channel_id:
+        channel = guild.get_channel(channel_id)
+        if _can_send(guild, channel):
+            return channel
+
+    channel_id = announcement_channels.get(guild.id)
+    if channel_id:
+        channel = guild.get_channel(channel_id)
+        if _can_send(guild, channel):
+            return channel
+
+    # Only scanned once per guild; the result is cached until it stops working
+    channel = guild.system_channel if _can_send(guild, guild.system_channel) else None
+    if channel is None:
+        channel = next((ch for ch in guild.text_channels if _can_send(guild, ch)), None)
+    if channel is not None:
+        announcement_channels[guild.id] = channel.id
+    return channel
+
+class BroadcastProgress:
+    def __init__(self, interaction, total):
+        self.interaction = interaction
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self._last_edit = 0
+
+    async def update(self, force=False, done=False):
+        if self.interaction is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_edit < BROADCAST_PROGRESS_INTERVAL:
+            return
+        self._last_edit = now
+
+        embed = Embed(
+            title="📊 Broadcast Results" if done else "📢 Broadcasting…",
+            description=(f"✅ Sent to {self.sent} servers\n❌ Failed: {self.failed} servers\n"
+                         f"⏳ Remaining: {self.total - self.sent - self.failed}"),
+            color=0x00ff88 if done else 0x7289da
+        )
+        try:
+            await self.interaction.edit_original_response(embed=embed)
+        except discord.HTTPException:
+            pass
+
+def broadcast_embed(message):
+    embed = Embed(
+        title="📢 Broadcast from AetherBot",
+        description=message,
+        color=0x7289da
+    )
+    embed.set_footer(text="This is a broadcast message from the bot owner")
+    return embed
+
+async def deliver_broadcast(message, progress):
+    """Send the broadcast to every guild this cluster serves"""
+    embed = broadcast_embed(message)
+
+    async def deliver(guild):
+        async with broadcast_slots:
+            channel = await resolve_announcement_channel(guild)
+            if not channel:
+                progress.failed += 1
+                return
+            try:
+                await global_send_bucket.acquire()
+                await channel_send_buckets.acquire(channel.id)
+                await channel.send(embed=embed)
+                progress.sent += 1
+            except discord.HTTPException:
+                # The cached choice may have gone stale (deleted channel, lost permissions)
+                announcement_channels.pop(guild.id, None)
+                progress.failed += 1
+        await progress.update()
+
+    await asyncio.gather(*(deliver(guild) for guild in list(bot.guilds)))
+
+def broadcast_timeout(guilds):
+    """Seconds a cluster serving this many guilds may need to deliver a broadcast, with headroom"""
+    return IPC_TIMEOUT + 1.25 * guilds / global_send_bucket.rate
+
+@cluster_link.handler('broadcast')
+async def broadcast_from_cluster(message):
+    progress = BroadcastProgress(None, len(bot.guilds))
+    await deliver_broadcast(message, progress)
+    return {'total': progress.total, 'sent': progress.sent, 'failed': progress.failed}
+
 @bot.tree.command(name="broadcast", description="📢 Send a message to all servers (Owner only)")
 @app_commands.describe(message="Message to broadcast")
 async def broadcast(interaction: Interaction, message: str):
@@ -1106,39 +4640,396 @@ async def broadcast(interaction: Interaction, message: str):
         await interaction.response.send_message("❌ Owner only command.", ephemeral=True)
         return
 
-    sent = 0
-    failed = 0
+    await interaction.response.defer(ephemeral=True)
+
+    # Progress covers this cluster; the others report their totals when they finish
+    progress = BroadcastProgress(interaction, len(bot.guilds))
+    await progress.update(force=True)
+
+    # Each cluster sends at its share of the global rate limit, so the busiest one sets how
+    # long to wait for totals; a fixed timeout would report large clusters missing mid-send
+    replies, _ = await cluster_link.request('stats')
+    largest = max([len(bot.guilds)] + [reply['data']['guilds'] for reply in replies if reply['data']])
+
+    _, (replies, missing) = await asyncio.gather(
+        deliver_broadcast(message, progress),
+        cluster_link.request('broadcast', timeout=broadcast_timeout(largest), message=message)
+    )
+    for reply in replies:
+        if reply['data']:
+            progress.total += reply['data']['total']
+            progress.sent += reply['data']['sent']
+            progress.failed += reply['data']['failed']
+        else:
+            missing.append(reply['cluster'])
+    await progress.update(force=True, done=True)
+
+    if missing:
+        await interaction.followup.send(
+            f"⚠️ No totals from cluster(s) {', '.join(map(str, sorted(missing)))}", ephemeral=True)
+
+def cluster_stats():
+    if isinstance(bot, commands.AutoShardedBot):
+        latencies = {shard_id: latency for shard_id, latency in bot.latencies}
+    else:
+        latencies = {0: bot.latency}
+    return {
+        'cluster': CLUSTER_ID,
+        'guilds': len(bot.guilds),
+        'members': sum(guild.member_count or 0 for guild in bot.guilds),
+        'shards': {str(shard_id): round(latency * 1000) if latency == latency else None
+                   for shard_id, latency in latencies.items()},
+    }
+
+@cluster_link.handler('stats')
+async def stats_from_cluster():
+    return cluster_stats()
+
+@bot.tree.command(name="botstats", description="📡 Guilds, members and shard latency across every cluster (Owner only)")
+async def botstats(interaction: Interaction):
+    if interaction.user.id != OWNER_ID:
+        await interaction.response.send_message("❌ Owner only command.", ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True)
+    replies, missing = await cluster_link.request('stats')
+    clusters = [cluster_stats()] + [reply['data'] for reply in replies if reply['data']]
+    missing += [reply['cluster'] for reply in replies if not reply['data']]
+    clusters.sort(key=lambda stats: stats['cluster'])
+
+    embed = Embed(title="📡 Bot Stats", color=0x7289da)
+    embed.add_field(name="🏠 Servers", value=sum(stats['guilds'] for stats in clusters), inline=True)
+    embed.add_field(name="👥 Members", value=sum(stats['members'] for stats in clusters), inline=True)
+    embed.add_field(name="🧩 Shards", value=sum(len(stats['shards']) for stats in clusters), inline=True)
+    for stats in clusters:
+        shards = ', '.join(f"#{shard_id}: {latency}ms" if latency is not None else f"#{shard_id}: —"
+                           for shard_id, latency in stats['shards'].items())
+        embed.add_field(
+            name=f"🛰️ Cluster {stats['cluster']}",
+            value=f"{stats['guilds']} servers • {stats['members']} members\n{shards}",
+            inline=False
+        )
+    if missing:
+        embed.add_field(name="⚠️ No answer", value=', '.join(f"Cluster {c}" for c in sorted(missing)), inline=False)
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="backup", description="💾 Back up the database now (Owner only)")
+@app_commands.describe(compress="Gzip the backup (default: on)")
+async def backup(interaction: Interaction, compress: bool = BACKUP_COMPRESS):
+    if interaction.user.id != OWNER_ID:
+        await interaction.response.send_message("❌ Owner only command.", ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True)
+    try:
+        name = await create_backup(compress)
+    except Exception as e:
+        await interaction.followup.send(f"❌ Backup failed: {e}", ephemeral=True)
+        return
 
+    size = os.path.getsize(os.path.join(BACKUP_DIR, name))
     embed = Embed(
-        title="📢 Broadcast from AetherBot",
-        description=message,
-        color=0x7289da
+        title="💾 Backup Complete",
+        description=f"`{name}` ({size / 1024:,.1f} KiB), integrity verified.",
+        color=0x00ff88
     )
-    embed.set_footer(text="This is a broadcast message from the bot owner")
+    embed.set_footer(text=f"Keeping the newest {BACKUP_RETENTION} backups")
+    await interaction.followup.send(embed=embed, ephemeral=True)
 
-    for guild in bot.guilds:
-        try:
-            # Find a suitable channel to send to
-            channel = None
-            for ch in guild.text_channels:
-                if ch.permissions_for(guild.me).send_messages:
-                    channel = ch
-                    break
-
-            if channel:
-                await channel.send(embed=embed)
-                sent += 1
-            else:
-                failed += 1
-        except:
-            failed += 1
+@bot.tree.command(name="restore", description="♻️ Restore the database from a backup (Owner only)")
+@app_commands.describe(backup="Backup file to restore")
+async def restore(interaction: Interaction, backup: str):
+    if interaction.user.id != OWNER_ID:
+        await interaction.response.send_message("❌ Owner only command.", ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True)
+    try:
+        stale_clusters = await restore_backup(backup)
+    except FileNotFoundError:
+        await interaction.followup.send(f"❌ No backup named `{backup}`.", ephemeral=True)
+        return
+    except Exception as e:
+        await interaction.followup.send(f"❌ Restore failed: {e}", ephemeral=True)
+        return
+
+    embed = Embed(
+        title="♻️ Restore Complete",
+        description=f"The database was restored from `{backup}` and all caches were reloaded.",
+        color=0x00ff88
+    )
+    if stale_clusters:
+        embed.color = 0xffa500
+        embed.add_field(
+            name="⚠️ Not Reloaded",
+            value=(f"Cluster(s) {', '.join(map(str, stale_clusters))} didn't confirm; restart them so they "
+                   "don't write stale data over the restore."),
+            inline=False
+        )
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+@cluster_link.handler('reset_caches')
+async def reset_caches_from_cluster():
+    await reset_caches()
+    return {'cluster': CLUSTER_ID}
+
+@restore.autocomplete('backup')
+async def restore_autocomplete(interaction: Interaction, current: str):
+    names = await asyncio.to_thread(list_backups)
+    return [app_commands.Choice(name=name, value=name) for name in names if current in name][:25]
+
+# Reaction roles
+# Raw reaction events carry the message id and emoji, so with every panel held in memory
+# a reaction is resolved without touching the database or needing the message in cache
+def emoji_key(emoji):
+    """Custom emojis by id, so renaming one doesn't break its panels; unicode emojis as themselves"""
+    return str(emoji.id) if emoji.id else emoji.name
+
+class ReactionRoleIndex:
+    """message_id -> {emoji key: role_id} for every panel, loaded once and kept in step on every write"""
+
+    def __init__(self, repository):
+        self.repository = repository
+        self._panels = {}  # message_id -> (guild_id, {emoji key: role_id})
+
+    async def load(self):
+        self._panels.clear()
+        for guild_id, message_id, emoji, role_id in await self.repository.load_all():
+            _, roles = self._panels.setdefault(int(message_id), (int(guild_id), {}))
+            roles[emoji] = int(role_id)
+
+    def role_for(self, message_id, emoji):
+        panel = self._panels.get(message_id)
+        return panel[1].get(emoji_key(emoji)) if panel else None
+
+    def roles_on(self, message_id):
+        panel = self._panels.get(message_id)
+        return dict(panel[1]) if panel else {}
+
+    def for_guild(self, guild_id):
+        return {message_id: dict(roles) for message_id, (panel_guild, roles) in self._panels.items()
+                if panel_guild == guild_id}
+
+    async def add(self, guild_id, message_id, emoji, role_id):
+        key = emoji_key(emoji)
+        await self.repository.add(str(guild_id), str(message_id), key, str(role_id))
+        _, roles = self._panels.setdefault(message_id, (guild_id, {}))
+        roles[key] = role_id
+
+    async def remove(self, guild_id, message_id, emoji):
+        key = emoji_key(emoji)
+        removed = await self.repository.remove(str(guild_id), str(message_id), key)
+        panel = self._panels.get(message_id)
+        if panel:
+            panel[1].pop(key, None)
+            if not panel[1]:
+                del self._panels[message_id]
+        return removed
+
+    async def forget_message(self, message_id):
+        panel = self._panels.pop(message_id, None)
+        if panel:
+            await self.repository.remove_message(str(panel[0]), str(message_id))
+
+reaction_roles = ReactionRoleIndex(storage.reaction_roles)
+
+@bot.event
+async def on_raw_reaction_add(payload):
+    role_id = reaction_roles.role_for(payload.message_id, payload.emoji)
+    if role_id is None or payload.member is None or payload.member.bot:
+        return
+    try:
+        await payload.member.add_roles(discord.Object(role_id), reason="Reaction role")
+    except discord.HTTPException:
+        pass
+
+@bot.event
+async def on_raw_reaction_remove(payload):
+    role_id = reaction_roles.role_for(payload.message_id, payload.emoji)
+    if role_id is None or payload.user_id == bot.user.id:
+        return
+    guild = bot.get_guild(payload.guild_id)
+    if guild is None:
+        return
+    # Removal events carry no member, and lean mode may not cache them
+    member = await resolve_member(guild, discord.Object(payload.user_id))
+    if member is None or member.bot:
+        return
+    try:
+        await member.remove_roles(discord.Object(role_id), reason="Reaction role")
+    except discord.HTTPException:
+        pass
+
+@bot.event
+async def on_raw_message_delete(payload):
+    await reaction_roles.forget_message(payload.message_id)
+
+@bot.event
+async def on_raw_bulk_message_delete(payload):
+    for message_id in payload.message_ids:
+        await reaction_roles.forget_message(message_id)
+
+def _role_lines(roles):
+    lines = []
+    for key, role_id in roles.items():
+        emoji = bot.get_emoji(int(key)) if key.isdigit() else key
+        lines.append(f"{emoji or '❔'} → <@&{role_id}>")
+    return "\n".join(lines)[:1024]
+
+def panel_embed(title, description, roles):
+    embed = Embed(title=f"🎭 {title}", description=description, color=0x7289da)
+    if roles:
+        embed.add_field(name="Roles", value=_role_lines(roles), inline=False)
+    embed.set_footer(text="React to get a role; remove the reaction to drop it")
+    return embed
+
+async def refresh_panel(channel, message_id):
+    """Re-list the roles on a panel the bot posted; other messages are left alone"""
+    try:
+        message = await channel.fetch_message(message_id)
+    except discord.HTTPException:
+        return
+    if message.author.id != bot.user.id or not message.embeds:
+        return
+    old = message.embeds[0]
+    title = (old.title or "Reaction Roles").removeprefix("🎭 ")
+    embed = panel_embed(title, old.description, reaction_roles.roles_on(message_id))
+    try:
+        await message.edit(embed=embed)
+    except discord.HTTPException:
+        pass
+
+def _role_problem(interaction: Interaction, role: discord.Role):
+    """Why this role can't be handed out by reaction, or None"""
+    if role.is_default() or role.managed:
+        return "That role is managed by Discord or an integration and can't be assigned."
+    if role >= interaction.guild.me.top_role:
+        return "That role is above my highest role, so I can't assign it."
+    if interaction.user.id != interaction.guild.owner_id and role >= interaction.user.top_role:
+        return "You can only hand out roles below your own highest role."
+    return None
+
+def _parse_message_id(text):
+    # Accept a bare id or a message link
+    tail = text.strip().rstrip('/').rsplit('/', 1)[-1]
+    return int(tail) if tail.isdigit() else None
+
+reactionrole_group = app_commands.Group(name="reactionrole", description="🎭 Roles members pick by reacting")
+
+@reactionrole_group.command(name="panel", description="📌 Post a new reaction-role panel")
+@app_commands.describe(title="Panel title", description="Text shown on the panel", channel="Where to post it")
+async def reactionrole_panel(interaction: Interaction, title: str, description: str = "Pick your roles below!",
+                             channel: discord.TextChannel = None):
+    if not await _require_admin(interaction):
+        return
+
+    channel = channel or interaction.channel
+    # A rate-limited send can outlast the 3 seconds an interaction has to be answered
+    await interaction.response.defer(ephemeral=True)
+    try:
+        message = await channel.send(embed=panel_embed(title, description, {}))
+    except discord.HTTPException as e:
+        embed = Embed(
+            title="❌ Couldn't Post Panel",
+            description=(f"I don't have permission to post in {channel.mention}."
+                         if isinstance(e, discord.Forbidden) else f"Discord rejected the message: {e.text or e.status}"),
+            color=0xff6b6b
+        )
+        await interaction.followup.send(embed=embed, ephemeral=True)
+        return
+
+    embed = Embed(
+        title="📌 Panel Posted",
+        description=f"[Jump to the panel]({message.jump_url})\n\nAdd roles with `/reactionrole add` "
+                    f"and message `{message.id}`.",
+        color=0x00ff88
+    )
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+@reactionrole_group.command(name="add", description="➕ Give a role for reacting with an emoji")
+@app_commands.describe(message="Message id or link", emoji="Emoji to react with", role="Role to give",
+                       channel="Channel the message is in (default: this one)")
+async def reactionrole_add(interaction: Interaction, message: str, emoji: str, role: discord.Role,
+                           channel: discord.TextChannel = None):
+    if not await _require_admin(interaction):
+        return
+
+    message_id = _parse_message_id(message)
+    if message_id is None:
+        await interaction.response.send_message("❌ That isn't a message id or link.", ephemeral=True)
+        return
+    problem = _role_problem(interaction, role)
+    if problem:
+        await interaction.response.send_message(f"❌ {problem}", ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True)
+    channel = channel or interaction.channel
+    partial = discord.PartialEmoji.from_str(emoji.strip())
+    try:
+        # Reacting first checks both the message and the emoji before anything is stored
+        await channel.get_partial_message(message_id).add_reaction(partial)
+    except discord.HTTPException:
+        await interaction.followup.send(f"❌ Couldn't react with {emoji} on message `{message_id}` in "
+                                        f"{channel.mention}; check the message and the emoji.", ephemeral=True)
+        return
+
+    await reaction_roles.add(interaction.guild.id, message_id, partial, role.id)
+    await refresh_panel(channel, message_id)
+
+    embed = Embed(
+        title="🎭 Reaction Role Added",
+        description=f"Reacting with {partial} on message `{message_id}` now gives {role.mention}.",
+        color=0x00ff88
+    )
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+@reactionrole_group.command(name="remove", description="➖ Stop giving a role for an emoji")
+@app_commands.describe(message="Message id or link", emoji="Emoji of the reaction role",
+                       channel="Channel the message is in (default: this one)")
+async def reactionrole_remove(interaction: Interaction, message: str, emoji: str,
+                              channel: discord.TextChannel = None):
+    if not await _require_admin(interaction):
+        return
+
+    message_id = _parse_message_id(message)
+    partial = discord.PartialEmoji.from_str(emoji.strip())
+    if message_id is None or not await reaction_roles.remove(interaction.guild.id, message_id, partial):
+        await interaction.response.send_message(f"❌ Message `{message}` has no reaction role for {emoji}.",
+                                                ephemeral=True)
+        return
 
-    result_embed = Embed(
-        title="📊 Broadcast Results",
-        description=f"✅ Sent to {sent} servers\n❌ Failed: {failed} servers",
+    await interaction.response.defer(ephemeral=True)
+    channel = channel or interaction.channel
+    try:
+        await channel.get_partial_message(message_id).remove_reaction(partial, interaction.guild.me)
+    except discord.HTTPException:
+        pass
+    await refresh_panel(channel, message_id)
+
+    embed = Embed(
+        title="✅ Reaction Role Removed",
+        description=f"{partial} on message `{message_id}` no longer gives a role.",
         color=0x00ff88
     )
-    await interaction.response.send_message(embed=result_embed, ephemeral=True)
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+@reactionrole_group.command(name="list", description="📋 Show this server's reaction roles")
+async def reactionrole_list(interaction: Interaction):
+    if not await _require_admin(interaction):
+        return
+
+    panels = reaction_roles.for_guild(interaction.guild.id)
+    embed = Embed(
+        title="🎭 Reaction Roles",
+        description=None if panels else "No reaction roles yet. Start with `/reactionrole panel`.",
+        color=0x7289da
+    )
+    for message_id, roles in list(panels.items())[:25]:
+        embed.add_field(name=f"Message {message_id}", value=_role_lines(roles), inline=False)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+bot.tree.add_command(reactionrole_group)
 
 # Music placeholder commands (structure for future implementation)
 @bot.tree.command(name="play", description="🎵 Play music (Coming Soon!)")
@@ -1169,6 +5060,8 @@ async def autorole(interaction: Interaction):
     )
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
+startup.mark('imported')
+
 # Start the bot
 if __name__ == "__main__":
     print("🚀 Starting AetherBot...")
@@ -1180,11 +5073,10 @@ if __name__ == "__main__":
     print("   • Interactive Help System")
     print("   • Fun Commands & Games")
     print("   • Server Management Tools")
+    print("   • Reaction Role Panels")
     print("   • Owner-only Admin Commands")
     print("=" * 50)
 
-    keep_alive()
-
     try:
         bot.run(os.getenv("DISCORD_TOKEN"))
     except Exception as e: